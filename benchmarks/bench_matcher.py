@@ -0,0 +1,76 @@
+"""
+Matcher benchmark
+
+Measures how many release names per second the *Matcher* processes and which fraction of them it
+matches to an episode. Run it with 'python -m benchmarks.bench_matcher'.
+
+Usage:
+  bench_matcher [options]
+
+Options:
+  -h --help             Show this screen.
+  -c --corpus=<file>    Load release names from a file, one per line, instead of generating them.
+  -n --names=<number>   Number of release names to generate [default: 50000].
+  -r --repeat=<number>  Number of times to run over the corpus, the best run is reported
+                        [default: 5].
+  -o --output=<file>    Also write the results, as JSON, to a file.
+"""
+import json
+import time
+from pathlib import Path
+
+from docopt import docopt
+
+from benchmarks import corpus
+from tveebot_organizer.matcher import Matcher
+
+
+def run(names, matcher: Matcher) -> int:
+    """ Matches every name in *names* and returns how many of them matched an episode """
+    matched = 0
+    for name in names:
+        try:
+            matcher.match(name)
+            matched += 1
+        except ValueError:
+            pass
+    return matched
+
+
+def main():
+    args = docopt(__doc__)
+
+    if args['--corpus']:
+        names = corpus.load(Path(args['--corpus']))
+    else:
+        names = corpus.generate(int(args['--names']))
+
+    matcher = Matcher()
+    timings = []
+    matched = 0
+    for _ in range(int(args['--repeat'])):
+        start = time.perf_counter()
+        matched = run(names, matcher)
+        timings.append(time.perf_counter() - start)
+
+    best = min(timings)
+    results = {
+        'benchmark': 'matcher',
+        'names': len(names),
+        'matched': matched,
+        'match_rate': matched / len(names) if names else 0.0,
+        'best_seconds': best,
+        'names_per_second': len(names) / best if best else 0.0,
+    }
+
+    print(f"names:      {results['names']}")
+    print(f"match rate: {results['match_rate']:.2%}")
+    print(f"throughput: {results['names_per_second']:,.0f} names/sec")
+
+    if args['--output']:
+        with open(args['--output'], 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+End-to-end organize benchmark
+
+Generates synthetic watch directories and measures how fast they are organized, both by calling
+*Organizer.organize()* directly and through the full *Watcher* pipeline. Reports episodes per
+second and the latency percentiles of each organize stage: filter, match, store, and cleanup.
+Run it with 'python -m benchmarks.bench_organize'.
+
+The same-device scenarios keep the watch and library directories in the same filesystem. The
+cross-device scenarios put the library in another device, by default '/dev/shm', and are skipped
+if that directory is in the same device as the watch directory.
+
+Usage:
+  bench_organize [options]
+
+Options:
+  -h --help                 Show this screen.
+  -n --entries=<number>     Number of watch directory entries [default: 1000].
+  -s --size=<bytes>         Size of each episode file [default: 4194304].
+  -j --workers=<number>     Number of workers used by the watcher [default: 4].
+  -d --dir=<directory>      Directory where the watch and library directories are created.
+  -x --cross-dir=<dir>      Directory in another device used for the library [default: /dev/shm].
+  -o --output=<file>        Write the results, as JSON, to a file [default: bench_organize.json].
+"""
+import json
+import logging
+import platform
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+from docopt import docopt
+
+from benchmarks import watch_dir
+from tveebot_organizer.filter import Filter
+from tveebot_organizer.library_index import LibraryIndex
+from tveebot_organizer.matcher import Matcher
+from tveebot_organizer.organizer import Organizer
+from tveebot_organizer.storage_manager import StorageManager
+from tveebot_organizer.watcher import Watcher
+
+STAGES = ('filter', 'match', 'store', 'cleanup')
+
+
+class StageTimer:
+    """ Collects the duration of each call of each stage """
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self._lock = threading.Lock()
+
+    def wrap(self, stage: str, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.durations[stage].append(time.perf_counter() - start)
+        return timed
+
+    def percentiles(self) -> Dict[str, Dict[str, float]]:
+        """ Returns the count and latency percentiles, in milliseconds, of each stage """
+        return {stage: summarize(durations) for stage, durations in self.durations.items()}
+
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    if not durations:
+        return {'count': 0}
+
+    ordered = sorted(durations)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        'count': len(ordered),
+        'p50_ms': percentile(0.50),
+        'p90_ms': percentile(0.90),
+        'p99_ms': percentile(0.99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+class CountingOrganizer(Organizer):
+    """ Organizer which times each stage and signals when a number of paths was organized """
+
+    def __init__(self, library_dir: Path, timer: StageTimer, expected: int):
+        index = LibraryIndex(library_dir)
+        super().__init__(Filter(), Matcher(), StorageManager(library_dir, index))
+        self.filter.find_episode_files = timer.wrap('filter', self.filter.find_episode_files)
+        self.matcher.match = timer.wrap('match', self.matcher.match)
+        self.storage_manager.store = timer.wrap('store', self.storage_manager.store)
+        self._clear = timer.wrap('cleanup', self._clear)
+
+        self._expected = expected
+        self._organized = 0
+        self._lock = threading.Lock()
+        self.done = threading.Event()
+
+    def organize(self, path: Path):
+        try:
+            super().organize(path)
+        finally:
+            with self._lock:
+                self._organized += 1
+                if self._organized >= self._expected:
+                    self.done.set()
+
+
+@contextmanager
+def directories(base_dir: Path, library_base_dir: Path):
+    """ Creates temporary watch, staging, and library directories and removes them afterwards """
+    work_dir = Path(tempfile.mkdtemp(prefix="bench-organize-", dir=str(base_dir)))
+    library_dir = Path(tempfile.mkdtemp(prefix="bench-library-", dir=str(library_base_dir)))
+    try:
+        (work_dir / "watch").mkdir()
+        (work_dir / "staging").mkdir()
+        yield work_dir / "watch", work_dir / "staging", library_dir
+    finally:
+        shutil.rmtree(str(work_dir), ignore_errors=True)
+        shutil.rmtree(str(library_dir), ignore_errors=True)
+
+
+def bench_organizer(args, base_dir: Path, library_base_dir: Path) -> dict:
+    """ Calls the organizer directly for each entry of a pre-generated watch directory """
+    entries = int(args['--entries'])
+    with directories(base_dir, library_base_dir) as (watch, _, library_dir):
+        paths = watch_dir.generate(watch, entries, int(args['--size']))
+
+        timer = StageTimer()
+        organizer = CountingOrganizer(library_dir, timer, entries)
+
+        start = time.perf_counter()
+        for path in paths:
+            organizer.organize(path)
+        elapsed = time.perf_counter() - start
+
+    return result(entries, elapsed, timer)
+
+
+def bench_watcher(args, base_dir: Path, library_base_dir: Path) -> dict:
+    """
+    Runs the watcher and moves pre-generated entries into the watch directory, like a torrent
+    client does once a download completes. Measures the time until every entry was organized.
+    """
+    entries = int(args['--entries'])
+    with directories(base_dir, library_base_dir) as (watch, staging, library_dir):
+        paths = watch_dir.generate(staging, entries, int(args['--size']))
+
+        timer = StageTimer()
+        organizer = CountingOrganizer(library_dir, timer, entries)
+        watcher = Watcher(watch, organizer, workers=int(args['--workers']))
+        watcher_thread = threading.Thread(target=watcher.run_forever)
+        watcher_thread.start()
+        time.sleep(0.5)
+
+        try:
+            start = time.perf_counter()
+            for path in paths:
+                path.rename(watch / path.name)
+
+            if not organizer.done.wait(timeout=600):
+                raise RuntimeError("timed out waiting for the watcher to organize all entries")
+            elapsed = time.perf_counter() - start
+        finally:
+            watcher.shutdown()
+            watcher_thread.join()
+
+    return result(entries, elapsed, timer)
+
+
+def result(entries: int, elapsed: float, timer: StageTimer) -> dict:
+    stages = timer.percentiles()
+    return {
+        'entries': entries,
+        'episodes': stages['store']['count'],
+        'seconds': elapsed,
+        'episodes_per_second': stages['store']['count'] / elapsed if elapsed else 0.0,
+        'stages': stages,
+    }
+
+
+def main():
+    args = docopt(__doc__)
+
+    # Ignored entries are logged as warnings, which would flood the output
+    logging.basicConfig(level=logging.ERROR)
+
+    base_dir = Path(args['--dir'] or tempfile.gettempdir())
+    cross_dir = Path(args['--cross-dir'])
+
+    layouts = {'same-device': base_dir}
+    if cross_dir.is_dir() and not watch_dir.same_device(base_dir, cross_dir):
+        layouts['cross-device'] = cross_dir
+    else:
+        print(f"skipping cross-device scenarios: '{cross_dir}' is not in another device")
+
+    scenarios = {}
+    for layout, library_base_dir in layouts.items():
+        for mode, bench in (('organizer', bench_organizer), ('watcher', bench_watcher)):
+            name = f"{mode}/{layout}"
+            scenarios[name] = bench(args, base_dir, library_base_dir)
+            print(f"{name:25} {scenarios[name]['episodes_per_second']:10,.1f} episodes/sec")
+            for stage, stats in scenarios[name]['stages'].items():
+                if stats['count']:
+                    print(f"  {stage:10} p50={stats['p50_ms']:8.3f}ms  "
+                          f"p99={stats['p99_ms']:8.3f}ms  max={stats['max_ms']:8.3f}ms")
+
+    results = {
+        'benchmark': 'organize',
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'parameters': {
+            'entries': int(args['--entries']),
+            'size': int(args['--size']),
+            'workers': int(args['--workers']),
+        },
+        'scenarios': scenarios,
+    }
+
+    with open(args['--output'], 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Daemon startup benchmark
+
+Measures how long the daemon takes to start, each time in a new process, since supervisors
+restart it often. Reports the best, median, and worst time of each scenario:
+
+- interpreter: starting Python alone, the floor of every other scenario;
+- help and version: showing the help and the version;
+- config-error: reporting a missing watch directory;
+- ready: starting with an empty library until the watcher logs it is ready;
+- first-event: starting until an episode created right after the watcher is ready is stored.
+
+Run it with 'python -m benchmarks.bench_startup'.
+
+Usage:
+  bench_startup [options]
+
+Options:
+  -h --help             Show this screen.
+  -r --runs=<number>    Number of runs of each scenario [default: 10].
+  -o --output=<file>    Write the results, as JSON, to a file [default: bench_startup.json].
+"""
+import json
+import platform
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from docopt import docopt
+
+# The daemon is run from the repository, without installing it
+REPOSITORY_DIR = Path(__file__).resolve().parents[1]
+
+DAEMON = [sys.executable, '-m', 'tveebot_organizer.daemon']
+
+# Maximum time, in seconds, the daemon may take to get ready
+TIMEOUT = 60
+
+
+def timed_run(command: List[str]) -> float:
+    """ Runs *command* to completion and returns how long it took, in seconds """
+    start = time.perf_counter()
+    subprocess.run(command, cwd=str(REPOSITORY_DIR), stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def timed_start(first_event: bool) -> float:
+    """
+    Starts the daemon with empty watch and library directories and returns the time until it is
+    ready, or until it stored the first episode created once it is ready.
+    """
+    work_dir = Path(tempfile.mkdtemp(prefix="bench-startup-"))
+    try:
+        (work_dir / "watch").mkdir()
+        (work_dir / "library").mkdir()
+        config_file = work_dir / "config.ini"
+        config_file.write_text("[watcher]\nsettle_time = 0\n")
+
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            DAEMON + ['--watch', str(work_dir / "watch"), '--library', str(work_dir / "library"),
+                      '--conf', str(config_file)],
+            cwd=str(REPOSITORY_DIR), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            universal_newlines=True)
+
+        timer = threading.Timer(TIMEOUT, process.kill)
+        timer.start()
+        try:
+            for line in process.stderr:
+                if " - ready: " in line:
+                    break
+            else:
+                raise RuntimeError("daemon exited before getting ready")
+
+            if first_event:
+                (work_dir / "watch" / "Castle.S08E22.mkv").write_text("")
+                stored = work_dir / "library" / "Castle" / "Season 08" / "Castle.S08E22.mkv"
+                while not stored.exists():
+                    if process.poll() is not None:
+                        raise RuntimeError("daemon exited before storing the episode")
+                    time.sleep(0.001)
+
+            elapsed = time.perf_counter() - start
+        finally:
+            timer.cancel()
+            process.send_signal(signal.SIGINT)
+            # Keep reading the logs, so that the daemon never blocks writing them
+            process.communicate(timeout=TIMEOUT)
+
+        return elapsed
+    finally:
+        shutil.rmtree(str(work_dir), ignore_errors=True)
+
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    ordered = sorted(durations)
+    return {
+        'runs': len(ordered),
+        'min_ms': ordered[0] * 1000,
+        'median_ms': ordered[len(ordered) // 2] * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def main():
+    args = docopt(__doc__)
+    runs = int(args['--runs'])
+
+    # Only the watch directory is missing, the library is given to get past the other checks
+    config_error = DAEMON + ['--library', tempfile.gettempdir()]
+
+    benchmarks: Dict[str, Callable[[], float]] = {
+        'interpreter': lambda: timed_run([sys.executable, '-c', 'pass']),
+        'help': lambda: timed_run(DAEMON + ['--help']),
+        'version': lambda: timed_run(DAEMON + ['--version']),
+        'config-error': lambda: timed_run(config_error),
+        'ready': lambda: timed_start(first_event=False),
+        'first-event': lambda: timed_start(first_event=True),
+    }
+
+    scenarios = {}
+    for name, bench in benchmarks.items():
+        scenarios[name] = summarize([bench() for _ in range(runs)])
+        print(f"{name:15} min={scenarios[name]['min_ms']:8.1f}ms  "
+              f"median={scenarios[name]['median_ms']:8.1f}ms  "
+              f"max={scenarios[name]['max_ms']:8.1f}ms")
+
+    results = {
+        'benchmark': 'startup',
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'parameters': {
+            'runs': runs,
+        },
+        'scenarios': scenarios,
+    }
+
+    with open(args['--output'], 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Generates synthetic release names resembling the ones published by torrent sites.
+
+The names combine a set of tv show names with every episode format supported by the *Matcher*,
+using different separators, qualities, sources, codecs, and release groups. A fraction of the
+names do not correspond to episodes (movies, samples, and music), so that the match rate of the
+matcher can be measured as well.
+"""
+import random
+from pathlib import Path
+from typing import List
+
+TVSHOWS = [
+    "Prison Break", "Castle 2009", "The Big Bang Theory", "Game of Thrones", "Its Always Sunny",
+    "Marvels Agents of S H I E L D", "The Daily Show", "Better Call Saul", "Doctor Who 2005",
+    "Law and Order SVU", "The X Files", "Grey's Anatomy", "Brooklyn Nine-Nine", "Mr Robot",
+    "Last Week Tonight with John Oliver", "Star Trek Discovery", "The Walking Dead", "Fargo",
+    "House of Cards 2013", "The Late Show with Stephen Colbert", "Westworld", "Sherlock",
+    "American Horror Story", "Rick and Morty", "Stranger Things", "The Office US", "Lost",
+]
+
+QUALITIES = ["", "720p", "1080p", "2160p", "480p"]
+SOURCES = ["", "HDTV", "WEB", "WEB-DL", "WEBRip", "BluRay", "AMZN.WEB-DL", "NF.WEBRip"]
+CODECS = ["", "x264", "x265", "H.264", "HEVC", "XviD", "DD5.1.H.264"]
+GROUPS = ["KILLERS", "KRS", "LOL", "DIMENSION", "ntb", "SVA", "AVS", "TBS", "MiNX", "FLEET"]
+TAGS = ["", "", "", "PROPER", "REPACK", "INTERNAL", "[rarbg]", "[eztv]"]
+
+NON_EPISODES = [
+    "{show}.2016.1080p.BluRay.x264-{group}",
+    "{show}.Complete.Series.720p",
+    "sample-{group}",
+    "{group}.Greatest.Hits.2014.FLAC",
+    "{show}.Extras.Behind.The.Scenes",
+]
+
+
+def episode_token(rng: random.Random) -> str:
+    season = rng.randint(1, 30)
+    number = rng.randint(1, 24)
+    kind = rng.random()
+    if kind < 0.65:
+        return f"S{season:02d}E{number:02d}"
+    elif kind < 0.75:
+        return f"S{season:02d}E{number:02d}E{number + 1:02d}"
+    elif kind < 0.85:
+        return f"{season}x{number:02d}"
+    else:
+        return f"{rng.randint(1995, 2025)}.{rng.randint(1, 12):02d}.{rng.randint(1, 28):02d}"
+
+
+def release_name(rng: random.Random, episode_ratio: float = 0.9) -> str:
+    """ Generates a single release name """
+    show = rng.choice(TVSHOWS)
+    group = rng.choice(GROUPS)
+
+    if rng.random() >= episode_ratio:
+        return rng.choice(NON_EPISODES).format(show=show.replace(" ", "."), group=group)
+
+    words = show.split(" ") + [episode_token(rng)]
+    words += [word for word in (rng.choice(TAGS), rng.choice(QUALITIES), rng.choice(SOURCES),
+                                rng.choice(CODECS)) if word]
+    separator = rng.choice([".", ".", ".", " ", "_", "-"])
+    return separator.join(words) + f"-{group}"
+
+
+def generate(count: int, seed: int = 0, episode_ratio: float = 0.9) -> List[str]:
+    """ Generates *count* release names. The same *seed* always generates the same names """
+    rng = random.Random(seed)
+    return [release_name(rng, episode_ratio) for _ in range(count)]
+
+
+def load(path: Path) -> List[str]:
+    """ Loads a corpus file with one release name per line, ignoring blank lines """
+    with open(path, encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip()]
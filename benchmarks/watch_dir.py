@@ -0,0 +1,85 @@
+"""
+Generates synthetic watch directories resembling the downloads directory of a torrent client.
+
+Each entry of the watch directory is either a single video file or a release directory. Release
+directories include the episode file along with the usual siblings: an .nfo file, .rar parts,
+subtitles, and a sample directory. Video files are sparse, which means large files can be
+generated quickly and without using disk space, as long as they stay in the same device.
+"""
+import os
+import random
+from pathlib import Path
+from typing import List
+
+from benchmarks.corpus import TVSHOWS
+
+# Formats used to name the episodes, all of them supported by the *Matcher*
+EPISODE_FORMATS = [
+    "{show}.S{season:02d}E{number:02d}.720p.HDTV.x264-KILLERS",
+    "{show}.S{season:02d}E{number:02d}.1080p.WEB-DL.DD5.1.H.264-NTb[rarbg]",
+    "{show}.{season}x{number:02d}.HDTV.XviD-LOL",
+    "{show} S{season:02d}E{number:02d} 720p WEB x265-MiNX",
+]
+
+
+def episode_name(index: int, rng: random.Random) -> str:
+    """ Generates the name of the *index*-th episode. Different indexes never share an episode """
+    show = TVSHOWS[index % len(TVSHOWS)].replace(" ", ".")
+    season = index // (len(TVSHOWS) * 24) + 1
+    number = (index // len(TVSHOWS)) % 24 + 1
+    return rng.choice(EPISODE_FORMATS).format(show=show, season=season, number=number)
+
+
+def sparse_file(path: Path, size: int):
+    """ Creates a file with *size* bytes without writing any data """
+    with open(path, 'wb') as file:
+        file.truncate(size)
+
+
+def generate(directory: Path, count: int, video_size: int, rar_parts: int = 20,
+             dir_ratio: float = 0.7, ignored_ratio: float = 0.05, seed: int = 0) -> List[Path]:
+    """
+    Generates *count* entries inside *directory* and returns their paths.
+
+    :param directory:     directory where the entries are generated, it must exist
+    :param count:         number of entries to generate
+    :param video_size:    size, in bytes, of each episode file
+    :param rar_parts:     number of .rar parts included in each release directory
+    :param dir_ratio:     fraction of the entries which are release directories
+    :param ignored_ratio: fraction of the entries without any video file
+    :param seed:          the same seed always generates the same entries
+    """
+    rng = random.Random(seed)
+    entries = []
+    for index in range(count):
+        name = episode_name(index, rng)
+        kind = rng.random()
+
+        if kind < ignored_ratio:
+            path = directory / f"{name}.nfo"
+            path.write_text("not a video")
+
+        elif kind < ignored_ratio + dir_ratio:
+            path = directory / name
+            path.mkdir()
+            sparse_file(path / f"{name}.mkv", video_size)
+            (path / f"{name}.nfo").write_text("release information")
+            (path / f"{name}.srt").write_text("1\n00:00:01,000 --> 00:00:02,000\nsubtitle\n")
+            for part in range(rar_parts):
+                (path / f"{name}.r{part:02d}").write_bytes(b"rar")
+            sample_dir = path / "Sample"
+            sample_dir.mkdir()
+            sparse_file(sample_dir / f"sample-{name}.mkv", video_size // 100)
+
+        else:
+            path = directory / f"{name}.mkv"
+            sparse_file(path, video_size)
+
+        entries.append(path)
+
+    return entries
+
+
+def same_device(path: Path, other_path: Path) -> bool:
+    """ Determines whether *path* and *other_path* are in the same device """
+    return os.stat(path).st_dev == os.stat(other_path).st_dev
@@ -9,7 +9,7 @@ setup(
     author='david',
     author_email='fialho.david@protonmail.com',
 
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
 
     package_data={
         'tveebot_organizer': ['config.ini'],
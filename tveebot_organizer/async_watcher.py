@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from watchdog.observers import Observer
+
+from tveebot_organizer.organizer import Organizer
+from tveebot_organizer.settler import signature
+from tveebot_organizer.snapshot_observer import SnapshotObserver
+from tveebot_organizer.watcher import Watcher
+
+logger = logging.getLogger('watching')
+
+
+class AsyncWatcher:
+    """
+    The AsyncWatcher is the asyncio counterpart of the *Watcher*. It watches a directory for new
+    files or directories and calls the organizer for each one of them.
+
+    Filesystem events are delivered by watchdog in its own thread and bridged onto the event loop.
+    Each new path is then handled by its own task, which is cheap, so hundreds of paths may arrive
+    at once. The blocking work, organizing a path and checking whether it settled, runs in a
+    thread pool, with a limit on the number of paths organized concurrently.
+
+    Shutting down cancels the paths waiting to be organized, but waits for the paths already being
+    organized.
+
+    As the *Watcher*, it may watch other directories, added as routes with their own organizer.
+    """
+
+    def __init__(self, watch_dir: Path, organizer: Organizer, concurrency: int = 1,
+                 settle_time: float = 0, poll_interval: float = None,
+                 scan_interval: float = 0):
+        """
+        Initializes the watching, but does not start it!
+
+        :param watch_dir:     the directory to watch for new files or directories
+        :param organizer:     the organizer called to organize each new file or directory
+        :param concurrency:   number of paths which may be organized concurrently
+        :param settle_time:   time, in seconds, a new path must stay unchanged before it is
+                              organized, 0 means new paths are organized right away
+        :param poll_interval: time, in seconds, between checks of whether a path settled
+        :param scan_interval: time, in seconds, between scans of the watch directory, for
+                              filesystems which do not notify changes, 0 means changes are
+                              notified by the filesystem
+        :raise ValueError:    if *concurrency* is smaller than 1
+        """
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+
+        if poll_interval is None:
+            poll_interval = min(max(settle_time / 4, 0.05), 1.0)
+
+        self.watch_dir = watch_dir
+        self.organizer = organizer
+        self.concurrency = concurrency
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.scan_interval = scan_interval
+
+        # Maps each watch directory to the organizer of the paths created in it
+        self._routes: Dict[Path, Organizer] = {watch_dir: organizer}
+
+        self._observer: Optional[Observer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._stopped: Optional[asyncio.Event] = None
+
+        # Maps each path waiting or being organized to the last time it changed
+        self._pending: Dict[Path, float] = {}
+
+        # Maps each path waiting or being organized to the task handling it
+        self._tasks: Dict[Path, asyncio.Task] = {}
+
+        # Paths being organized
+        self._in_flight: Set[Path] = set()
+
+        # The paths waiting or being organized are owned by the event loop, but are counted from
+        # other threads, such as the metrics exporters, so they are changed holding this lock
+        self._paths_lock = threading.Lock()
+
+    @property
+    def settling(self) -> bool:
+        """ Indicates whether new paths are held back until they settle """
+        return self.settle_time > 0
+
+    @property
+    def queue_depth(self) -> int:
+        """ Number of paths waiting to be organized. It may be called from any thread. """
+        with self._paths_lock:
+            return len(self._pending) - len(self._in_flight)
+
+    @property
+    def settling_paths(self) -> int:
+        """ Number of paths waiting to settle. It may be called from any thread. """
+        return self.queue_depth if self.settling else 0
+
+    @property
+    def routes(self) -> Dict[Path, Organizer]:
+        """ Maps each watch directory to the organizer of the paths created in it """
+        return dict(self._routes)
+
+    def organize(self, path: Path) -> bool:
+        """
+        Submits *path* to be organized right away, without waiting for it to settle. It may be
+        called from any thread. Paths outside of the watch directories are organized by the
+        organizer of the watch directory.
+
+        :return: True if *path* was submitted and False if the watcher is not running.
+        """
+        loop = self._loop
+        if loop is None:
+            return False
+
+        try:
+            loop.call_soon_threadsafe(self._schedule, path, False)
+        except RuntimeError:
+            # The loop was closed meanwhile
+            return False
+        return True
+
+    def add_route(self, watch_dir: Path, organizer: Organizer):
+        """
+        Watches another directory, sharing the observer and the concurrency limit with the other
+        watch directories. Paths created in *watch_dir* are organized by *organizer*.
+
+        :raise ValueError: if *watch_dir* is already watched
+        :raise OSError:    if the watcher is running and *watch_dir* can not be watched
+        """
+        if watch_dir in self._routes:
+            raise ValueError(f"directory is already watched: {watch_dir}")
+
+        self._routes[watch_dir] = organizer
+        if self._observer is not None:
+            try:
+                self._schedule_watch(self._observer, watch_dir)
+                names = os.listdir(watch_dir)
+            except BaseException:
+                del self._routes[watch_dir]
+                raise
+
+            for name in names:
+                self._new_path(watch_dir / name)
+
+    async def run(self):
+        """
+        Runs the watching until *shutdown()* is called or the task running it is cancelled.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency + 1,
+                                            thread_name_prefix="organize-worker")
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._stopped = asyncio.Event()
+
+        observer = SnapshotObserver(self.scan_interval) if self.scan_interval > 0 else Observer()
+        try:
+            for watch_dir in list(self._routes):
+                self._schedule_watch(observer, watch_dir)
+            observer.start()
+            self._observer = observer
+
+            # Watching starts before listing the watch directories, so nothing is missed
+            for watch_dir in list(self._routes):
+                entries = await self._loop.run_in_executor(self._executor, os.listdir, watch_dir)
+                for name in entries:
+                    self._new_path(watch_dir / name)
+
+            logger.info(f"ready: watching {len(self._routes)} directories")
+            await self._stopped.wait()
+        finally:
+            try:
+                self._observer = None
+                observer.stop()
+                await self._loop.run_in_executor(None, observer.join)
+                await self._drain()
+                self._executor.shutdown(wait=True)
+            finally:
+                # Paths submitted from now on are not organized, see *organize()*
+                self._loop = None
+
+    def shutdown(self):
+        """ Tells *run()* to stop. It may be called from any thread """
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def _schedule_watch(self, observer: Observer, watch_dir: Path):
+        observer.schedule(Watcher.Handler(self, watch_dir), str(watch_dir),
+                          recursive=self.settling)
+
+    def _new_path(self, path: Path):
+        """
+        Called with each new path in the watch directory. It may be called from any thread, since
+        watchdog calls it from its own thread.
+        """
+        if self._loop is None:
+            return
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self._loop:
+            self._schedule(path)
+        else:
+            self._loop.call_soon_threadsafe(self._schedule, path)
+
+    def _schedule(self, path: Path, settle: bool = True):
+        if self._stopped.is_set():
+            return
+
+        now = time.monotonic()
+        if path in self._pending:
+            # Already waiting to be organized: only a change in its content matters
+            if path not in self._in_flight:
+                self._pending[path] = now
+            return
+
+        with self._paths_lock:
+            self._pending[path] = now
+        self._tasks[path] = self._loop.create_task(self._handle(path, settle))
+
+    async def _handle(self, path: Path, settle: bool = True):
+        try:
+            if settle and self.settling and not await self._settle(path):
+                return
+
+            async with self._semaphore:
+                with self._paths_lock:
+                    self._in_flight.add(path)
+                try:
+                    organizer = self._routes.get(path.parent, self.organizer)
+                    await self._loop.run_in_executor(self._executor, organizer.organize, path)
+                except Exception:
+                    logger.exception(f"failed to organize '{path}'")
+        finally:
+            with self._paths_lock:
+                self._in_flight.discard(path)
+                self._pending.pop(path, None)
+            self._tasks.pop(path, None)
+
+    async def _settle(self, path: Path) -> bool:
+        """
+        Waits until *path* stays unchanged for the settle time.
+
+        :return: True if *path* settled and False if it was removed meanwhile.
+        """
+        last_signature = None
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = await self._loop.run_in_executor(self._executor, signature, path)
+            now = time.monotonic()
+
+            if current is None:
+                logger.debug(f"'{path.name}' was removed before settling")
+                return False
+
+            if current != last_signature:
+                last_signature = current
+                self._pending[path] = now
+            elif now - self._pending[path] >= self.settle_time:
+                return True
+
+    async def _drain(self):
+        """ Cancels the paths waiting to be organized and waits for the ones being organized """
+        for path, task in list(self._tasks.items()):
+            if path not in self._in_flight:
+                task.cancel()
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
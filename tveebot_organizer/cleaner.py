@@ -0,0 +1,190 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Callable, List, Optional, Set, Tuple
+
+from tveebot_organizer.metrics import Metrics
+
+logger = logging.getLogger('cleaner')
+
+# Called once a path was removed
+RemovedCallback = Callable[[], None]
+
+
+class Cleaner:
+    """
+    The cleaner removes what is left in the watch directory after an episode is stored, in a
+    background thread. Thus, organizing the next episode does not wait for a release directory
+    with thousands of files to be removed.
+
+    Paths are removed in batches, as they are queued. Optionally, the number of files removed per
+    second is limited, so that removing large directories does not starve the disks of the
+    episodes being stored.
+
+    Each path may be removed with a callback, called once the path is gone. While a path waits to
+    be removed, or is being removed, it is included in the cleaner, which the organizer checks to
+    skip paths which are about to disappear.
+    """
+
+    # Put in the queue to tell the cleaner to exit
+    _STOP = None
+
+    def __init__(self, rate: float = 0, batch_size: int = 64, metrics: Metrics = None):
+        """
+        Initializes the cleaner, but does not start it!
+
+        :param rate:       maximum number of files removed per second, 0 means unlimited
+        :param batch_size: maximum number of paths removed in each batch
+        :param metrics:    registry to record the time spent removing each path
+        :raise ValueError: if *rate* is negative or *batch_size* is smaller than 1
+        """
+        if rate < 0:
+            raise ValueError(f"rate must not be negative, got {rate}")
+        if batch_size < 1:
+            raise ValueError(f"batch size must be at least 1, got {batch_size}")
+
+        self.rate = rate
+        self.batch_size = batch_size
+        self.metrics = metrics or Metrics()
+
+        self._queue: Queue = Queue()
+        self._thread: Optional[threading.Thread] = None
+
+        # Paths waiting to be removed or being removed
+        self._pending: Set[Path] = set()
+        self._pending_lock = threading.Lock()
+
+        # Earliest time the next file may be removed, when the rate is limited
+        self._next_removal = 0.0
+
+    def __contains__(self, path: Path) -> bool:
+        with self._pending_lock:
+            return path in self._pending
+
+    @property
+    def pending(self) -> int:
+        """ Number of paths waiting to be removed or being removed """
+        with self._pending_lock:
+            return len(self._pending)
+
+    def start(self):
+        """ Starts removing paths in a background thread """
+        self._thread = threading.Thread(target=self._run, name="cleaner", daemon=True)
+        self._thread.start()
+
+    def remove(self, path: Path, removed: RemovedCallback = None):
+        """
+        Queues *path* to be removed. It may be a file or a directory, which is removed with
+        everything inside of it.
+
+        :param path:    the path to remove
+        :param removed: optional callback called, from the cleaner thread, once *path* is gone.
+                        It is not called if removing *path* fails.
+        """
+        with self._pending_lock:
+            self._pending.add(path)
+
+        self._queue.put((path, removed))
+
+    def shutdown(self):
+        """ Tells the cleaner to exit once every path queued so far has been removed """
+        self._queue.put(self._STOP)
+
+    def join(self, timeout: float = None) -> bool:
+        """
+        Blocks until the cleaner exits or until the *timeout* occurs.
+
+        :return: True if the cleaner exited and False if the timeout occurred.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stopping = batch and batch[-1] is self._STOP
+            if stopping:
+                batch.pop()
+
+            removed = 0
+            for path, callback in batch:
+                if self._remove_path(path, callback):
+                    removed += 1
+
+            if removed:
+                logger.info(f"cleared {removed} entries from watch directory")
+
+            if stopping:
+                return
+
+    def _next_batch(self) -> List[Optional[Tuple[Path, Optional[RemovedCallback]]]]:
+        """ Blocks until some path is queued and takes up to a batch of paths off the queue """
+        batch = [self._queue.get()]
+        while batch[-1] is not self._STOP and len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _remove_path(self, path: Path, callback: Optional[RemovedCallback]) -> bool:
+        try:
+            with self.metrics.time('stage_seconds', stage='cleanup'):
+                self._remove(path)
+            logger.debug(f"cleared {path.name} from watch directory")
+        except OSError as error:
+            logger.error(f"failed to clear {path.name} from watch directory: {error}")
+            return False
+        finally:
+            with self._pending_lock:
+                self._pending.discard(path)
+
+        if callback is not None:
+            try:
+                callback()
+            except Exception:
+                logger.exception(f"failed to notify that {path.name} was cleared")
+
+        return True
+
+    def _remove(self, path: Path):
+        if not os.path.lexists(path):
+            return
+
+        if not os.path.isdir(path) or os.path.islink(path):
+            self._unlink(path)
+            return
+
+        if not self.rate:
+            shutil.rmtree(path)
+            return
+
+        for root, directories, files in os.walk(path, topdown=False):
+            for name in files:
+                self._unlink(os.path.join(root, name))
+            for name in directories:
+                directory = os.path.join(root, name)
+                if os.path.islink(directory):
+                    self._unlink(directory)
+                else:
+                    os.rmdir(directory)
+        os.rmdir(path)
+
+    def _unlink(self, path):
+        if self.rate:
+            # Each file waits for its slot, so files are removed at most at the given rate
+            now = time.monotonic()
+            if now < self._next_removal:
+                time.sleep(self._next_removal - now)
+            self._next_removal = max(now, self._next_removal) + 1 / self.rate
+
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
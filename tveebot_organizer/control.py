@@ -0,0 +1,258 @@
+"""
+Control API of a running organizer, served on a local Unix socket.
+
+Clients send one request per line, as a JSON object with the name of the command and its
+arguments, and get one JSON object back per request, such as:
+
+    > {"command": "organize", "path": "/srv/downloads/Castle.S08E22.720p.mkv"}
+    < {"ok": true, "submitted": true}
+
+Failed requests get back {"ok": false, "error": "<message>"}. The commands are:
+
+- status: the state of the watcher, its queues, the paths being organized, and each route;
+- pause and resume: stop and restart organizing paths. New paths are still queued meanwhile;
+- set_watch and set_library: change the watch or the library directory of the default route.
+  The new library is indexed in the background, and the route switches to it once indexed;
+- organize: organize a path right away, without waiting for it to settle.
+"""
+import json
+import logging
+import os
+import shutil
+import socket
+import socketserver
+import stat
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from tveebot_organizer.organizer import Organizer
+from tveebot_organizer.watcher import Watcher
+
+logger = logging.getLogger('control')
+
+# Maximum size of a request, in bytes
+MAX_REQUEST_SIZE = 64 * 1024
+
+
+class ControlError(Exception):
+    """ Raised by a command to reply with an error """
+    pass
+
+
+class ControlServer:
+    """
+    Serves the control API of a *Watcher* on a Unix socket. Only the user running the organizer
+    may connect to the socket. Each client is served by its own thread, and may send any number
+    of requests over the same connection.
+    """
+
+    def __init__(self, path: Path, watcher: Watcher):
+        """
+        Creates the socket, but does not start serving requests!
+
+        :param path:    path to the socket. A socket left behind by a previous run is replaced.
+        :param watcher: the watcher controlled through the socket
+        :raise OSError: if the socket can not be created
+        """
+        self.path = path
+        self.watcher = watcher
+
+        self._commands: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+            'status': self._status,
+            'pause': self._pause,
+            'resume': self._resume,
+            'set_watch': self._set_watch,
+            'set_library': self._set_library,
+            'organize': self._organize,
+        }
+
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+
+            def handle(self):
+                while True:
+                    line = self.rfile.readline(MAX_REQUEST_SIZE + 1)
+                    if not line:
+                        return
+
+                    if len(line) > MAX_REQUEST_SIZE:
+                        self._reply({'ok': False, 'error': "request is too large"})
+                        return
+
+                    if line.strip():
+                        self._reply(server.handle(line))
+
+            def _reply(self, response: Dict[str, Any]):
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+
+        self._remove_stale_socket()
+
+        # The socket is bound inside a private directory, where only the owner can reach it, and
+        # moved into place once it has no permissions for the group and others
+        private_dir = tempfile.mkdtemp(prefix=".control-", dir=path.parent)
+        try:
+            bound_path = os.path.join(private_dir, "s")
+            self._server = socketserver.ThreadingUnixStreamServer(bound_path, Handler)
+            try:
+                os.chmod(bound_path, 0o600)
+                os.rename(bound_path, path)
+            except BaseException:
+                self._server.server_close()
+                raise
+        finally:
+            shutil.rmtree(private_dir, ignore_errors=True)
+
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+        # Libraries are switched one at a time, in the background
+        self._library_lock = threading.Lock()
+
+    def start(self):
+        """ Starts serving requests in a background thread """
+        self._thread = threading.Thread(target=self._server.serve_forever, name="control-server",
+                                        daemon=True)
+        self._thread.start()
+        logger.info(f"serving control API on {self.path}")
+
+    def shutdown(self):
+        """ Stops serving requests and removes the socket """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def handle(self, line: bytes) -> Dict[str, Any]:
+        """ Handles a single request, as received from a client, and returns the response """
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be an object")
+        except ValueError as error:
+            return {'ok': False, 'error': f"invalid request: {error}"}
+
+        command = self._commands.get(request.get('command'))
+        if command is None:
+            return {'ok': False, 'error': f"unknown command: {request.get('command')}"}
+
+        try:
+            response = command(request)
+        except ControlError as error:
+            return {'ok': False, 'error': str(error)}
+        except Exception as error:
+            logger.exception(f"failed to handle command '{request['command']}'")
+            return {'ok': False, 'error': f"unexpected error: {error}"}
+
+        return {'ok': True, **response}
+
+    def _status(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        watcher = self.watcher
+        cleaner = watcher.organizer.cleaner
+        return {
+            'paused': watcher.paused,
+            'queue_depth': watcher.queue_depth,
+            'settling_paths': watcher.settling_paths,
+            'in_flight': [str(path) for path in watcher.in_flight],
+            'cleanup_pending': cleaner.pending if cleaner is not None else 0,
+            'routes': [self._route_status(watch_dir, organizer)
+                       for watch_dir, organizer in watcher.routes.items()],
+        }
+
+    @staticmethod
+    def _route_status(watch_dir: Path, organizer: Organizer) -> Dict[str, Any]:
+        storage_manager = organizer.storage_manager
+        index = storage_manager.index
+        return {
+            'watch': str(watch_dir),
+            'library': str(storage_manager.library_dir),
+            'episodes': len(index) if index is not None else None,
+        }
+
+    def _pause(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        self.watcher.pause()
+        return {}
+
+    def _resume(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        self.watcher.resume()
+        return {}
+
+    def _set_watch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        directory = self._directory(request)
+        try:
+            self.watcher.watch_dir = directory
+        except (OSError, ValueError) as error:
+            raise ControlError(f"failed to watch '{directory}': {error}")
+
+        logger.info(f"watch directory changed to {directory}")
+        return {'watch': str(directory)}
+
+    def _set_library(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        directory = self._directory(request)
+        threading.Thread(target=self._switch_library, args=(self.watcher.organizer, directory),
+                         name="library-switch", daemon=True).start()
+        return {'library': str(directory)}
+
+    def _switch_library(self, organizer: Organizer, directory: Path):
+        """ Switches the library of *organizer* to *directory*, once it is indexed """
+        with self._library_lock:
+            logger.info(f"indexing library in {directory}...")
+            try:
+                organizer.storage_manager.library_dir = directory
+            except OSError as error:
+                logger.error(f"failed to change library directory to {directory}: {error}")
+                return
+
+            # Release names are mapped to the tv shows of the new library from now on
+            organizer.matcher.normalizer.set_known_names(
+                organizer.storage_manager.tvshow_names())
+
+        logger.info(f"library directory changed to {directory}")
+
+    def _organize(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        path = self._path(request, 'path')
+        if not os.path.lexists(path):
+            raise ControlError(f"path was not found: {path}")
+
+        return {'submitted': self.watcher.organize(path)}
+
+    def _directory(self, request: Dict[str, Any]) -> Path:
+        directory = self._path(request, 'directory')
+        if not directory.is_dir():
+            raise ControlError(f"directory was not found: {directory}")
+        return directory
+
+    @staticmethod
+    def _path(request: Dict[str, Any], argument: str) -> Path:
+        value = request.get(argument)
+        if not isinstance(value, str) or not value:
+            raise ControlError(f"missing argument: {argument}")
+
+        path = Path(value)
+        if not path.is_absolute():
+            raise ControlError(f"{argument} must be an absolute path: {value}")
+        return path
+
+    def _remove_stale_socket(self):
+        """ Removes the socket left behind by a previous run, unless something still serves it """
+        try:
+            if not stat.S_ISSOCK(os.lstat(self.path).st_mode):
+                raise FileExistsError(f"path exists and is not a socket: {self.path}")
+        except FileNotFoundError:
+            return
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            try:
+                client.connect(str(self.path))
+            except OSError:
+                os.remove(self.path)
+                return
+
+        raise FileExistsError(f"socket is in use by another process: {self.path}")
@@ -3,6 +3,8 @@ TVeeBot Organizer
 
 Usage:
   tveebot-organizerd [options]
+  tveebot-organizerd plan [options] [<directory>...]
+  tveebot-organizerd relayout [options] [--from=<layout>]
 
 Options:
   -h --help                  Show this screen.
@@ -11,23 +13,53 @@ Options:
   -l --library=<directory>   Set library directory.
   -o --log=<file>            Set file to output logs to.
   -c --conf=<file>           Specify a configuration file.
+  -j --workers=<number>      Set number of episodes organized concurrently.
+  -m --metrics-port=<port>   Serve metrics in the Prometheus format on a local port.
+  -s --stats-file=<file>     Periodically write metrics, as JSON, to a file.
+  -a --asyncio               Run the watcher on an asyncio event loop.
+  -n --dry-run               Plan what would be done with the watch directories and exit.
+  --format=<format>          Format of the plan: json or csv [default: json].
+  --output=<file>            Write the plan to a file instead of the standard output.
+  --from=<layout>            Layout the libraries follow now, by default the configured one.
+  --control=<socket>         Serve the control API on a Unix socket.
+
+The plan command tells what would be done with each entry of the given directories, or of the
+watch directories, without changing anything.
+
+The relayout command moves the episodes in each library to the directories given by the
+configured layout, normalizing the tv show names again. An interrupted relayout resumes where it
+stopped when run again.
 """
+import collections
 import configparser
+import csv
+import json
 import logging
+import os
+import signal
 import sys
 from logging.config import fileConfig
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, List, Optional, TextIO
 
 from docopt import docopt
-from pkg_resources import resource_filename
 
-from tveebot_organizer.filter import Filter
-from tveebot_organizer.matcher import Matcher
-from tveebot_organizer.organizer import Organizer
-from tveebot_organizer.storage_manager import StorageManager
-from tveebot_organizer.watcher import Watcher
+# Components are imported once they are needed, so that showing the help or reporting an invalid
+# configuration does not pay for importing watchdog, asyncio, and every component
+if TYPE_CHECKING:
+    from tveebot_organizer.async_watcher import AsyncWatcher
+    from tveebot_organizer.cleaner import Cleaner
+    from tveebot_organizer.dataclasses import PlanEntry
+    from tveebot_organizer.filter import Filter
+    from tveebot_organizer.io_scheduler import IOScheduler
+    from tveebot_organizer.journal import Journal
+    from tveebot_organizer.metrics import Metrics
+    from tveebot_organizer.normalizer import Normalizer
+    from tveebot_organizer.organizer import Organizer
+    from tveebot_organizer.retry_queue import RetryQueue
+    from tveebot_organizer.watcher import Watcher
 
-DEFAULT_CONFIG_FILE = resource_filename(__name__, 'config.ini')
+DEFAULT_CONFIG_FILE = Path(__file__).with_name('config.ini')
 
 logger = logging.getLogger()
 config = configparser.ConfigParser()
@@ -59,28 +91,359 @@ def main():
     if args['--library']:
         config['organizer']['library'] = args['--library']
 
-    try:
-        watch_dir = Path(config['watcher']['watch'])
-    except KeyError:
+    # The watch and library directories in the main sections form the default route, required
+    # only when no other route is defined
+    routes_defined = any(section.startswith('route:') for section in config.sections())
+    if 'watch' not in config['watcher'] and not routes_defined:
         logger.error("watch directory is not specified")
         logger.info("use option '--watch' to specify watch directory")
         sys.exit(1)
 
-    try:
-        library_dir = Path(config['organizer']['library'])
-    except KeyError:
+    if 'watch' in config['watcher'] and 'library' not in config['organizer']:
         logger.error("library directory is not specified")
         logger.info("use option '--library' to specify library directory")
         sys.exit(1)
 
-    organizer = Organizer(
-        filter=Filter(),
-        matcher=Matcher(),
-        storage_manager=StorageManager(library_dir)
-    )
+    if args['--workers']:
+        config['watcher']['workers'] = args['--workers']
+
+    if args['--asyncio']:
+        config['watcher']['mode'] = 'asyncio'
+
+    if args['--metrics-port']:
+        config['metrics']['port'] = args['--metrics-port']
+
+    if args['--stats-file']:
+        config['metrics']['stats_file'] = args['--stats-file']
+
+    if args['--control']:
+        config['control']['socket'] = args['--control']
+
+    try:
+        workers = config['watcher'].getint('workers')
+        queue_size = config['watcher'].getint('queue_size')
+        settle_time = config['watcher'].getfloat('settle_time')
+        scan_interval = config['watcher'].getfloat('scan_interval')
+    except ValueError as error:
+        logger.error(f"invalid watcher configuration: {error}")
+        sys.exit(1)
+
+    if workers < 1:
+        logger.error(f"number of workers must be at least 1, got {workers}")
+        sys.exit(1)
+
+    mode = config['watcher'].get('mode')
+    if mode not in ('threads', 'asyncio'):
+        logger.error(f"invalid watcher mode '{mode}': must be 'threads' or 'asyncio'")
+        sys.exit(1)
+
+    if mode == 'asyncio' and config['control'].get('socket'):
+        logger.error("the control API is only available in the 'threads' mode")
+        sys.exit(1)
+
+    try:
+        routes = load_routes(config)
+    except ValueError as error:
+        logger.error(str(error))
+        sys.exit(1)
+
+    if args['plan'] or args['--dry-run']:
+        directories = [Path(directory) for directory in args['<directory>']]
+        sys.exit(run_plan(routes, directories, workers, args['--format'], args['--output']))
+
+    if args['relayout']:
+        sys.exit(run_relayout(routes, args['--from'], workers))
+
+    from tveebot_organizer.journal import Journal
+    from tveebot_organizer.metrics import Metrics
+    from tveebot_organizer.organizer import recover_routes
+
+    journal = None
+    journal_file = config['organizer'].get('journal')
+    if journal_file:
+        journal = Journal(Path(journal_file))
+        try:
+            unfinished = journal.open()
+        except OSError as error:
+            logger.error(f"failed to open journal: {error}")
+            sys.exit(1)
+
+    metrics = Metrics()
+
+    try:
+        cleaner = load_cleaner(config['cleaner'], metrics)
+    except ValueError as error:
+        logger.error(f"invalid cleaner configuration: {error}")
+        sys.exit(1)
+
+    # The scheduler is shared by every route, since routes may store to the same devices
+    try:
+        scheduler = load_scheduler(config['io'], metrics)
+    except (OSError, ValueError) as error:
+        logger.error(f"invalid io configuration: {error}")
+        sys.exit(1)
+
+    try:
+        retry_queue = load_retry_queue(config['retry'], metrics)
+    except (OSError, ValueError) as error:
+        logger.error(f"invalid retry configuration: {error}")
+        sys.exit(1)
+
+    # Exporters are started before scanning the libraries, so that an invalid or busy port is
+    # reported right away. The gauges are only rendered once they are defined.
+    try:
+        exporters = start_metrics_exporters(config['metrics'], metrics)
+    except (OSError, ValueError) as error:
+        logger.error(f"failed to export metrics: {error}")
+        sys.exit(1)
+
+    organizers = []
+    for route in routes:
+        try:
+            organizers.append(load_organizer(route, metrics, journal, cleaner, scheduler,
+                                              retry_queue))
+        except (OSError, ValueError) as error:
+            logger.error(f"invalid configuration of route '{route.name}': {error}")
+            sys.exit(1)
+
+    # Recover before watching, the sources left in the watch directory are organized again
+    if journal is not None:
+        recover_routes(organizers, unfinished)
+
+    watch_dir = Path(routes[0]['watch'])
+    if mode == 'asyncio':
+        from tveebot_organizer.async_watcher import AsyncWatcher
+        watcher = AsyncWatcher(watch_dir, organizers[0], concurrency=workers,
+                               settle_time=settle_time, scan_interval=scan_interval)
+    else:
+        from tveebot_organizer.watcher import Watcher
+        watcher = Watcher(watch_dir, organizers[0], workers=workers, queue_size=queue_size,
+                          settle_time=settle_time, scan_interval=scan_interval)
+
+    # Every other route shares the observer and the workers of the watcher
+    for route, organizer in zip(routes[1:], organizers[1:]):
+        try:
+            watcher.add_route(Path(route['watch']), organizer)
+        except ValueError as error:
+            logger.error(f"invalid configuration of route '{route.name}': {error}")
+            sys.exit(1)
+
+    indexes = [organizer.storage_manager.index for organizer in organizers]
+
+    metrics.gauge('queue_depth', lambda: watcher.queue_depth,
+                  help="Paths waiting to be organized by the workers.")
+    metrics.gauge('settling_paths', lambda: watcher.settling_paths,
+                  help="Paths waiting for their content to settle.")
+    if cleaner is not None:
+        metrics.gauge('cleanup_pending', lambda: cleaner.pending,
+                      help="Paths waiting to be removed from the watch directories.")
+    if retry_queue is not None:
+        metrics.gauge('retry_pending', lambda: len(retry_queue),
+                      help="Paths waiting to be organized again.")
+    metrics.gauge('library_episodes', lambda: sum(len(index) for index in indexes),
+                  help="Episodes included in the libraries.")
+
+    control_server = None
+    if config['control'].get('socket'):
+        from tveebot_organizer.control import ControlServer
+        try:
+            control_server = ControlServer(Path(config['control']['socket']), watcher)
+        except OSError as error:
+            logger.error(f"failed to serve control API: {error}")
+            sys.exit(1)
+
+    if cleaner is not None:
+        cleaner.start()
+
+    if control_server is not None:
+        control_server.start()
+
+    if retry_queue is not None:
+        retry_queue.start(watcher.organize)
+
+    if mode == 'asyncio':
+        run_async(watcher)
+    else:
+        run_threads(watcher)
+
+    if retry_queue is not None:
+        retry_queue.shutdown()
+
+    if control_server is not None:
+        control_server.shutdown()
+
+    if cleaner is not None:
+        cleaner.shutdown()
+        if not cleaner.join(timeout=10):
+            logger.info("exited before clearing the watch directories")
+
+    for exporter in exporters:
+        exporter.shutdown()
+
+    if journal is not None:
+        journal.close()
+
+    for route, index in zip(routes, indexes):
+        if route.get('index'):
+            try:
+                index.save(Path(route['index']))
+            except OSError as error:
+                logger.error(f"failed to save library index of route '{route.name}': {error}")
+
+
+def run_plan(routes: List[configparser.SectionProxy], directories: List[Path], workers: int,
+             format: str, output: Optional[str]) -> int:
+    """
+    Writes the plan of each entry in the *directories*, or in the watch directories when none is
+    given. Entries of a watch directory are planned by the organizer of its route, while entries
+    of any other directory are planned by the organizer of the default route.
+
+    :return: the exit status
+    """
+    if format not in PLAN_WRITERS:
+        logger.error(f"invalid plan format '{format}': must be one of {', '.join(PLAN_WRITERS)}")
+        return 1
+
+    from tveebot_organizer.metrics import Metrics
+
+    try:
+        # Nothing is changed while planning: no journal to recover and no cleaner
+        metrics = Metrics()
+        organizers = {Path(route['watch']): load_organizer(route, metrics, None, None)
+                      for route in routes}
+    except (OSError, ValueError) as error:
+        logger.error(f"invalid configuration: {error}")
+        return 1
+
+    entries = []
+    for directory in directories or list(organizers):
+        organizer = organizers.get(directory, next(iter(organizers.values())))
+        try:
+            with os.scandir(directory) as it:
+                paths = sorted(Path(entry.path) for entry in it)
+        except OSError as error:
+            logger.error(f"failed to list directory: {error}")
+            return 1
+
+        logger.info(f"planning {len(paths)} entries of '{directory}'...")
+        entries.extend(organizer.plan(paths, workers))
+
+    try:
+        if output:
+            with open(output, 'w', newline='') as file:
+                PLAN_WRITERS[format](entries, file)
+        else:
+            PLAN_WRITERS[format](entries, sys.stdout)
+    except OSError as error:
+        logger.error(f"failed to write plan: {error}")
+        return 1
+
+    counts = collections.Counter(entry.status for entry in entries)
+    logger.info("planned " + ", ".join(f"{counts[status]} {status}"
+                                       for status in ('store', 'duplicate', 'unmatched',
+                                                      'ignored')))
+    return 0
+
+
+def run_relayout(routes: List[configparser.SectionProxy], old_pattern: Optional[str],
+                 workers: int) -> int:
+    """
+    Moves the episodes in the library of each route to the layout of the route. Routes sharing a
+    library are relaid out once. The library index of each route, if saved to a file, is rebuilt.
+
+    :param routes:      configuration of each route
+    :param old_pattern: pattern of the layout the libraries follow now, by default the layout of
+                        each route, in which case only the tv show names change
+    :param workers:     number of files moved concurrently in each device
+    :return: the exit status
+    """
+    from tveebot_organizer.layout import Layout
+    from tveebot_organizer.library_index import LibraryIndex
+    from tveebot_organizer.relayout import Relayout
 
-    watcher = Watcher(watch_dir, organizer)
+    status = 0
+    libraries = set()
+    for route in routes:
+        library_dir = Path(route['library'])
+        if library_dir in libraries:
+            continue
+        libraries.add(library_dir)
 
+        try:
+            new_layout = Layout(route['layout'])
+            old_layout = Layout(old_pattern) if old_pattern else new_layout
+            filter = load_filter(route)
+            relayout = Relayout(library_dir, old_layout, new_layout, load_normalizer(route),
+                                workers_per_device=workers, filter=filter)
+
+            logger.info(f"relaying out '{library_dir}' from '{old_layout.pattern}' "
+                        f"to '{new_layout.pattern}'...")
+            results = relayout.run()
+        except (OSError, ValueError) as error:
+            logger.error(f"failed to relayout library of route '{route.name}': {error}")
+            status = 1
+            continue
+
+        if results['conflict'] or results['failed']:
+            logger.error(f"some files of '{library_dir}' were not moved: run again to retry")
+            status = 1
+
+        if route.get('index'):
+            index = LibraryIndex(library_dir, layout=new_layout, filter=filter)
+            index.scan()
+            try:
+                index.save(Path(route['index']))
+            except OSError as error:
+                logger.error(f"failed to save library index of route '{route.name}': {error}")
+                status = 1
+
+    return status
+
+
+def plan_records(entries: List['PlanEntry']) -> Iterator[dict]:
+    """ Converts each plan entry into a flat record, with empty values for missing fields """
+    for entry in entries:
+        episode = entry.episode
+        yield {
+            'source': str(entry.source),
+            'status': entry.status,
+            'episode_file': str(entry.episode_file) if entry.episode_file else '',
+            'tvshow': episode.tvshow.name if episode else '',
+            'season': episode.season if episode else '',
+            'episode': episode.number if episode else '',
+            'destination': str(entry.destination) if entry.destination else '',
+        }
+
+
+def write_plan_json(entries: List['PlanEntry'], file: TextIO):
+    json.dump(list(plan_records(entries)), file, indent=2)
+    file.write("\n")
+
+
+def write_plan_csv(entries: List['PlanEntry'], file: TextIO):
+    fields = ['source', 'status', 'episode_file', 'tvshow', 'season', 'episode', 'destination']
+    writer = csv.DictWriter(file, fieldnames=fields)
+    writer.writeheader()
+    writer.writerows(plan_records(entries))
+
+
+# Maps each format of the plan to the function writing it
+PLAN_WRITERS = {
+    'json': write_plan_json,
+    'csv': write_plan_csv,
+}
+
+
+def run_threads(watcher: 'Watcher'):
+    """
+    Runs the *watcher* until the process is interrupted or terminated. Either way, the paths
+    being organized are allowed to finish.
+    """
+    def terminate(signum, frame):
+        logger.info("terminating...")
+        watcher.shutdown()
+
+    signal.signal(signal.SIGTERM, terminate)
     try:
         logger.info("running...")
         watcher.run_forever()
@@ -96,5 +459,239 @@ def main():
         logger.info("exited abruptly")
 
 
+def run_async(watcher: 'AsyncWatcher'):
+    """
+    Runs the *watcher* on an asyncio event loop until the process is interrupted or terminated.
+    Either way, the paths being organized are allowed to finish.
+    """
+    import asyncio
+
+    async def run():
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, watcher.shutdown)
+        await watcher.run()
+
+    try:
+        logger.info("running on asyncio event loop...")
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.info("exiting...")
+    except:
+        logger.exception("unexpected error")
+        return
+
+    logger.info("exited cleanly")
+
+
+def load_routes(config: configparser.ConfigParser) -> List[configparser.SectionProxy]:
+    """
+    Lists the routes from a watch directory to a library. The watch directory of the watcher and
+    the library directory of the organizer form the default route. Every other route is defined in
+    a section named 'route:<name>', which may also set the library index, the store mode, the
+    layout, the duplicates policy, and any option of the filter and the matcher. Options not set
+    by a route are taken from the organizer, filter, and matcher sections.
+
+    :return: the configuration of each route, the default route first
+    :raise ValueError: if a route does not specify its watch or library directory
+    """
+    defaults = {**config['filter'], **config['matcher'], 'index': '',
+                'store_mode': config['organizer']['store_mode'],
+                'layout': config['organizer']['layout'],
+                'duplicates': config['organizer']['duplicates']}
+
+    routes = configparser.ConfigParser(interpolation=None)
+    if 'watch' in config['watcher']:
+        routes['default'] = {**defaults, 'watch': config['watcher']['watch'],
+                             'library': config['organizer']['library'],
+                             'index': config['organizer'].get('index', '')}
+
+    for section in config.sections():
+        if section.startswith('route:'):
+            routes[section[len('route:'):]] = {**defaults, **config[section]}
+
+    for name in routes.sections():
+        for option in ('watch', 'library'):
+            if not routes[name].get(option):
+                raise ValueError(f"route '{name}' does not specify its {option} directory")
+
+    return [routes[name] for name in routes.sections()]
+
+
+def load_organizer(route: configparser.SectionProxy, metrics: 'Metrics',
+                   journal: Optional['Journal'], cleaner: Optional['Cleaner'],
+                   scheduler: Optional['IOScheduler'] = None,
+                   retry_queue: Optional['RetryQueue'] = None) -> 'Organizer':
+    """
+    Creates the organizer of a route, with its own filter, matcher, and library index. The
+    *scheduler* and the *retry_queue*, if any, are shared with the other routes.
+
+    :raise OSError:    if the alias table can not be read
+    :raise ValueError: if the configuration is not valid
+    """
+    from tveebot_organizer.layout import Layout
+    from tveebot_organizer.library_index import LibraryIndex
+    from tveebot_organizer.matcher import Matcher
+    from tveebot_organizer.organizer import Organizer
+    from tveebot_organizer.storage_manager import StorageManager
+
+    library_dir = Path(route['library'])
+    layout = Layout(route['layout'])
+
+    # Episode files are indexed as the filter tells them apart, including sniffed files
+    filter = load_filter(route)
+    index = LibraryIndex(library_dir, layout=layout, filter=filter)
+    if route.get('index'):
+        index.load(Path(route['index']))
+    else:
+        index.scan()
+
+    normalizer = load_normalizer(route)
+    storage_manager = StorageManager(library_dir, index, route['store_mode'], layout,
+                                     route['duplicates'], scheduler=scheduler)
+
+    # Release names of tv shows already in the library are mapped to the existing directories
+    normalizer.add_known_names(storage_manager.tvshow_names())
+
+    return Organizer(
+        filter=filter,
+        matcher=Matcher(normalizer),
+        storage_manager=storage_manager,
+        metrics=metrics,
+        journal=journal,
+        cleaner=cleaner,
+        retry_queue=retry_queue,
+        route=route.name
+    )
+
+
+def load_cleaner(cleaner_config: configparser.SectionProxy,
+                 metrics: 'Metrics') -> Optional['Cleaner']:
+    """
+    Creates the cleaner removing organized paths from the watch directories in the background.
+
+    :return: the cleaner or None if paths are removed by the organizer itself
+    :raise ValueError: if the configuration is not valid
+    """
+    if not cleaner_config.getboolean('background'):
+        return None
+
+    from tveebot_organizer.cleaner import Cleaner
+
+    return Cleaner(rate=cleaner_config.getfloat('rate'),
+                   batch_size=cleaner_config.getint('batch_size'), metrics=metrics)
+
+
+def load_retry_queue(retry_config: configparser.SectionProxy,
+                     metrics: 'Metrics') -> Optional['RetryQueue']:
+    """
+    Creates the retry queue shared by the organizers of every route, loading the paths left
+    waiting by the previous run.
+
+    :return: the retry queue or None if failed paths are not retried
+    :raise OSError:    if the queue file can not be read
+    :raise ValueError: if the configuration is not valid
+    """
+    if not retry_config.getboolean('enabled'):
+        return None
+
+    from tveebot_organizer.retry_queue import DEFAULT_POLICIES, RetryPolicy, RetryQueue
+
+    policies = {}
+    for kind in DEFAULT_POLICIES:
+        values = [value.strip() for value in retry_config[kind].split(',')]
+        if len(values) != 3:
+            raise ValueError(f"invalid policy of '{kind}': must be "
+                             f"<attempts>, <initial delay>, <maximum delay>")
+        policies[kind] = RetryPolicy(int(values[0]), float(values[1]), float(values[2]))
+
+    queue_file = retry_config.get('queue')
+    retry_queue = RetryQueue(Path(queue_file) if queue_file else None, policies,
+                             retry_config.getfloat('probe_interval'), metrics)
+    retry_queue.load()
+    return retry_queue
+
+
+def load_scheduler(io_config: configparser.SectionProxy, metrics: 'Metrics') -> 'IOScheduler':
+    """
+    Creates the I/O scheduler limiting the concurrent transfers from and to each device.
+
+    :raise OSError:    if a device given its own limit can not be accessed
+    :raise ValueError: if the configuration is not valid
+    """
+    from tveebot_organizer.io_scheduler import IOScheduler
+
+    device_limits = {}
+    for item in io_config.get('device_limits', '').split(','):
+        if not item.strip():
+            continue
+
+        path, separator, limit = item.strip().rpartition(':')
+        if not separator or not path:
+            raise ValueError(f"invalid device limit '{item.strip()}': must be <path>:<limit>")
+        device_limits[Path(path)] = int(limit)
+
+    return IOScheduler(io_config.getint('transfers_per_device'), device_limits, metrics)
+
+
+def start_metrics_exporters(metrics_config: configparser.SectionProxy,
+                            metrics: 'Metrics') -> list:
+    """
+    Starts exporting the *metrics* through the HTTP endpoint and the stats file, if they are
+    enabled in the configuration.
+
+    :return: the exporters which were started
+    :raise OSError:    if the HTTP endpoint can not be started
+    :raise ValueError: if the configuration is not valid
+    """
+    exporters = []
+
+    port = metrics_config.getint('port')
+    if port:
+        from tveebot_organizer.metrics import MetricsServer
+        server = MetricsServer(metrics, port)
+        server.start()
+        exporters.append(server)
+
+    stats_file = metrics_config.get('stats_file')
+    if stats_file:
+        from tveebot_organizer.metrics import StatsFileWriter
+        writer = StatsFileWriter(metrics, Path(stats_file), metrics_config.getfloat('interval'))
+        writer.start()
+        exporters.append(writer)
+
+    return exporters
+
+
+def load_filter(filter_config: configparser.SectionProxy) -> 'Filter':
+    """
+    Creates the filter from its configuration.
+
+    :raise ValueError: if the configuration is not valid
+    """
+    from tveebot_organizer.filter import Filter
+
+    skip_dirs = [name.strip() for name in filter_config.get('skip_dirs').split(',')]
+    return Filter(max_depth=filter_config.getint('max_depth'),
+                  skip_dirs=[name for name in skip_dirs if name],
+                  sniff=filter_config.get('sniff'))
+
+
+def load_normalizer(matcher_config: configparser.SectionProxy) -> 'Normalizer':
+    """
+    Creates the normalizer used by the matcher, loading the alias table if one is specified.
+
+    :raise OSError:    if the alias table can not be read
+    :raise ValueError: if the configuration or the alias table is not valid
+    """
+    from tveebot_organizer.normalizer import Normalizer
+
+    cache_size = matcher_config.getint('cache_size')
+    aliases_file = matcher_config.get('aliases')
+
+    if aliases_file:
+        return Normalizer.from_file(Path(aliases_file), cache_size)
+    else:
+        return Normalizer(cache_size=cache_size)
+
+
 if __name__ == '__main__':
     main()
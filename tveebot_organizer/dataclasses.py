@@ -1,4 +1,5 @@
-from typing import NamedTuple
+from pathlib import Path
+from typing import NamedTuple, Optional
 
 
 class TVShow(NamedTuple):
@@ -9,3 +10,12 @@ class Episode(NamedTuple):
     tvshow: TVShow
     season: int
     number: int
+
+
+class PlanEntry(NamedTuple):
+    """ What the organizer would do with a path in the watch directory """
+    source: Path
+    status: str                             # one of: store, ignored, unmatched, duplicate
+    episode_file: Optional[Path] = None
+    episode: Optional[Episode] = None
+    destination: Optional[Path] = None
@@ -1,5 +1,12 @@
+import os
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from tveebot_organizer.sniffer import Sniffer
+
+# When video files are detected by their content: 'never', only for files whose extension is
+# neither a video extension nor some other known extension, or 'always'
+SNIFF_MODES = ('never', 'ambiguous', 'always')
 
 
 class Filter:
@@ -10,12 +17,53 @@ class Filter:
 
     The filter includes a single method *find_episode_file()* which takes a path. This method is
     able to handle both files and directories. If the input is a directory, it looks for the
-    episode file inside that directory and ignores all other files.
+    episode file inside that directory, and inside its sub-directories up to a maximum depth, and
+    ignores all other files. Sub-directories holding samples or extras are skipped entirely.
+
+    By default, video files are told apart by their extension. Optionally, the filter sniffs the
+    first bytes of files to recognize Matroska, MP4, and AVI files, either only for files with an
+    ambiguous extension, such as files without one, or for every file, which also rejects files
+    with a video extension and some other content.
     """
 
     # Supported video file extensions
     video_extensions = {'.mkv', '.mp4', '.avi', '.m4p', '.m4v'}
 
+    # Extensions of files which come along with episodes and are never sniffed as ambiguous
+    other_extensions = frozenset({
+        '.nfo', '.txt', '.srt', '.sub', '.idx', '.ass', '.ssa', '.vtt', '.jpg', '.jpeg', '.png',
+        '.sfv', '.md5', '.nzb', '.torrent', '.url', '.exe', '.rar', '.zip', '.7z', '.par2',
+        '.part', '.!qb', '.mp3', '.flac', '.m4a', '.m4b', '.mka', '.aac', '.ac3', '.dts', '.ogg',
+        '.opus', '.wav', '.wma', '.3gp', '.3g2', '.heic', '.heif', '.avif',
+    })
+
+    # Names of the sub-directories which never include the episode file
+    default_skip_dirs = frozenset({'sample', 'samples', 'extras', 'featurettes', 'subs'})
+
+    def __init__(self, max_depth: int = 3, skip_dirs: Iterable[str] = default_skip_dirs,
+                 sniff: str = 'never', sniffer: Sniffer = None):
+        """
+        Initializes the filter.
+
+        :param max_depth: number of directory levels searched for the episode file. A max depth
+                          of 1 only searches the files directly inside the given directory.
+        :param skip_dirs: names of the sub-directories which are not searched, ignoring case
+        :param sniff:     when video files are detected by their content, one of *SNIFF_MODES*
+        :param sniffer:   cache of the sniffed files
+        :raise ValueError: if *max_depth* is smaller than 1 or *sniff* is not valid
+        """
+        if max_depth < 1:
+            raise ValueError(f"max depth must be at least 1, got {max_depth}")
+
+        if sniff not in SNIFF_MODES:
+            raise ValueError(f"invalid sniff mode '{sniff}': "
+                             f"must be one of {', '.join(SNIFF_MODES)}")
+
+        self.max_depth = max_depth
+        self.skip_dirs = frozenset(name.lower() for name in skip_dirs)
+        self.sniff = sniff
+        self.sniffer = sniffer or Sniffer()
+
     def find_episode_file(self, path: Path) -> Optional[Path]:
         """
         Finds the episode file corresponding to the given *path* and returns it.
@@ -23,39 +71,99 @@ class Filter:
         The 'path' argument may be a file or a directory.
 
         If *path* is a file, then it assumes this file must be the episode file.
-        If *path* is a directory, then it looks for the largest video file inside the directory
-        and considers that to be the episode file.
+        If *path* is a directory, then it looks for the largest video file inside the directory,
+        or inside its sub-directories, and considers that to be the episode file.
 
         If the episode file does not correspond to a video file, then it returns None. Returning
         None indicates the filter was not able to find an episode file for the given *path*.
 
+        :raise: ValueError: if *path* is neither a file or a directory
+        """
+        episode_files = self.find_episode_files(path)
+        return episode_files[0] if episode_files else None
+
+    def find_episode_files(self, path: Path) -> List[Path]:
+        """
+        Finds every episode file corresponding to the given *path*, such as the episodes of a
+        season pack, with a single scan of the directory.
+
+        If *path* is a file, then it is the only episode file, as long as it is a video file.
+        If *path* is a directory, then every video file inside the directory, or inside its
+        sub-directories, is an episode file. The largest video file comes first, and is the one
+        returned by *find_episode_file()*.
+
+        :return: the episode files, largest first, or an empty list if there are none
         :raise: ValueError: if *path* is neither a file or a directory
         """
         if path.is_file():
-            if self.is_video_file(path):
-                episode_file = path
-            else:
-                episode_file = None
+            return [path] if self.is_video(path) else []
 
         elif path.is_dir():
-            try:
-                # Look for the biggest video file inside the directory
-                episode_file = max([file for file in path.iterdir() if self.is_video_file(file)],
-                                   key=lambda p: p.stat().st_size)
-            except ValueError:
-                # The directory is empty
-                episode_file = None
+            # Files of the same size keep the order they were found in
+            entries = sorted(self._video_entries(path), key=lambda item: item[1], reverse=True)
+            return [Path(entry.path) for entry, _ in entries]
 
         else:
             raise ValueError(f"path '{path}' is neither a file or a directory")
 
-        return episode_file
+    def _video_entries(self, directory: Path) -> Iterator[Tuple[os.DirEntry, int]]:
+        """
+        Walks *directory* up to the maximum depth and yields each video file found along with its
+        size. The type of each entry is obtained from the directory listing, so only video files
+        need to be stat'ed, and only once.
+        """
+        directories = [(str(directory), 1)]
+        while directories:
+            current_dir, depth = directories.pop()
+            try:
+                with os.scandir(current_dir) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            if depth < self.max_depth and entry.name.lower() not in self.skip_dirs:
+                                directories.append((entry.path, depth + 1))
+
+                        elif self._may_be_video(entry.name):
+                            try:
+                                if entry.is_file():
+                                    stat = entry.stat()
+                                    if self.is_video(Path(entry.path), stat):
+                                        yield entry, stat.st_size
+                            except FileNotFoundError:
+                                # The file was removed meanwhile
+                                continue
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+    def _needs_sniffing(self, name: str) -> bool:
+        """ Determines whether the file called *name* is told apart by its content """
+        if self.sniff == 'always':
+            return True
+
+        if self.sniff == 'ambiguous':
+            suffix = os.path.splitext(name)[1].lower()
+            return suffix not in self.video_extensions and suffix not in self.other_extensions
+
+        return False
+
+    def _may_be_video(self, name: str) -> bool:
+        """ Determines, without touching the file called *name*, if it may be a video file """
+        return (os.path.splitext(name)[1].lower() in self.video_extensions
+                or self._needs_sniffing(name))
+
+    def is_video(self, path: Path, stat: os.stat_result = None) -> bool:
+        """
+        Determines whether the file in *path*, with status *stat*, is a video file, by its
+        extension or, depending on the sniff mode, by its content.
+        """
+        if self._needs_sniffing(path.name):
+            return self.sniffer.container(path, stat) is not None
+        return path.suffix.lower() in self.video_extensions
 
     @staticmethod
     def is_video_file(path: Path) -> bool:
         """
-        Determines whether not *path* corresponds to a video file or not.
+        Determines whether not *path* corresponds to a video file or not, by its extension.
 
         :return: True if *path* is a video file and False if otherwise.
         """
-        return path.is_file() and path.suffix.lower() in Filter.video_extensions
+        return path.suffix.lower() in Filter.video_extensions and path.is_file()
@@ -0,0 +1,101 @@
+"""
+Partial-content fingerprints of episode files.
+
+Hashing whole episode files to tell whether two of them hold the same content would read
+gigabytes for each one. Instead, the fingerprint of a file hashes its size along with a chunk
+from its head, its middle, and its tail. Two different releases of the same episode, even with
+the same size, differ in at least one of these chunks in practice, while renamed copies of the
+same release always share them.
+
+The chunks are read through a memory map, which means only the pages of the chunks are read from
+disk.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Tuple
+
+logger = logging.getLogger('fingerprint')
+
+# Number of bytes hashed from each of the head, the middle, and the tail of a file
+CHUNK_SIZE = 1024 * 1024
+
+
+def fingerprint(path: Path) -> str:
+    """
+    Computes the fingerprint of the file in *path*.
+
+    :raise OSError: if the file can not be read
+    """
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        digest.update(size.to_bytes(8, 'little'))
+
+        # Empty files can not be memory mapped, and there is nothing else to hash anyway
+        if size == 0:
+            return digest.hexdigest()
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if size <= 3 * CHUNK_SIZE:
+                digest.update(data)
+            else:
+                middle = (size - CHUNK_SIZE) // 2
+                for offset in (0, middle, size - CHUNK_SIZE):
+                    digest.update(data[offset:offset + CHUNK_SIZE])
+
+    return digest.hexdigest()
+
+
+class Fingerprints:
+    """
+    Cache of the fingerprints of files. Each fingerprint is cached by the inode of the file, and
+    is computed again if the size or the modification time of the file changed since then.
+    Thus, each file in the library is usually read only once, no matter how many episodes are
+    compared with it.
+    """
+
+    def __init__(self, cache_size: int = 4096):
+        """
+        :param cache_size: maximum number of fingerprints kept in the cache
+        """
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[Tuple[int, int], Tuple[int, int, str]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._cache)
+
+    def get(self, path: Path) -> str:
+        """
+        Returns the fingerprint of the file in *path*, from the cache if it is still valid.
+
+        :raise OSError: if the file can not be read
+        """
+        stat = os.stat(path)
+        key = (stat.st_dev, stat.st_ino)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+                self._cache.move_to_end(key)
+                return cached[2]
+
+        # Files are read outside the lock, so that fingerprints of different files are computed
+        # concurrently
+        value = fingerprint(path)
+        logger.debug(f"fingerprint of '{path.name}' is {value}")
+
+        with self._lock:
+            self._cache[key] = (stat.st_size, stat.st_mtime_ns, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return value
@@ -0,0 +1,126 @@
+"""
+Scheduling of the transfers of episode files between devices.
+
+Copying several multi-gigabyte episode files to the same hard disk at once makes the disk seek
+back and forth between them, which makes every copy slower than copying them one after the other.
+The I/O scheduler limits the number of concurrent transfers reading from or writing to each
+device, while transfers between different devices still run in parallel.
+
+Devices are told apart by the *st_dev* of their files. Each transfer takes a slot of both its
+source and its destination device, always in the same order, so that two transfers in opposite
+directions never wait for each other.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator
+
+from tveebot_organizer.metrics import Metrics
+
+logger = logging.getLogger('ioScheduler')
+
+
+def device_name(device: int) -> str:
+    """ Returns the name of *device* in the form '<major>:<minor>' """
+    return f"{os.major(device)}:{os.minor(device)}"
+
+
+class IOScheduler:
+    """
+    Limits the number of concurrent transfers from and to each device. Transfers wait, in the
+    thread storing the episode, until both their devices have a free slot.
+
+    The bytes transferred from and to each device, and the time spent transferring them, are
+    recorded in the metrics, which give the throughput of each device.
+    """
+
+    def __init__(self, transfers_per_device: int = 1, device_limits: Dict[Path, int] = None,
+                 metrics: Metrics = None):
+        """
+        :param transfers_per_device: maximum number of concurrent transfers from or to each
+                                     device, e.g. 1 for hard disks and more for SSDs
+        :param device_limits:        limit of specific devices, overriding
+                                     *transfers_per_device*, by any path in the device
+        :param metrics:              registry the transfers are recorded to
+        :raise ValueError:           if any limit is smaller than 1
+        :raise OSError:              if a path in *device_limits* can not be accessed
+        """
+        device_limits = device_limits or {}
+        for path, limit in [(None, transfers_per_device), *device_limits.items()]:
+            if limit < 1:
+                device = f" of '{path}'" if path is not None else ""
+                raise ValueError(f"transfer limit{device} must be at least 1, got {limit}")
+
+        self.transfers_per_device = transfers_per_device
+        self.limits: Dict[int, int] = {os.stat(path).st_dev: limit
+                                       for path, limit in device_limits.items()}
+        self.metrics = metrics or Metrics()
+
+        self._semaphores: Dict[int, threading.Semaphore] = {}
+        self._lock = threading.Lock()
+
+        self.metrics.describe('io_bytes_total', "Bytes of episode files read from and written "
+                                                "to each device.")
+        self.metrics.describe('io_transfer_seconds_total', "Time spent transferring episode "
+                                                           "files from or to each device.")
+        self.metrics.describe('io_wait_seconds', "Time transfers waited for a free slot in "
+                                                 "their devices.")
+
+    def limit(self, device: int) -> int:
+        """ Returns the maximum number of concurrent transfers from or to *device* """
+        return self.limits.get(device, self.transfers_per_device)
+
+    @contextmanager
+    def transfer(self, source: Path, directory: Path) -> Iterator[None]:
+        """
+        Waits until the devices of the file in *source* and of the destination *directory* have a
+        free slot, and holds both slots inside the *with* block. Once the block completes, the
+        size of *source* is recorded as read from its device and written to the other.
+
+        :param source:    path to the file being transferred
+        :param directory: directory the file is transferred to
+        :raise OSError:   if *source* or *directory* can not be accessed
+        """
+        stat = os.stat(source)
+        size, source_device = stat.st_size, stat.st_dev
+        destination_device = os.stat(directory).st_dev
+        devices = sorted({source_device, destination_device})
+
+        start = time.perf_counter()
+        acquired = []
+        try:
+            for device in devices:
+                self._semaphore(device).acquire()
+                acquired.append(device)
+
+            waited = time.perf_counter() - start
+            for device in devices:
+                self.metrics.observe('io_wait_seconds', waited, device=device_name(device))
+
+            start = time.perf_counter()
+            yield
+            elapsed = time.perf_counter() - start
+        finally:
+            for device in reversed(acquired):
+                self._semaphores[device].release()
+
+        self.metrics.inc('io_bytes_total', size, device=device_name(source_device),
+                         direction='read')
+        self.metrics.inc('io_bytes_total', size, device=device_name(destination_device),
+                         direction='write')
+        for device in devices:
+            self.metrics.inc('io_transfer_seconds_total', elapsed, device=device_name(device))
+
+        logger.debug(f"transferred {size / 2 ** 20:.1f} MiB from {device_name(source_device)} "
+                     f"to {device_name(destination_device)} in {elapsed:.2f}s "
+                     f"({size / 2 ** 20 / max(elapsed, 1e-6):.1f} MiB/s)")
+
+    def _semaphore(self, device: int) -> threading.Semaphore:
+        with self._lock:
+            semaphore = self._semaphores.get(device)
+            if semaphore is None:
+                semaphore = self._semaphores[device] = threading.Semaphore(self.limit(device))
+            return semaphore
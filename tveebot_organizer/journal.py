@@ -0,0 +1,272 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger('journal')
+
+# Number of records after which the journal is truncated, once no operation is unfinished
+DEFAULT_COMPACT_THRESHOLD = 1000
+
+
+class Operation(NamedTuple):
+    """ An organize operation recorded in the journal """
+    id: int
+    source: Path        # path in the watch directory being organized
+    file: Path          # episode file being stored
+    destination: Path   # path the episode file is stored to
+    stored: bool = False
+    route: Optional[str] = None     # name of the route organizing the source
+    mode: Optional[str] = None      # store mode the episode file is stored with
+
+
+class Journal:
+    """
+    The journal is an append-only log of the organize operations. It tells which operations were
+    left unfinished when the daemon stopped unexpectedly, so that only those operations need to be
+    recovered when it starts again.
+
+    Each operation goes through three records: 'intent', written before the episode file is
+    moved to the library; 'stored', written once the file is in the library; and 'done', written
+    once the source was removed from the watch directory or the operation was given up. Records
+    are JSON objects, one per line.
+
+    A record is durable once the method writing it returns. Records written concurrently by
+    different threads are committed together, with a single *fsync()*, by the first thread to
+    get to the file. The other threads only wait for it.
+
+    The journal is truncated when no operation is unfinished and it grew past a threshold, so its
+    size, and the time to read it, depend on the operations in flight, not on the operations
+    ever organized.
+    """
+
+    def __init__(self, path: Path, compact_threshold: int = DEFAULT_COMPACT_THRESHOLD):
+        """
+        Initializes the journal, but does not open it!
+
+        :param path:              the journal file
+        :param compact_threshold: number of records after which the journal is truncated, once
+                                  no operation is unfinished
+        """
+        self.path = path
+        self.compact_threshold = compact_threshold
+
+        self._file = None
+        self._next_id = 1
+        self._unfinished: Dict[int, Operation] = {}
+        self._records = 0
+
+        # Group commit state: records waiting to be written, the sequence number of the last
+        # record appended and of the last record made durable
+        self._buffer: List[str] = []
+        self._appended = 0
+        self._durable = 0
+        self._flushing = False
+        self._error: Optional[OSError] = None
+        self._failed = (0, 0)
+        self._condition = threading.Condition()
+
+    def open(self) -> List[Operation]:
+        """
+        Opens the journal, creating it if it does not exist yet.
+
+        The journal is rewritten to include only the unfinished operations. A record partially
+        written when the daemon stopped is discarded.
+
+        :return: the operations left unfinished, in the order they were started
+        :raise OSError: if the journal can not be read or written
+        """
+        unfinished: Dict[int, Operation] = {}
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                for line_number, line in enumerate(file, start=1):
+                    try:
+                        self._replay(unfinished, json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning(f"ignored invalid record in line {line_number} of journal")
+        except FileNotFoundError:
+            pass
+
+        # Ids only need to be unique within the journal, which now has unfinished operations only
+        self._next_id = max(unfinished, default=0) + 1
+
+        # Rewrite the journal with the unfinished operations only
+        temporary = self.path.with_name(f".{self.path.name}.tmp")
+        with open(temporary, 'w', encoding='utf-8') as file:
+            for operation in unfinished.values():
+                for record in self._records_of(operation):
+                    file.write(self._encode(record))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._unfinished = unfinished
+        self._records = sum(2 if operation.stored else 1 for operation in unfinished.values())
+
+        if unfinished:
+            logger.info(f"found {len(unfinished)} unfinished operations in journal")
+
+        return list(unfinished.values())
+
+    def close(self):
+        """ Closes the journal. Unfinished operations are kept to be recovered later """
+        with self._condition:
+            while self._flushing:
+                self._condition.wait()
+
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @property
+    def unfinished(self) -> int:
+        """ Number of operations started but not finished """
+        with self._condition:
+            return len(self._unfinished)
+
+    def begin(self, source: Path, file: Path, destination: Path, route: str = None,
+              mode: str = None) -> int:
+        """
+        Records the intent of storing the episode *file*, found in *source*, to *destination*.
+
+        :param route: name of the route organizing *source*, which recovers the operation
+        :param mode:  store mode the episode file is stored with
+        :return: the id of the operation, used to record its progress
+        :raise OSError: if the record can not be written
+        """
+        with self._condition:
+            operation_id = self._next_id
+            self._next_id += 1
+            operation = Operation(operation_id, source, file, destination, route=route, mode=mode)
+            # Registered before the intent is written, so that the journal is not truncated
+            # meanwhile by another thread finishing the last unfinished operation
+            self._unfinished[operation_id] = operation
+
+        try:
+            self._append(self._records_of(operation)[0])
+        except OSError:
+            # The operation never started
+            with self._condition:
+                self._unfinished.pop(operation_id, None)
+            raise
+
+        return operation_id
+
+    def stored(self, operation_id: int):
+        """
+        Records the episode file of the operation *operation_id* is in the library.
+
+        :raise OSError: if the record can not be written
+        """
+        with self._condition:
+            operation = self._unfinished.get(operation_id)
+            if operation is not None:
+                self._unfinished[operation_id] = operation._replace(stored=True)
+
+        self._append({'op': 'stored', 'id': operation_id})
+
+    def finish(self, operation_id: int):
+        """
+        Records the operation *operation_id* is finished and needs no recovery.
+
+        :raise OSError: if the record can not be written
+        """
+        with self._condition:
+            self._unfinished.pop(operation_id, None)
+
+        self._append({'op': 'done', 'id': operation_id})
+        self._compact()
+
+    def _append(self, record: dict):
+        """
+        Appends *record* to the journal and waits until it is durable. If no other thread is
+        writing to the journal, this thread writes every record appended so far.
+        """
+        with self._condition:
+            if self._file is None:
+                raise OSError(f"journal is not open: {self.path}")
+
+            self._buffer.append(self._encode(record))
+            self._appended += 1
+            sequence = self._appended
+            self._records += 1
+
+            while self._durable < sequence:
+                if self._flushing:
+                    self._condition.wait()
+                    continue
+
+                self._flushing = True
+                lines, self._buffer = self._buffer, []
+                first, last = self._durable + 1, self._appended
+
+                self._condition.release()
+                try:
+                    self._file.write("".join(lines))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except OSError as error:
+                    self._error, self._failed = error, (first, last)
+                finally:
+                    self._condition.acquire()
+                    self._flushing = False
+                    self._durable = last
+                    self._condition.notify_all()
+
+            first, last = self._failed
+            if first <= sequence <= last:
+                raise OSError(f"failed to write to journal: {self._error}")
+
+    def _compact(self):
+        """ Truncates the journal when no operation is unfinished and it grew past the threshold """
+        with self._condition:
+            if (self._unfinished or self._buffer or self._flushing or self._file is None
+                    or self._records < self.compact_threshold):
+                return
+
+            try:
+                self._file.truncate(0)
+                os.fsync(self._file.fileno())
+            except OSError as error:
+                logger.error(f"failed to truncate journal: {error}")
+                return
+
+            self._records = 0
+
+    def _replay(self, unfinished: Dict[int, Operation], record: dict):
+        operation_id = int(record['id'])
+        if record['op'] == 'intent':
+            unfinished[operation_id] = Operation(operation_id, Path(record['source']),
+                                                 Path(record['file']),
+                                                 Path(record['destination']),
+                                                 route=record.get('route'),
+                                                 mode=record.get('mode'))
+        elif record['op'] == 'stored':
+            if operation_id in unfinished:
+                unfinished[operation_id] = unfinished[operation_id]._replace(stored=True)
+        elif record['op'] == 'done':
+            unfinished.pop(operation_id, None)
+        else:
+            raise ValueError(f"unknown operation: {record['op']}")
+
+    @staticmethod
+    def _records_of(operation: Operation) -> List[dict]:
+        intent = {'op': 'intent', 'id': operation.id, 'source': str(operation.source),
+                  'file': str(operation.file), 'destination': str(operation.destination)}
+        # Journals written before routes were recorded have neither of them
+        if operation.route is not None:
+            intent['route'] = operation.route
+        if operation.mode is not None:
+            intent['mode'] = operation.mode
+
+        records = [intent]
+        if operation.stored:
+            records.append({'op': 'stored', 'id': operation.id})
+        return records
+
+    @staticmethod
+    def _encode(record: dict) -> str:
+        return json.dumps(record, separators=(',', ':')) + "\n"
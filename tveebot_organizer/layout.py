@@ -0,0 +1,90 @@
+import re
+import string
+from typing import Optional, Tuple
+
+from tveebot_organizer.dataclasses import Episode, TVShow
+
+# Layout used by the library until it became configurable
+DEFAULT_PATTERN = '{show}/Season {season:02d}'
+
+
+class Layout:
+    """
+    The layout determines the directory where each episode is stored, relative to the library.
+    It is defined by a pattern, in the format string syntax, such as '{show}/Season {season:02d}'.
+    Directories are separated by '/'.
+
+    The pattern must include both the tv show, as '{show}', and the season, as '{season}', so
+    that the tv show and the season of an episode can be told back from its directory.
+    """
+
+    # Regular expression matching the value of each field of a pattern
+    _field_patterns = {
+        'show': r'[^/]+',
+        'season': r'\d+',
+    }
+
+    def __init__(self, pattern: str = DEFAULT_PATTERN):
+        """
+        :param pattern:    the pattern of the episode directories
+        :raise ValueError: if the pattern is not valid
+        """
+        self.pattern = pattern
+
+        regex = []
+        fields = set()
+        try:
+            for literal, field, spec, conversion in string.Formatter().parse(pattern):
+                regex.append(re.escape(literal))
+                if field is None:
+                    continue
+
+                if field not in self._field_patterns:
+                    raise ValueError(f"unknown field '{field}' in layout '{pattern}'")
+
+                if field in fields:
+                    regex.append(f'(?P={field})')
+                else:
+                    regex.append(f'(?P<{field}>{self._field_patterns[field]})')
+                    fields.add(field)
+
+            # Make sure the format spec of each field is valid
+            sample = self.episode_dir(Episode(TVShow("Show"), season=1, number=1))
+        except (KeyError, IndexError) as error:
+            raise ValueError(f"invalid layout '{pattern}': {error}") from None
+
+        if fields != set(self._field_patterns):
+            raise ValueError(f"layout '{pattern}' must include both {{show}} and {{season}}")
+
+        components = sample.split('/')
+        if pattern.startswith('/') or any(component in ('', '.', '..')
+                                          for component in components):
+            raise ValueError(f"layout '{pattern}' must be a relative path without '.' or '..'")
+
+        self.depth = len(components)
+        self._regex = re.compile(''.join(regex) + r'\Z')
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Layout) and self.pattern == other.pattern
+
+    def __hash__(self) -> int:
+        return hash(self.pattern)
+
+    def __repr__(self) -> str:
+        return f"Layout({self.pattern!r})"
+
+    def episode_dir(self, episode: Episode) -> str:
+        """ Returns the directory of *episode*, relative to the library, separated by '/' """
+        return self.pattern.format(show=episode.tvshow.name, season=episode.season)
+
+    def parse(self, directory: str) -> Optional[Tuple[TVShow, int]]:
+        """
+        Tells the tv show and the season of the episodes in *directory*.
+
+        :param directory: a directory relative to the library, separated by '/'
+        :return: the tv show and the season, or None if *directory* does not follow the layout
+        """
+        match = self._regex.match(directory)
+        if match is None:
+            return None
+        return TVShow(match.group('show')), int(match.group('season'))
@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from tveebot_organizer.dataclasses import Episode, TVShow
+from tveebot_organizer.filter import Filter
+from tveebot_organizer.layout import Layout
+from tveebot_organizer.matcher import Matcher
+
+logger = logging.getLogger('libraryIndex')
+
+# Version of the snapshot format, snapshots with a different version are ignored
+SNAPSHOT_VERSION = 1
+
+
+class LibraryIndex:
+    """
+    The library index keeps track of the episodes included in the library. It is used by the
+    *StorageManager* to tell whether the library already includes an episode without touching the
+    filesystem.
+
+    The index is built by scanning the library directory once. It can be saved to a snapshot file
+    and loaded back from it. When loading a snapshot, only the season directories which changed
+    since the snapshot was saved are scanned again.
+    """
+
+    def __init__(self, library_dir: Path, matcher: Matcher = None, layout: Layout = None,
+                 filter: Filter = None):
+        """
+        Initializes an empty index for the library in *library_dir*.
+
+        :param library_dir: the library directory
+        :param matcher:     matcher used to find the episode number from the name of each file
+        :param layout:      layout of the library, which tells the season directories apart
+        :param filter:      filter telling the episode files apart, which should be the same
+                            filter the episode files were stored by
+        """
+        self.library_dir = library_dir
+        self.matcher = matcher or Matcher()
+        self.layout = layout or Layout()
+        self.filter = filter or Filter()
+        self._episodes: Dict[Episode, Path] = {}
+
+        # Maps each season directory, relative to the library, to its modification time
+        self._season_dirs: Dict[str, int] = {}
+
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._episodes)
+
+    def __contains__(self, episode: Episode) -> bool:
+        with self._lock:
+            return episode in self._episodes
+
+    def get(self, episode: Episode) -> Optional[Path]:
+        """ Returns the path to the file of *episode* or None if the index does not include it """
+        with self._lock:
+            return self._episodes.get(episode)
+
+    def items(self) -> List[Tuple[Episode, Path]]:
+        """ Lists every episode in the index along with the path to its file """
+        with self._lock:
+            return list(self._episodes.items())
+
+    def tvshows(self) -> Set[TVShow]:
+        """ Returns the tv shows with at least one episode in the index """
+        with self._lock:
+            return {episode.tvshow for episode in self._episodes}
+
+    def add(self, episode: Episode, path: Path) -> bool:
+        """
+        Adds *episode*, stored in *path*, to the index, unless the index already includes it.
+
+        :return: True if the episode was added and False if the index already included it.
+        """
+        with self._lock:
+            if episode in self._episodes:
+                return False
+
+            self._episodes[episode] = path
+            return True
+
+    def remove(self, episode: Episode):
+        """ Removes *episode* from the index, if the index includes it """
+        with self._lock:
+            self._episodes.pop(episode, None)
+
+    def scan(self):
+        """ Rebuilds the index from scratch by scanning the whole library directory """
+        episodes = {}
+        season_dirs = {}
+        for season_dir, tvshow, season, mtime_ns in self._season_dir_entries():
+            season_dirs[season_dir] = mtime_ns
+            episodes.update(self._scan_season_dir(season_dir, tvshow, season))
+
+        with self._lock:
+            self._episodes = episodes
+            self._season_dirs = season_dirs
+
+        logger.info(f"indexed {len(episodes)} episodes")
+
+    def move(self, library_dir: Path):
+        """
+        Rebuilds the index for the library in another directory, *library_dir*. The new library
+        is scanned before switching to it, so that the index keeps telling the episodes of the
+        old library meanwhile.
+        """
+        index = LibraryIndex(library_dir, self.matcher, self.layout, self.filter)
+        index.scan()
+
+        with self._lock:
+            self.library_dir = library_dir
+            self._episodes = index._episodes
+            self._season_dirs = index._season_dirs
+
+    def load(self, snapshot: Path):
+        """
+        Builds the index from a *snapshot* file. Only the season directories which were modified
+        since the snapshot was saved are scanned. If the snapshot can not be used, then the whole
+        library is scanned.
+        """
+        try:
+            with open(snapshot) as file:
+                data = json.load(file)
+
+            if data['version'] != SNAPSHOT_VERSION or data['library'] != str(self.library_dir):
+                raise ValueError("snapshot does not match library")
+
+            saved_dirs = data['dirs']
+        except FileNotFoundError:
+            logger.info(f"index snapshot was not found: {snapshot}")
+            self.scan()
+            return
+        except (ValueError, KeyError, TypeError) as error:
+            logger.warning(f"ignored index snapshot '{snapshot}': {error}")
+            self.scan()
+            return
+
+        episodes = {}
+        season_dirs = {}
+        scanned = 0
+        for season_dir, tvshow, season, mtime_ns in self._season_dir_entries():
+            season_dirs[season_dir] = mtime_ns
+
+            saved = saved_dirs.get(season_dir)
+            if saved is not None and saved[0] == mtime_ns:
+                # Nothing was added or removed since the snapshot was saved
+                for number, name in saved[1].items():
+                    episode = Episode(tvshow, season, int(number))
+                    episodes[episode] = self.library_dir / season_dir / name
+            else:
+                episodes.update(self._scan_season_dir(season_dir, tvshow, season))
+                scanned += 1
+
+        with self._lock:
+            self._episodes = episodes
+            self._season_dirs = season_dirs
+
+        logger.info(f"indexed {len(episodes)} episodes "
+                    f"({scanned} season directories changed since the snapshot)")
+
+    def save(self, snapshot: Path):
+        """
+        Saves the index to a *snapshot* file. The snapshot is written to a temporary file first
+        and then renamed, so an interrupted save never corrupts a previous snapshot.
+
+        Each season directory is saved with the modification time it had when it was scanned.
+        Thus, season directories modified afterwards, including by storing episodes, are scanned
+        again when the snapshot is loaded.
+        """
+        with self._lock:
+            dirs = {season_dir: [mtime_ns, {}]
+                    for season_dir, mtime_ns in self._season_dirs.items()}
+            for episode, path in self._episodes.items():
+                season_dir = str(path.parent.relative_to(self.library_dir))
+                dirs.setdefault(season_dir, [0, {}])[1][str(episode.number)] = path.name
+
+        data = {'version': SNAPSHOT_VERSION, 'library': str(self.library_dir), 'dirs': dirs}
+
+        temporary = snapshot.with_name(f".{snapshot.name}.tmp")
+        with open(temporary, 'w') as file:
+            json.dump(data, file, separators=(',', ':'))
+        os.replace(temporary, snapshot)
+
+    def _season_dir_entries(self) -> Iterator[Tuple[str, TVShow, int, int]]:
+        """
+        Lists every season directory in the library, that is, every directory following the
+        layout. Yields the path of the season directory relative to the library, the tv show, the
+        season number, and the modification time.
+        """
+        # Directories are listed level by level, down to the depth of the layout
+        level = [('', str(self.library_dir))]
+        for depth in range(self.layout.depth):
+            next_level = []
+            for relative_path, path in level:
+                try:
+                    with os.scandir(path) as entries:
+                        for entry in entries:
+                            if entry.is_dir() and not entry.name.startswith('.'):
+                                next_level.append((f"{relative_path}{entry.name}/", entry.path))
+                except FileNotFoundError:
+                    if depth == 0:
+                        logger.warning(f"library directory was not found: {self.library_dir}")
+                    continue
+
+            level = next_level
+
+        for relative_path, path in level:
+            parsed = self.layout.parse(relative_path[:-1])
+            if parsed is not None:
+                tvshow, season = parsed
+                yield relative_path[:-1].replace('/', os.sep), tvshow, season, \
+                    os.stat(path).st_mtime_ns
+
+    def _scan_season_dir(self, season_dir: str, tvshow: TVShow, season: int) \
+            -> Dict[Episode, Path]:
+        episodes = {}
+        with os.scandir(self.library_dir / season_dir) as entries:
+            for entry in entries:
+                # Hidden files include the temporary files of episodes being stored
+                if entry.name.startswith('.') or not self.filter.is_video(Path(entry.path)):
+                    continue
+
+                try:
+                    matched_episodes = self.matcher.match_all(os.path.splitext(entry.name)[0])
+                except ValueError:
+                    logger.debug(f"ignored '{entry.name}': could not match it to an episode")
+                    continue
+
+                # A multi-episode file includes all of its episodes
+                for matched_episode in matched_episodes:
+                    episodes[Episode(tvshow, season, matched_episode.number)] = Path(entry.path)
+
+        return episodes
@@ -1,6 +1,8 @@
 import re
+from typing import List, Tuple
 
 from tveebot_organizer.dataclasses import Episode, TVShow
+from tveebot_organizer.normalizer import Normalizer
 
 
 class Matcher:
@@ -12,13 +14,46 @@ class Matcher:
     Supported formats:
 
     - TV.Show.Name.S01E02.720p -> Episode("TV Show Name", season=1, number=2)
+    - TV.Show.Name.1x02.720p -> Episode("TV Show Name", season=1, number=2)
+    - TV.Show.Name.S01E02E03.720p -> Episode("TV Show Name", season=1, number=2)
+    - TV.Show.Name.2017.03.21.720p -> Episode("TV Show Name", season=2017, number=321)
 
+    Words may be separated by dots, spaces, underscores or dashes. Multi-episode names match
+    their first episode, use *match_all()* to get every episode. Date-based names match an
+    episode whose season is the year and whose number is the month and day in the form MMDD.
+
+    The words before the episode pattern are turned into a tv show by a *Normalizer*.
     """
 
-    # An episode pattern corresponds to a 'word' of the form S01E01
-    # Where S01 indicates the episode corresponds to season 1
-    # and E01 indicates the episode is the first episode of the season
-    _episode_pattern = re.compile('S(?P<season>\d+)E(?P<number>\d+)\Z')
+    def __init__(self, normalizer: Normalizer = None):
+        """
+        Initializes the matcher.
+
+        :param normalizer: used to map release names to tv shows. By default, a normalizer
+                           without aliases is used.
+        """
+        self.normalizer = normalizer or Normalizer()
+
+    # Characters which divide words
+    _separators = '._ -'
+
+    # All supported formats are combined into a single pattern, so each name is scanned only once.
+    # An episode pattern must start and end at word boundaries.
+    _episode_pattern = re.compile(r"""
+        (?<![^{sep}])
+        (?:
+            # S01E02, which may be followed by more episodes: S01E02E03 or S01E02-E03
+            [Ss](?P<season>\d{{1,4}})[Ee](?P<number>\d{{1,4}})(?:-?[Ee](?P<last_number>\d{{1,4}}))*
+        |
+            # 1x02
+            (?P<x_season>\d{{1,2}})[Xx](?P<x_number>\d{{2,3}})
+        |
+            # 2017.03.21, with the same separator between the year, month, and day
+            (?P<year>(?:19|20)\d\d)(?P<date_sep>[{sep}])
+            (?P<month>0[1-9]|1[0-2])(?P=date_sep)(?P<day>0[1-9]|[12]\d|3[01])
+        )
+        (?![^{sep}])
+    """.format(sep=re.escape(_separators)), re.VERBOSE)
 
     def match(self, name: str) -> Episode:
         """
@@ -29,28 +64,38 @@ class Matcher:
 
         :raise ValueError: if it can not match *name* to an episode
         """
-        # The character '.' divides words
-        # Take each word
-        words = name.split('.')
-
-        # Look for an episode pattern
-        episode = None
-        for index, word in enumerate(words):
-
-            match = self._episode_pattern.match(word)
-            if match:
-                # The words before the episode pattern compose the tv show name.
-                tvshow_name = " ".join(words[:index])
+        tvshow, season, first_number, _ = self._match(name)
+        return Episode(tvshow, season, first_number)
 
-                # Capitalize the first letter of each word of the tvshow name
-                tvshow_name = tvshow_name.title()
-
-                season = int(match.group('season'))
-                number = int(match.group('number'))
-
-                episode = Episode(TVShow(tvshow_name), season, number)
+    def match_all(self, name: str) -> List[Episode]:
+        """
+        Like *match()*, but returns every episode included in *name*. Multi-episode names, such as
+        TV.Show.Name.S01E02E03, include more than one episode.
 
-        if episode is None:
+        :raise ValueError: if it can not match *name* to an episode
+        """
+        tvshow, season, first_number, last_number = self._match(name)
+        return [Episode(tvshow, season, number)
+                for number in range(first_number, max(first_number, last_number) + 1)]
+
+    def _match(self, name: str) -> Tuple[TVShow, int, int, int]:
+        """ Returns the tv show, the season, and the first and last episode numbers in *name* """
+        match = self._episode_pattern.search(name)
+        if match is None:
             raise ValueError(f"could not match name '{name}' to an episode")
 
-        return episode
+        season, number, last_number, x_season, x_number, year, _, month, day = match.groups()
+
+        # The words before the episode pattern compose the tv show name.
+        tvshow = self.normalizer.normalize(name[:match.start()])
+
+        if season is not None:
+            first_number = int(number)
+            last_number = first_number if last_number is None else int(last_number)
+            return tvshow, int(season), first_number, last_number
+        elif x_season is not None:
+            number = int(x_number)
+            return tvshow, int(x_season), number, number
+        else:
+            number = int(month) * 100 + int(day)
+            return tvshow, int(year), number, number
@@ -0,0 +1,270 @@
+"""
+Instrumentation of the organizer daemon.
+
+Components record counters and latency histograms in a *Metrics* registry. The registry can be
+exposed through a local HTTP endpoint, in the Prometheus text format, or periodically written to
+a stats file, in JSON.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger('metrics')
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0,
+                   300.0)
+
+# Labels are stored as a sorted tuple of (name, value) pairs
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters, histograms, and gauges.
+
+    Counters and histograms are created the first time they are updated. Gauges are functions
+    called every time the metrics are rendered, such as one returning the size of a queue.
+    """
+
+    def __init__(self, namespace: str = 'tveebot_organizer',
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(sorted(buckets))
+
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help: str):
+        """ Sets the help text of the metric *name* """
+        self._help[name] = help
+
+    def inc(self, name: str, amount: float = 1, **labels: str):
+        """ Increments the counter *name* by *amount* """
+        key = self._labels(labels)
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels: str):
+        """ Records *value* in the histogram *name* """
+        key = self._labels(labels)
+        with self._lock:
+            histogram = self._histograms.setdefault(name, {}).get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = _Histogram(self.buckets)
+
+            histogram.counts[bisect_left(self.buckets, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    @contextmanager
+    def time(self, name: str, **labels: str) -> Iterator[None]:
+        """ Records the time, in seconds, spent inside the *with* block in the histogram *name* """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name: str, function: Callable[[], float], help: str = None):
+        """ Registers a gauge whose value is obtained by calling *function* """
+        self._gauges[name] = function
+        if help is not None:
+            self.describe(name, help)
+
+    def counter_value(self, name: str, **labels: str) -> float:
+        """ Returns the current value of the counter *name* """
+        with self._lock:
+            return self._counters.get(name, {}).get(self._labels(labels), 0)
+
+    def render(self) -> str:
+        """ Renders every metric in the Prometheus text exposition format """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full_name = self._full_name(name)
+                self._header(lines, name, full_name, 'counter')
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{full_name}{self._format_labels(labels)} {value:g}")
+
+            for name, series in sorted(self._histograms.items()):
+                full_name = self._full_name(name)
+                self._header(lines, name, full_name, 'histogram')
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+                    for bound, count in zip(bounds, histogram.counts):
+                        cumulative += count
+                        bucket_labels = self._format_labels(labels + (('le', bound),))
+                        lines.append(f"{full_name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{full_name}_sum{self._format_labels(labels)} {histogram.sum:g}")
+                    lines.append(f"{full_name}_count{self._format_labels(labels)} "
+                                 f"{histogram.count}")
+
+        for name, value in sorted(self._gauge_values().items()):
+            full_name = self._full_name(name)
+            self._header(lines, name, full_name, 'gauge')
+            lines.append(f"{full_name} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """ Returns the current value of every metric as a JSON serializable dictionary """
+        with self._lock:
+            counters = {name: {self._format_labels(labels) or 'total': value
+                               for labels, value in series.items()}
+                        for name, series in self._counters.items()}
+            histograms = {name: {self._format_labels(labels) or 'total': {
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'],
+                                    histogram.counts)),
+            } for labels, histogram in series.items()} for name, series in self._histograms.items()}
+
+        return {
+            'timestamp': time.time(),
+            'counters': counters,
+            'histograms': histograms,
+            'gauges': self._gauge_values(),
+        }
+
+    def _gauge_values(self) -> Dict[str, float]:
+        values = {}
+        for name, function in list(self._gauges.items()):
+            try:
+                values[name] = function()
+            except Exception:
+                logger.exception(f"failed to read gauge '{name}'")
+        return values
+
+    def _full_name(self, name: str) -> str:
+        return f"{self.namespace}_{name}" if self.namespace else name
+
+    def _header(self, lines: List[str], name: str, full_name: str, kind: str):
+        if name in self._help:
+            lines.append(f"# HELP {full_name} {self._help[name]}")
+        lines.append(f"# TYPE {full_name} {kind}")
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> Labels:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    @staticmethod
+    def _format_labels(labels: Labels) -> str:
+        if not labels:
+            return ""
+
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for _, value in labels)
+        return "{" + ",".join(f'{name}="{value}"'
+                              for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class MetricsServer:
+    """
+    Serves the metrics, in the Prometheus text format, over HTTP on a local address. The metrics
+    are available in the '/metrics' path.
+    """
+
+    def __init__(self, metrics: Metrics, port: int, host: str = '127.0.0.1'):
+        metrics_ = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = metrics_.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        """ Starts serving requests in a background thread """
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server",
+                                        daemon=True)
+        self._thread.start()
+        host = self._server.server_address[0]
+        logger.info(f"serving metrics on http://{host}:{self.port}/metrics")
+
+    def shutdown(self):
+        """ Stops serving requests """
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class StatsFileWriter:
+    """ Periodically writes a JSON snapshot of the metrics to a file """
+
+    def __init__(self, metrics: Metrics, path: Path, interval: float = 10):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """ Starts writing the stats file in a background thread """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stats-writer", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """ Stops writing the stats file, after writing it one last time """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write(self):
+        """ Writes the stats file. The file is replaced atomically, readers never see it partial """
+        temporary = self.path.with_name(f".{self.path.name}.tmp")
+        with open(temporary, 'w') as file:
+            json.dump(self.metrics.snapshot(), file, indent=2)
+        os.replace(temporary, self.path)
+
+    def _run(self):
+        while True:
+            stopping = self._stop.wait(self.interval)
+            try:
+                self.write()
+            except OSError as error:
+                logger.error(f"failed to write stats file: {error}")
+
+            if stopping:
+                return
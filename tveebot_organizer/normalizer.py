@@ -0,0 +1,186 @@
+import configparser
+import logging
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from tveebot_organizer.dataclasses import TVShow
+
+logger = logging.getLogger('normalizer')
+
+
+class Normalizer:
+    """
+    The normalizer is used by the *Matcher* to turn the words preceding the episode pattern in a
+    release name into a tv show. Releases of the same tv show often spell its name differently,
+    such as 'Its.Always.Sunny' and 'It's.Always.Sunny'. The normalizer maps all of them to the
+    same canonical tv show, so that the library does not end up with multiple directories for the
+    same tv show.
+
+    Names are compared by their key, which ignores case, accents, punctuation, and the dots inside
+    acronyms. Names without any letter or digit have an empty key, and are never mapped to
+    another name. A key is mapped to a canonical name by, in order:
+
+    - the alias table, which maps release names to canonical names;
+    - the names of the tv shows already known, such as the ones in the library;
+    - the release name itself, with the first letter of each word capitalized. This name
+      becomes the canonical name of the tv show from then on.
+
+    Normalized names are cached, which means repeated releases of the same tv show cost a single
+    dictionary lookup.
+    """
+
+    # Characters which divide words
+    _separators = '._ -'
+
+    # Translates every separator to a space
+    _to_spaces = str.maketrans(_separators, ' ' * len(_separators))
+
+    # Letters and digits of any script, underscores are separators
+    _word_pattern = re.compile(r"[^\W_]+")
+
+    def __init__(self, aliases: Dict[str, str] = None, cache_size: int = 1024):
+        """
+        Initializes the normalizer.
+
+        :param aliases:    maps release names to canonical tv show names
+        :param cache_size: maximum number of normalized names kept in the cache
+        """
+        self._canonical_names: Dict[str, str] = {}
+        self._aliases: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        self._cached_normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+        for alias, name in (aliases or {}).items():
+            self.add_alias(alias, name)
+
+    @classmethod
+    def from_file(cls, path: Path, cache_size: int = 1024) -> 'Normalizer':
+        """
+        Creates a normalizer with the alias table in *path*. The alias table is an INI file with
+        an *aliases* section, in which each option maps a release name to a canonical name:
+
+            [aliases]
+            Marvels Agents of SHIELD = Marvel's Agents of S.H.I.E.L.D.
+
+        :raise FileNotFoundError: if *path* does not exist
+        :raise ValueError:        if *path* is not a valid alias table
+        """
+        parser = configparser.ConfigParser(delimiters=('=',), interpolation=None)
+        parser.optionxform = str
+
+        try:
+            with open(path) as file:
+                parser.read_file(file)
+        except configparser.Error as error:
+            raise ValueError(f"invalid alias table '{path}': {error}")
+
+        aliases = dict(parser['aliases']) if parser.has_section('aliases') else {}
+        logger.info(f"loaded {len(aliases)} tv show aliases")
+
+        return cls(aliases, cache_size)
+
+    @classmethod
+    def key(cls, name: str) -> str:
+        """
+        Computes the key of a tv show *name*. Names with the same key correspond to the same tv
+        show. For example, "Marvel's Agents of S.H.I.E.L.D." and "marvels.agents.of.shield"
+        have the same key, and so do "Élite" and "Elite".
+        """
+        # Accents are split from their letters and dropped
+        decomposed = unicodedata.normalize('NFKD', name).casefold()
+        name = "".join(char for char in decomposed if not unicodedata.combining(char))
+        words = cls._word_pattern.findall(name.replace("'", ""))
+        return " ".join(cls._join_acronyms(words, separator=""))
+
+    def add_alias(self, alias: str, name: str):
+        """ Maps release names with the same key as *alias* to the tv show *name* """
+        with self._lock:
+            if self.key(alias):
+                self._aliases[self.key(alias)] = name
+            if self.key(name):
+                self._aliases.setdefault(self.key(name), name)
+        self._cached_normalize.cache_clear()
+
+    def add_known_names(self, names: Iterable[str]):
+        """
+        Adds the names of tv shows which are already known, such as the ones in the library.
+        Release names with the same key as a known name are mapped to that name.
+        """
+        with self._lock:
+            for name in names:
+                if self.key(name):
+                    self._canonical_names.setdefault(self.key(name), name)
+        self._cached_normalize.cache_clear()
+
+    def set_known_names(self, names: Iterable[str]):
+        """
+        Replaces the names of the tv shows known so far with *names*, such as when the library
+        changes. Canonical names taken from release names are forgotten as well.
+        """
+        canonical_names = {}
+        for name in names:
+            if self.key(name):
+                canonical_names.setdefault(self.key(name), name)
+
+        with self._lock:
+            self._canonical_names = canonical_names
+        self._cached_normalize.cache_clear()
+
+    def normalize(self, raw_name: str) -> TVShow:
+        """
+        Takes the words preceding the episode pattern in a release name, such as
+        'Its.Always.Sunny.', and returns the corresponding canonical tv show.
+        """
+        return self._cached_normalize(raw_name)
+
+    def _normalize(self, raw_name: str) -> TVShow:
+        key = self.key(raw_name)
+
+        with self._lock:
+            name = self._aliases.get(key) or self._canonical_names.get(key)
+
+        if name is None:
+            words = raw_name.translate(self._to_spaces).split()
+            name = " ".join(self._join_acronyms([self._capitalize(word) for word in words]))
+
+            # The first spelling of a tv show becomes its canonical name. Names with an empty key
+            # tell nothing about the tv show, so they are never merged with another.
+            if key:
+                with self._lock:
+                    name = self._canonical_names.setdefault(key, name)
+
+        return TVShow(name)
+
+    @staticmethod
+    def _capitalize(word: str) -> str:
+        """ Capitalizes the first letter of *word* and lowers the others """
+        return word[:1].upper() + word[1:].lower()
+
+    @staticmethod
+    def _join_acronyms(words: List[str], separator: str = ".") -> List[str]:
+        """
+        Joins sequences of two or more single letter words into a single word, such as
+        ['S', 'H', 'I', 'E', 'L', 'D'] into 'S.H.I.E.L.D.'
+        """
+        joined = []
+        letters = []
+        for word in words + [""]:
+            if len(word) == 1 and word.isalpha():
+                letters.append(word.upper() if separator else word)
+                continue
+
+            if len(letters) > 1:
+                joined.append(separator.join(letters) + separator)
+            else:
+                joined.extend(letters)
+            letters = []
+
+            if word:
+                joined.append(word)
+
+        return joined
@@ -1,10 +1,19 @@
+import functools
 import logging
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
 
+from tveebot_organizer import transfer
+from tveebot_organizer.cleaner import Cleaner
+from tveebot_organizer.dataclasses import Episode, PlanEntry
 from tveebot_organizer.filter import Filter
+from tveebot_organizer.journal import Journal, Operation
 from tveebot_organizer.matcher import Matcher
+from tveebot_organizer.metrics import Metrics
+from tveebot_organizer.retry_queue import RetryQueue
 from tveebot_organizer.storage_manager import StorageManager, EpisodeExists
 
 logger = logging.getLogger('organizer')
@@ -13,44 +22,99 @@ logger = logging.getLogger('organizer')
 class Organizer:
     """
     The organizer is the central component of the application.
+
+    The organizer records the time spent in each stage of organizing an episode (filter, match,
+    store, and cleanup), the result of each organize operation, and the number of bytes stored in
+    a *Metrics* registry.
+
+    When given a *Journal*, the organizer records each episode it stores in it, so that an
+    operation interrupted by a crash can be recovered by *recover()* on the next start.
+
+    When given a *Cleaner*, what is left in the watch directory after storing an episode is
+    removed in the background, instead of before returning.
+
+    A directory with the episode files of several episodes, such as a season pack, is organized
+    in one pass: each episode file is matched by its own name, the episodes are stored as a batch,
+    and the directory is only removed once every episode is in the library.
+
+    When given a *RetryQueue*, paths whose episode failed to be stored, for instance, because the
+    library was unmounted or the disk was full, are put in it to be organized again later.
     """
 
-    def __init__(self, filter: Filter, matcher: Matcher, storage_manager: StorageManager):
+    def __init__(self, filter: Filter, matcher: Matcher, storage_manager: StorageManager,
+                 metrics: Metrics = None, journal: Journal = None, cleaner: Cleaner = None,
+                 retry_queue: RetryQueue = None, route: str = None):
         """
-        Initializes the organizer. It takes all necessary components to setup the service.
+        Initializes the organizer. It takes all necessary components to setup the service. The
+        name of its *route* is recorded in the journal, for the operations to be recovered by
+        the organizer of the same route.
         """
         super().__init__()
+        self.route = route
         self.filter = filter
         self.matcher = matcher
         self.storage_manager = storage_manager
+        self.metrics = metrics or Metrics()
+        self.journal = journal
+        self.cleaner = cleaner
+        self.retry_queue = retry_queue
+
+        self.metrics.describe('stage_seconds', "Time spent in each stage of organizing a path.")
+        self.metrics.describe('organized_total', "Paths organized, by result.")
+        self.metrics.describe('stored_bytes_total', "Bytes of episode files stored in the library.")
 
     def organize(self, path: Path):
         """
         Organizes one episode.
 
         Takes a *path* to a file or a directory, matches with an episode, and stores it in a
-        library.
+        library. Directories holding several episodes are organized as season packs.
         """
+        if self.cleaner is not None and path in self.cleaner:
+            logger.debug(f"ignored '{path.name}': it is being cleared")
+            return
+
         logger.debug("looking for episode file...")
-        episode_file = self.filter.find_episode_file(path)
+        with self.metrics.time('stage_seconds', stage='filter'):
+            episode_files = self.filter.find_episode_files(path)
 
-        if episode_file is None:
+        if not episode_files:
             logger.info(f"ignored '{path.name}'")
+            self.metrics.inc('organized_total', result='ignored')
             return
 
+        if len(episode_files) > 1:
+            with self.metrics.time('stage_seconds', stage='match'):
+                pack = self._match_pack(episode_files)
+
+            if pack is not None:
+                self._organize_pack(path, pack)
+                return
+
+        episode_file = episode_files[0]
         logger.info(f"episode file is '{episode_file.name}'")
 
         try:
             logger.debug("matching episode...")
-            episode = self.matcher.match(path.name)
+            with self.metrics.time('stage_seconds', stage='match'):
+                episode = self.matcher.match(path.name)
             logger.info(f"episode matched to {str(episode)}")
         except ValueError:
             logger.warning(f"ignored '{path.name}': could not match it to an episode")
+            self.metrics.inc('organized_total', result='unmatched')
             return
 
+        operation = None
         try:
             logger.debug("storing episode...")
-            self.storage_manager.store(episode, episode_file)
+            size = episode_file.stat().st_size
+            if self.journal is not None:
+                destination = self.storage_manager.destination(episode, episode_file)
+                operation = self.journal.begin(path, episode_file, destination, self.route,
+                                               self.storage_manager.mode)
+
+            with self.metrics.time('stage_seconds', stage='store'):
+                self.storage_manager.store(episode, episode_file)
 
             episode_dir = self.storage_manager.episode_dir(episode) \
                 .relative_to(self.storage_manager.library_dir)
@@ -58,11 +122,280 @@ class Organizer:
 
         except EpisodeExists as error:
             logger.warning(str(error))
+            self.metrics.inc('organized_total', result='duplicate')
+            self._retried(path)
         except FileNotFoundError as error:
             logger.error(str(error))
+            self.metrics.inc('organized_total', result='error')
+            self._retry(path, error)
         except OSError as error:
             logger.error(f"got unexpected error: {str(error)}")
+            self.metrics.inc('organized_total', result='error')
+            self._retry(path, error)
         else:
-            if os.path.exists(path):
-                shutil.rmtree(str(path))
-                logger.info(f"cleared {path.name} from watch directory")
+            self._retried(path)
+
+            self.metrics.inc('organized_total', result='stored')
+            self.metrics.inc('stored_bytes_total', size)
+
+            # Episode files stored while keeping the source, e.g. hard linked, are left in place
+            if not self.storage_manager.keeps_source:
+                if operation is not None:
+                    self.journal.stored(operation)
+
+                if self.cleaner is not None:
+                    # The operation is finished once the cleaner removes the source
+                    self.cleaner.remove(path, self._finisher(operation))
+                    operation = None
+                else:
+                    with self.metrics.time('stage_seconds', stage='cleanup'):
+                        self._clear(path)
+
+        if operation is not None:
+            self.journal.finish(operation)
+
+    def _match_pack(self, episode_files: List[Path]) -> Optional[List[Tuple[Episode, Path]]]:
+        """
+        Matches each one of the *episode_files* found in a directory by its own name. The
+        directory is a season pack if they match at least two different episodes. Files which
+        do not match an episode, or match the same episode as a larger file, are left out.
+
+        :return: each episode of the season pack with its episode file, or None if the directory
+                 is not a season pack
+        """
+        pack = {}
+        for episode_file in episode_files:
+            try:
+                episode = self.matcher.match(episode_file.name)
+            except ValueError:
+                logger.debug(f"left '{episode_file.name}' out: could not match it to an episode")
+                continue
+
+            # Episode files come largest first
+            pack.setdefault(episode, episode_file)
+
+        return list(pack.items()) if len(pack) > 1 else None
+
+    def _organize_pack(self, path: Path, pack: List[Tuple[Episode, Path]]):
+        """
+        Stores every episode of the season pack in *path* as a batch. The season pack is only
+        removed from the watch directory once every episode was stored. Otherwise, it is left
+        for the episodes which failed to be stored to be organized again. Episodes the library
+        already included are never removed with the pack, since they may not be the same file.
+        """
+        logger.info(f"'{path.name}' is a season pack with {len(pack)} episodes")
+
+        # Each episode file is journaled as its own source, so that recovering from a crash in
+        # the middle of the batch never removes the episode files not stored yet
+        operations = []
+        if self.journal is not None:
+            operations = [self.journal.begin(episode_file, episode_file,
+                                             self.storage_manager.destination(episode,
+                                                                              episode_file),
+                                             self.route, self.storage_manager.mode)
+                          for episode, episode_file in pack]
+
+        logger.debug("storing episodes...")
+        with self.metrics.time('stage_seconds', stage='store'):
+            errors = self.storage_manager.store_batch(pack)
+
+        failure = None
+        for (episode, episode_file), error in zip(pack, errors):
+            if error is None:
+                destination = self.storage_manager.destination(episode, episode_file)
+                episode_dir = destination.parent.relative_to(self.storage_manager.library_dir)
+                logger.info(f"stored {episode_file.name} to {episode_dir}")
+                self.metrics.inc('organized_total', result='stored')
+                self.metrics.inc('stored_bytes_total', destination.stat().st_size)
+            elif isinstance(error, EpisodeExists):
+                logger.warning(f"{episode_file.name}: {error}")
+                self.metrics.inc('organized_total', result='duplicate')
+            else:
+                logger.error(f"failed to store {episode_file.name}: {error}")
+                self.metrics.inc('organized_total', result='error')
+                failure = failure or error
+
+        if failure is not None:
+            self._retry(path, failure)
+        else:
+            self._retried(path)
+
+        if failure is None and any(error is not None for error in errors):
+            logger.info(f"kept '{path.name}': the library already included some episodes")
+
+        if any(error is not None for error in errors) or self.storage_manager.keeps_source:
+            self._finish(operations)
+            return
+
+        for operation, error in zip(operations, errors):
+            if error is None:
+                self.journal.stored(operation)
+
+        if self.cleaner is not None:
+            # The operations are finished once the cleaner removes the season pack
+            self.cleaner.remove(path, self._finisher(*operations))
+        else:
+            with self.metrics.time('stage_seconds', stage='cleanup'):
+                self._clear(path)
+            self._finish(operations)
+
+    def plan(self, paths: Iterable[Path], workers: int = 1) -> List[PlanEntry]:
+        """
+        Determines what organizing each one of the *paths* would do, without changing anything.
+        The filter and the matcher run for several paths concurrently, which pays off mostly
+        while the filter waits for the filesystem.
+
+        A path is planned to be stored unless it would be ignored by the filter, could not be
+        matched to an episode, or is a duplicate. Paths which can not be read, or are neither
+        files nor directories, are ignored. A duplicate is an episode already included in
+        the library or planned for a previous path. Season packs get one plan for each of their
+        episodes.
+
+        :param paths:   the paths to plan for, usually the entries of a watch directory
+        :param workers: number of paths planned concurrently
+        :return: the plan of each path, in the same order as *paths*
+        """
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plan-worker") as executor:
+            entries = [entry for path_entries in executor.map(self._plan, paths)
+                       for entry in path_entries]
+
+        # Only the first path of each episode would be stored, the others are duplicates
+        planned = set()
+        for index, entry in enumerate(entries):
+            if entry.status == 'store':
+                if entry.episode in planned:
+                    entries[index] = entry._replace(status='duplicate')
+                planned.add(entry.episode)
+
+        return entries
+
+    def _plan(self, path: Path) -> List[PlanEntry]:
+        try:
+            episode_files = self.filter.find_episode_files(path)
+        except (ValueError, OSError) as error:
+            # Such as broken symlinks, fifos, and paths removed while planning
+            logger.warning(f"ignored '{path.name}': {error}")
+            return [PlanEntry(path, 'ignored')]
+
+        if not episode_files:
+            return [PlanEntry(path, 'ignored')]
+
+        pack = self._match_pack(episode_files) if len(episode_files) > 1 else None
+        if pack is not None:
+            return [self._plan_episode(path, episode_file, episode)
+                    for episode, episode_file in pack]
+
+        try:
+            episode = self.matcher.match(path.name)
+        except ValueError:
+            return [PlanEntry(path, 'unmatched', episode_files[0])]
+
+        return [self._plan_episode(path, episode_files[0], episode)]
+
+    def _plan_episode(self, path: Path, episode_file: Path, episode: Episode) -> PlanEntry:
+        destination = self.storage_manager.destination(episode, episode_file)
+        if self.storage_manager.includes(episode, episode_file):
+            return PlanEntry(path, 'duplicate', episode_file, episode, destination)
+
+        return PlanEntry(path, 'store', episode_file, episode, destination)
+
+    def recover(self, operations: List[Operation]):
+        """
+        Recovers the *operations* left unfinished by a previous run, as read from the journal.
+
+        Partial copies of episode files are removed from the library. If the episode file made it
+        to the library, what is left of its source is removed from the watch directory. Otherwise,
+        the source is left in the watch directory to be organized again. Sources are never
+        removed if the operation was stored with a mode keeping them, or, for operations
+        journaled without their mode, if the storage manager keeps them.
+
+        Each operation should be recovered by the organizer of its route, see *recover_routes()*.
+        """
+        for operation in operations:
+            if operation.mode is not None:
+                keeps_source = operation.mode != 'move'
+            else:
+                keeps_source = self.storage_manager.keeps_source
+
+            try:
+                temporary = transfer.temporary_path(operation.destination)
+                if os.path.lexists(temporary):
+                    os.remove(temporary)
+                    logger.info(f"removed partial copy of '{operation.file.name}' from library")
+
+                if not keeps_source and self._stored(operation):
+                    self._clear(operation.source)
+
+            except OSError as error:
+                logger.error(f"failed to recover '{operation.source.name}': {error}")
+            else:
+                self.journal.finish(operation.id)
+
+    @staticmethod
+    def _stored(operation: Operation) -> bool:
+        """
+        Determines whether the episode file of an unfinished *operation*, which moves it, made it
+        to the library. A destination which already existed before the operation does not count:
+        only a destination which exists while the episode file was moved away, or which is the
+        episode file itself, linked to the library by a move that stopped before unlinking it.
+        """
+        if operation.stored:
+            return True
+
+        if not os.path.lexists(operation.destination):
+            return False
+        if not os.path.lexists(operation.file):
+            return True
+
+        # Only a move links the episode file to the library before removing it: the other modes
+        # link the destination to the source for good
+        return operation.mode == 'move' and os.path.samefile(operation.file, operation.destination)
+
+    def _retry(self, path: Path, error: OSError):
+        """ Puts *path*, which failed to be stored with *error*, in the retry queue """
+        if self.retry_queue is not None:
+            self.retry_queue.add(path, self.storage_manager.library_dir, error)
+
+    def _retried(self, path: Path):
+        """ Removes *path*, whose episode is in the library now, from the retry queue """
+        if self.retry_queue is not None:
+            self.retry_queue.discard(path)
+
+    def _finisher(self, *operations: Optional[int]) -> Optional[Callable[[], None]]:
+        """ Returns a callback recording the *operations* are finished, if they are journaled """
+        operations = [operation for operation in operations if operation is not None]
+        if not operations:
+            return None
+        return functools.partial(self._finish, operations)
+
+    def _finish(self, operations: List[int]):
+        """ Records the journaled *operations* are finished """
+        for operation in operations:
+            self.journal.finish(operation)
+
+    def _clear(self, path: Path):
+        """ Removes what is left of *path* in the watch directory after storing its episode """
+        if os.path.isdir(path):
+            shutil.rmtree(str(path))
+            logger.info(f"cleared {path.name} from watch directory")
+        elif os.path.lexists(path):
+            os.remove(path)
+            logger.info(f"cleared {path.name} from watch directory")
+
+
+def recover_routes(organizers: List[Organizer], operations: List[Operation]):
+    """
+    Recovers the unfinished *operations* of every route, read from the journal shared by the
+    *organizers*. Each operation is recovered by the organizer of the route which started it.
+    Operations of routes no longer configured, or journaled without their route, are recovered by
+    the first organizer.
+    """
+    routes = {}
+    for operation in operations:
+        organizer = next((organizer for organizer in organizers
+                          if organizer.route is not None and organizer.route == operation.route),
+                         organizers[0])
+        routes.setdefault(id(organizer), (organizer, []))[1].append(operation)
+
+    for organizer, route_operations in routes.values():
+        organizer.recover(route_operations)
@@ -0,0 +1,251 @@
+import collections
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Counter, Dict, List, NamedTuple, Set
+
+from tveebot_organizer import transfer
+from tveebot_organizer.dataclasses import Episode
+from tveebot_organizer.filter import Filter
+from tveebot_organizer.layout import Layout
+from tveebot_organizer.library_index import LibraryIndex
+from tveebot_organizer.matcher import Matcher
+from tveebot_organizer.normalizer import Normalizer
+
+logger = logging.getLogger('relayout')
+
+# Version of the progress file format, progress files with a different version are ignored
+PROGRESS_VERSION = 1
+
+
+class Move(NamedTuple):
+    """ A file to move from one place in the library to another """
+    source: Path
+    destination: Path
+
+
+class Relayout:
+    """
+    The relayout moves every episode file in a library from the directory given by an old layout
+    to the directory given by a new layout. The name of each tv show is also normalized again, so
+    that changes to the aliases apply to the episodes already in the library. Files sharing the
+    name of an episode file, such as subtitles, are moved along with it.
+
+    Files already in the right place are not touched. The other files are renamed concurrently,
+    with a separate set of threads for each device, so that a slow device does not hold back the
+    others. Files are only copied if the new directory is in another device.
+
+    The planned moves and the ones completed are recorded in a progress file. An interrupted
+    relayout resumes from the progress file, without scanning the library again.
+    """
+
+    def __init__(self, library_dir: Path, old_layout: Layout, new_layout: Layout,
+                 normalizer: Normalizer = None, workers_per_device: int = 4,
+                 progress_file: Path = None, filter: Filter = None):
+        """
+        :param library_dir:        the library directory
+        :param old_layout:         layout the library follows now
+        :param new_layout:         layout the library should follow
+        :param normalizer:         normalizer of the tv show names, by default names are kept
+        :param workers_per_device: number of files moved concurrently in each device
+        :param progress_file:      file to record the progress, by default a hidden file inside
+                                   the library directory
+        :param filter:             filter telling the episode files apart
+        :raise ValueError:         if *workers_per_device* is smaller than 1
+        """
+        if workers_per_device < 1:
+            raise ValueError(f"number of workers must be at least 1, got {workers_per_device}")
+
+        self.library_dir = library_dir
+        self.old_layout = old_layout
+        self.new_layout = new_layout
+        self.normalizer = normalizer
+        self.workers_per_device = workers_per_device
+        self.progress_file = progress_file or library_dir / '.tveebot-relayout'
+        self.filter = filter
+
+    def plan(self) -> List[Move]:
+        """
+        Scans the library, following the old layout, and determines the moves needed for it to
+        follow the new layout. Files already in the right place are not included.
+        """
+        index = LibraryIndex(self.library_dir, Matcher(self.normalizer), self.old_layout,
+                             self.filter)
+        index.scan()
+
+        # A multi-episode file is indexed once per episode: it follows its first episode
+        episodes: Dict[Path, Episode] = {}
+        for episode, path in sorted(index.items(), key=lambda item: item[0].number):
+            episodes.setdefault(path, episode)
+
+        if self.normalizer is not None:
+            # Names already in the library stay as they are, unless some alias says otherwise
+            self.normalizer.add_known_names(tvshow.name for tvshow in index.tvshows())
+
+        listings: Dict[Path, List[str]] = {}
+        moves = []
+        sources: Set[Path] = set()
+        for path, episode in sorted(episodes.items()):
+            if self.normalizer is not None:
+                episode = episode._replace(tvshow=self.normalizer.normalize(episode.tvshow.name))
+
+            new_dir = self.library_dir / self.new_layout.episode_dir(episode)
+            if new_dir == path.parent:
+                continue
+
+            if path.parent not in listings:
+                listings[path.parent] = sorted(os.listdir(path.parent))
+
+            # Files named after the episode file, such as subtitles, go along with it
+            prefix = os.path.splitext(path.name)[0] + '.'
+            names = [path.name] + [name for name in listings[path.parent]
+                                   if name.startswith(prefix) and name != path.name]
+
+            for name in names:
+                if path.parent / name not in sources:
+                    sources.add(path.parent / name)
+                    moves.append(Move(path.parent / name, new_dir / name))
+
+        return moves
+
+    def run(self) -> Counter[str]:
+        """
+        Moves every file as planned, resuming from the progress file if there is one. The
+        progress file is removed once every move completed.
+
+        :return: the number of files by outcome: moved, missing, conflict, or failed
+        :raise OSError: if the progress file can not be written
+        """
+        moves, done = self._load_progress()
+        if moves is None:
+            moves, done = self.plan(), set()
+            self._start_progress(moves)
+        else:
+            logger.info(f"resuming relayout: {len(done)} of {len(moves)} files already moved")
+
+        results: Counter[str] = collections.Counter(moved=len(done))
+        pending = [(number, move) for number, move in enumerate(moves) if number not in done]
+        logger.info(f"moving {len(pending)} files...")
+
+        with open(self.progress_file, 'a') as progress:
+            executors: Dict[int, ThreadPoolExecutor] = {}
+            futures = {}
+            try:
+                for number, move in pending:
+                    device = self._device(move.source)
+                    if device not in executors:
+                        executors[device] = ThreadPoolExecutor(
+                            max_workers=self.workers_per_device,
+                            thread_name_prefix=f"relayout-{device}")
+
+                    futures[executors[device].submit(self._move, move)] = number
+
+                for future in as_completed(futures):
+                    result = future.result()
+                    results[result] += 1
+                    if result in ('moved', 'missing'):
+                        progress.write(json.dumps({'done': futures[future]}) + "\n")
+                        progress.flush()
+            finally:
+                for executor in executors.values():
+                    executor.shutdown(wait=True)
+
+        self._remove_empty_dirs(move.source.parent for move in moves)
+
+        if results['conflict'] == 0 and results['failed'] == 0:
+            os.remove(self.progress_file)
+
+        logger.info("relayout finished: " + ", ".join(f"{count} {result}"
+                                                     for result, count in results.items()))
+        return results
+
+    def _move(self, move: Move) -> str:
+        if not os.path.lexists(move.source):
+            if os.path.lexists(move.destination):
+                return 'moved'
+
+            logger.warning(f"file was removed meanwhile: {move.source}")
+            return 'missing'
+
+        try:
+            move.destination.parent.mkdir(parents=True, exist_ok=True)
+            transfer.move(move.source, move.destination)
+        except FileExistsError:
+            logger.warning(f"kept '{move.source}': '{move.destination}' already exists")
+            return 'conflict'
+        except OSError as error:
+            logger.error(f"failed to move '{move.source}': {error}")
+            return 'failed'
+
+        logger.debug(f"moved '{move.source}' to '{move.destination}'")
+        return 'moved'
+
+    def _device(self, path: Path) -> int:
+        try:
+            return os.stat(path.parent).st_dev
+        except OSError:
+            return 0
+
+    def _remove_empty_dirs(self, directories):
+        """ Removes the *directories* left empty, and their parents, up to the library """
+        candidates: Set[Path] = set()
+        for directory in directories:
+            while directory != self.library_dir and self.library_dir in directory.parents:
+                candidates.add(directory)
+                directory = directory.parent
+
+        # Deepest directories first, so that parents are empty by the time they are removed
+        for directory in sorted(candidates, key=lambda path: len(path.parts), reverse=True):
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
+
+    def _start_progress(self, moves: List[Move]):
+        header = {
+            'version': PROGRESS_VERSION,
+            'library': str(self.library_dir),
+            'layout': self.new_layout.pattern,
+            'moves': [[str(move.source), str(move.destination)] for move in moves],
+        }
+        temporary = self.progress_file.with_name(f".{self.progress_file.name}.tmp")
+        with open(temporary, 'w') as file:
+            file.write(json.dumps(header) + "\n")
+        os.replace(temporary, self.progress_file)
+
+    def _load_progress(self):
+        """
+        Loads the moves planned by an interrupted relayout and the moves it completed.
+
+        :return: the moves and the numbers of those completed, or None if there is no progress
+                 to resume
+        """
+        try:
+            with open(self.progress_file) as file:
+                header = json.loads(file.readline())
+                if (header['version'] != PROGRESS_VERSION
+                        or header['library'] != str(self.library_dir)
+                        or header['layout'] != self.new_layout.pattern):
+                    raise ValueError("progress file is from another relayout")
+
+                moves = [Move(Path(source), Path(destination))
+                         for source, destination in header['moves']]
+
+                done = set()
+                for line in file:
+                    try:
+                        done.add(int(json.loads(line)['done']))
+                    except (ValueError, KeyError, TypeError):
+                        # Partially written when the relayout was interrupted
+                        continue
+
+        except FileNotFoundError:
+            return None, None
+        except (ValueError, KeyError, TypeError) as error:
+            logger.warning(f"ignored progress file '{self.progress_file}': {error}")
+            return None, None
+
+        return moves, done
+
@@ -0,0 +1,367 @@
+"""
+Retries of organize operations which failed to store their episode.
+
+Storing an episode fails when the library is removed or unmounted, the disk is full, or a network
+filesystem hiccups. The source is left in the watch directory, but nothing would organize it
+again until the daemon restarts. Instead, the organizer puts the failed path in the retry queue,
+which submits it again later.
+
+Each failure is classified by its error, and each class of errors has its own policy: how many
+times it is retried, and how long to wait before each retry. The delay doubles after each
+attempt, up to a maximum, and is randomized, so that many paths failing at once are not all
+retried at the same time. Paths which failed because their library was unavailable are retried
+all at once as soon as the library is back.
+"""
+import errno
+import json
+import logging
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple, Optional, Set
+
+from tveebot_organizer.metrics import Metrics
+
+logger = logging.getLogger('retryQueue')
+
+# Version of the format of the retry queue file
+QUEUE_VERSION = 1
+
+# Called with each path to organize again
+SubmitCallback = Callable[[Path], object]
+
+
+class RetryPolicy(NamedTuple):
+    """ How a class of errors is retried """
+    attempts: int           # maximum number of retries, 0 means unlimited
+    initial_delay: float    # time, in seconds, before the first retry
+    max_delay: float        # maximum time, in seconds, between two retries
+
+
+# Policy of each class of errors. Errors of any other class, such as permission errors, are never
+# retried, since retrying them would fail the same way.
+DEFAULT_POLICIES = {
+    'unavailable': RetryPolicy(0, 60, 3600),
+    'no_space': RetryPolicy(24, 60, 3600),
+    'transient': RetryPolicy(8, 10, 600),
+    'other': RetryPolicy(3, 60, 600),
+}
+
+# Errors of full disks and exceeded quotas
+_NO_SPACE_ERRORS = {errno.ENOSPC, errno.EDQUOT}
+
+# Errors of devices which are gone, such as disconnected disks and unmounted network shares
+_UNAVAILABLE_ERRORS = {errno.ENODEV, errno.ENXIO, errno.ENOTCONN, errno.EHOSTDOWN}
+
+# Errors which usually go away on their own, mostly from network filesystems
+_TRANSIENT_ERRORS = {errno.EIO, errno.ESTALE, errno.ETIMEDOUT, errno.EAGAIN, errno.EINTR,
+                     errno.EBUSY, errno.ECONNRESET, errno.EHOSTUNREACH, errno.ENETUNREACH}
+
+# Errors which retrying can not fix
+_PERMANENT_ERRORS = {errno.EACCES, errno.EPERM, errno.EROFS, errno.ENAMETOOLONG}
+
+
+def classify(error: OSError, library_dir: Path) -> str:
+    """
+    Tells the class of *error*, raised while storing an episode in *library_dir*.
+
+    :return: 'unavailable', 'no_space', 'transient', 'permanent', or 'other'
+    """
+    if error.errno in _NO_SPACE_ERRORS:
+        return 'no_space'
+    if error.errno in _UNAVAILABLE_ERRORS:
+        return 'unavailable'
+    if error.errno in _TRANSIENT_ERRORS:
+        return 'transient'
+    if error.errno in _PERMANENT_ERRORS:
+        return 'permanent'
+    if isinstance(error, FileNotFoundError) and not library_dir.is_dir():
+        return 'unavailable'
+    return 'other'
+
+
+class Retry(NamedTuple):
+    """ A path waiting to be organized again """
+    path: Path          # path in the watch directory to organize again
+    library: Path       # library the episode failed to be stored in
+    kind: str           # class of the last error
+    attempts: int       # number of times the path was retried so far
+    due: float          # time, since the epoch, the path is retried at
+    error: str          # message of the last error
+
+
+class RetryQueue:
+    """
+    The retry queue holds the paths which failed to be organized, and submits each one again once
+    its delay expires, from a background thread.
+
+    When given a file, the queue is saved to it every time it changes, so that the paths waiting
+    to be retried survive restarts. Paths waiting for an unavailable library are submitted
+    together as soon as the library directory is found again, which is checked every
+    *probe_interval* seconds. Paths no longer in the watch directory are dropped.
+
+    A path counts as retried once it is submitted. If it fails again, the organizer adds it back
+    with the new error, and it waits for the next delay of its policy. A path is given up once
+    it was retried as many times as its policy allows.
+    """
+
+    def __init__(self, path: Path = None, policies: Dict[str, RetryPolicy] = None,
+                 probe_interval: float = 10, metrics: Metrics = None):
+        """
+        Initializes the retry queue, but does not load it nor start it!
+
+        :param path:           optional file the queue is saved to
+        :param policies:       policy of each class of errors, by default *DEFAULT_POLICIES*.
+                               Classes without a policy are never retried.
+        :param probe_interval: time, in seconds, between checks of the unavailable libraries
+        :param metrics:        registry to record the retries to
+        :raise ValueError:     if *probe_interval* or some delay is not positive, or some number
+                               of attempts is negative
+        """
+        policies = DEFAULT_POLICIES if policies is None else policies
+        if probe_interval <= 0:
+            raise ValueError(f"probe interval must be positive, got {probe_interval}")
+        for kind, policy in policies.items():
+            if policy.attempts < 0:
+                raise ValueError(f"attempts of '{kind}' must not be negative, "
+                                 f"got {policy.attempts}")
+            if policy.initial_delay <= 0 or policy.max_delay < policy.initial_delay:
+                raise ValueError(f"delays of '{kind}' must be positive, and the maximum must not "
+                                 f"be smaller than the initial delay")
+
+        self.path = path
+        self.policies = dict(policies)
+        self.probe_interval = probe_interval
+        self.metrics = metrics or Metrics()
+
+        self._retries: Dict[Path, Retry] = {}
+        self._unavailable_libraries = set()
+        self._submit: Optional[SubmitCallback] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._save_lock = threading.Lock()
+
+        self.metrics.describe('retries_total', "Paths submitted again, by class of error.")
+        self.metrics.describe('retries_given_up_total', "Paths given up, by class of error.")
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._retries)
+
+    def __contains__(self, path: Path) -> bool:
+        with self._condition:
+            return path in self._retries
+
+    def get(self, path: Path) -> Optional[Retry]:
+        """ Returns the retry of *path*, or None if it is not waiting to be retried """
+        with self._condition:
+            return self._retries.get(path)
+
+    def load(self):
+        """
+        Loads the paths waiting to be retried from the queue file, if there is one. A queue file
+        which does not exist yet is the same as an empty one. A corrupted queue file is
+        discarded.
+
+        :raise OSError: if the queue file can not be read
+        """
+        if self.path is None:
+            return
+
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+            if data.get('version') != QUEUE_VERSION:
+                raise ValueError(f"unsupported version {data.get('version')}")
+            retries = [Retry(Path(item['path']), Path(item['library']), item['kind'],
+                             item['attempts'], item['due'], item['error'])
+                       for item in data['retries']]
+        except FileNotFoundError:
+            return
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            logger.warning(f"discarded invalid retry queue: {error}")
+            return
+
+        with self._condition:
+            for retry in retries:
+                self._retries[retry.path] = retry
+                if retry.kind == 'unavailable':
+                    self._unavailable_libraries.add(retry.library)
+            self._condition.notify()
+
+        logger.info(f"loaded {len(retries)} paths waiting to be retried")
+
+    def start(self, submit: SubmitCallback):
+        """ Starts submitting the paths due to be retried, with *submit*, in a background thread """
+        self._submit = submit
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="retry-queue", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """ Stops submitting paths. The paths still waiting are kept in the queue file. """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+        if self._thread is not None:
+            self._thread.join()
+
+    def add(self, path: Path, library_dir: Path, error: OSError) -> bool:
+        """
+        Adds *path*, which failed to be stored in *library_dir* with *error*, to be retried once
+        the delay of its next attempt expires.
+
+        :return: True if *path* is retried and False if it was given up
+        """
+        kind = classify(error, library_dir)
+        policy = self.policies.get(kind)
+
+        with self._condition:
+            previous = self._retries.get(path)
+            attempts = previous.attempts if previous is not None else 0
+
+            if policy is None or (policy.attempts and attempts >= policy.attempts):
+                self._retries.pop(path, None)
+                given_up = True
+            else:
+                self._retries[path] = Retry(path, library_dir, kind, attempts,
+                                            time.time() + self.delay(policy, attempts),
+                                            str(error))
+                if kind == 'unavailable':
+                    self._unavailable_libraries.add(library_dir)
+                self._condition.notify()
+                given_up = False
+
+        if given_up:
+            self.metrics.inc('retries_given_up_total', kind=kind)
+            logger.error(f"gave up organizing '{path.name}' after {attempts} retries: {error}")
+        else:
+            logger.info(f"will retry organizing '{path.name}' ({kind})")
+
+        self._save()
+        return not given_up
+
+    def discard(self, path: Path):
+        """ Removes *path* from the queue, if it is waiting to be retried """
+        with self._condition:
+            if self._retries.pop(path, None) is None:
+                return
+
+        self._save()
+
+    @staticmethod
+    def delay(policy: RetryPolicy, attempts: int) -> float:
+        """
+        Returns the delay, in seconds, before retrying a path retried *attempts* times so far.
+        The delay is drawn between half and the whole of the exponential delay, so that paths
+        failing together are spread out.
+        """
+        delay = min(policy.max_delay, policy.initial_delay * 2 ** min(attempts, 32))
+        return random.uniform(delay / 2, delay)
+
+    def _run(self):
+        while True:
+            # The filesystem is probed without holding the condition, since probing a hung mount
+            # may block for a long time, while adding paths must not
+            with self._condition:
+                if self._stopping:
+                    return
+                unavailable = set(self._unavailable_libraries)
+
+            available = {library for library in unavailable if library.is_dir()}
+
+            with self._condition:
+                due = self._take_due(available)
+
+            gone = [retry for retry in due if not os.path.lexists(retry.path)]
+            if gone:
+                due = [retry for retry in due if retry not in gone]
+                with self._condition:
+                    for retry in gone:
+                        logger.debug(f"dropped retry of '{retry.path.name}'")
+                        self._retries.pop(retry.path, None)
+
+            with self._condition:
+                if not due:
+                    next_due = min((retry.due for retry in self._retries.values()),
+                                   default=float('inf'))
+                    timeout = min(self.probe_interval, max(next_due - time.time(), 0))
+
+            if due or gone:
+                self._save()
+
+            if not due:
+                with self._condition:
+                    if not self._stopping:
+                        self._condition.wait(timeout)
+                continue
+
+            if len(due) > 1:
+                logger.info(f"retrying {len(due)} paths...")
+            for retry in due:
+                logger.info(f"retrying '{retry.path.name}' (attempt {retry.attempts + 1})")
+                self.metrics.inc('retries_total', kind=retry.kind)
+                try:
+                    self._submit(retry.path)
+                except Exception:
+                    logger.exception(f"failed to submit '{retry.path}'")
+
+    def _take_due(self, available: Set[Path]) -> list:
+        """
+        Takes the paths due to be retried. Paths of the *available* libraries, which came back,
+        are all due, while paths of libraries still unavailable wait. Each path taken is counted
+        as retried, and is retried again after its next delay unless the organizer reports back
+        before.
+
+        Must be called while holding the condition.
+        """
+        available &= self._unavailable_libraries
+        for library in available:
+            logger.info(f"library is available again: {library}")
+        self._unavailable_libraries -= available
+
+        now = time.time()
+        due = []
+        for path, retry in list(self._retries.items()):
+            if retry.kind == 'unavailable' and retry.library in self._unavailable_libraries:
+                continue
+            if retry.due > now and retry.library not in available:
+                continue
+
+            # The policy may be gone when the queue was saved with another configuration
+            policy = self.policies.get(retry.kind)
+            if policy is None:
+                logger.debug(f"dropped retry of '{path.name}'")
+                del self._retries[path]
+                continue
+
+            self._retries[path] = retry._replace(
+                attempts=retry.attempts + 1,
+                due=now + self.delay(policy, retry.attempts + 1))
+            due.append(retry)
+
+        return due
+
+    def _save(self):
+        """ Saves the queue to its file, replacing it atomically """
+        if self.path is None:
+            return
+
+        with self._save_lock:
+            with self._condition:
+                retries = [{'path': str(retry.path), 'library': str(retry.library),
+                            'kind': retry.kind, 'attempts': retry.attempts, 'due': retry.due,
+                            'error': retry.error}
+                           for retry in self._retries.values()]
+
+            temporary = self.path.with_name(f".{self.path.name}.tmp")
+            try:
+                with open(temporary, 'w') as file:
+                    json.dump({'version': QUEUE_VERSION, 'retries': retries}, file)
+                os.replace(temporary, self.path)
+            except OSError as error:
+                logger.error(f"failed to save retry queue: {error}")
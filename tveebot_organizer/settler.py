@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple, Optional
+
+logger = logging.getLogger('settler')
+
+
+class Signature(NamedTuple):
+    """ Summarizes the state of a file or directory tree to tell whether it is still changing """
+    size: int
+    mtime_ns: int
+    entries: int
+
+
+def signature(path: Path) -> Optional[Signature]:
+    """
+    Computes the signature of *path*. For a directory, the signature covers every file and
+    directory inside of it, at any depth.
+
+    :return: the signature of *path* or None if *path* does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    size = stat.st_size
+    mtime_ns = stat.st_mtime_ns
+    entries = 1
+
+    directories = [str(path)] if os.path.isdir(path) else []
+    while directories:
+        try:
+            with os.scandir(directories.pop()) as it:
+                for entry in it:
+                    try:
+                        entry_stat = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        # Removed while scanning: the next signature will not match this one
+                        continue
+
+                    size += entry_stat.st_size
+                    mtime_ns = max(mtime_ns, entry_stat.st_mtime_ns)
+                    entries += 1
+
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+        except FileNotFoundError:
+            continue
+
+    return Signature(size, mtime_ns, entries)
+
+
+class _Pending:
+    """ Tracks the state of a path waiting to settle """
+
+    def __init__(self, now: float):
+        self.signature: Optional[Signature] = None
+        self.changed_at = now
+
+
+class Settler:
+    """
+    The settler holds back paths until their content stops changing. This prevents organizing
+    downloads which are still in progress.
+
+    Every time something changes under a path, the settler is *touched* with that path. The path
+    is only dispatched once its size and modification time stayed the same for a quiet period.
+    Touching a path multiple times before it settles dispatches it only once.
+    """
+
+    def __init__(self, dispatch: Callable[[Path], None], quiet_period: float,
+                 poll_interval: float = None):
+        """
+        Initializes the settler, but does not start it!
+
+        :param dispatch:      called with each path once it settles
+        :param quiet_period:  time, in seconds, a path must stay unchanged to be dispatched
+        :param poll_interval: time, in seconds, between checks of the pending paths. Defaults to a
+                              fraction of the quiet period.
+        """
+        if poll_interval is None:
+            poll_interval = min(max(quiet_period / 4, 0.05), 1.0)
+
+        self.dispatch = dispatch
+        self.quiet_period = quiet_period
+        self.poll_interval = poll_interval
+
+        self._pending: Dict[Path, _Pending] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def pending(self) -> int:
+        """ Number of paths waiting to settle """
+        with self._lock:
+            return len(self._pending)
+
+    def touch(self, path: Path):
+        """ Tells the settler that *path* changed """
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending.get(path)
+            if pending is None:
+                self._pending[path] = _Pending(now)
+            else:
+                pending.changed_at = now
+
+    def start(self):
+        """ Starts checking pending paths in a background thread """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="settler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stops checking pending paths. Paths that did not settle yet are discarded """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        with self._lock:
+            self._pending.clear()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("failed to check pending paths")
+
+    def check(self):
+        """ Checks each pending path once and dispatches the ones that settled """
+        with self._lock:
+            paths = list(self._pending)
+
+        for path in paths:
+            current = signature(path)
+            now = time.monotonic()
+
+            with self._lock:
+                pending = self._pending.get(path)
+                if pending is None:
+                    continue
+
+                if current is None:
+                    # Removed before settling: there is nothing to organize
+                    logger.debug(f"'{path.name}' was removed before settling")
+                    del self._pending[path]
+                    continue
+
+                if current != pending.signature:
+                    pending.signature = current
+                    pending.changed_at = now
+                    continue
+
+                if now - pending.changed_at < self.quiet_period:
+                    continue
+
+                del self._pending[path]
+
+            logger.debug(f"'{path.name}' settled")
+            self.dispatch(path)
@@ -0,0 +1,217 @@
+"""
+Polling observer for filesystems which do not deliver change notifications, such as NFS and SMB.
+
+It plugs into watchdog, so the *Watcher* handles its events as it handles those of the native
+observer.
+"""
+import logging
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from watchdog.events import (DirCreatedEvent, DirDeletedEvent, DirModifiedEvent, DirMovedEvent,
+                             FileCreatedEvent, FileDeletedEvent, FileModifiedEvent,
+                             FileMovedEvent)
+from watchdog.observers.api import BaseObserver, EventEmitter
+
+logger = logging.getLogger('snapshotObserver')
+
+# Directories modified less than this many nanoseconds before being listed are listed again once
+# this long passed. A change made in the same tick of the directory's clock as the listing would
+# otherwise go unnoticed, since it does not change the modification time.
+RACY_WINDOW_NS = 2_000_000_000
+
+
+class Entry(NamedTuple):
+    """ State of a directory entry kept in the snapshot """
+    inode: int
+    size: int
+    mtime_ns: int
+    is_dir: bool
+
+
+class _Directory(NamedTuple):
+    mtime_ns: int
+    recheck_ns: Optional[int]   # monotonic time to list the directory again at, if racy
+    entries: Dict[str, Entry]
+
+
+class SnapshotEmitter(EventEmitter):
+    """
+    Emits the changes in a watched directory by periodically comparing it with a snapshot.
+
+    The snapshot keeps the inode, size, and modification time of each entry, per directory. Each
+    scan only stats the directories in the snapshot, and lists only those whose modification time
+    changed, since creating, removing, or renaming an entry changes the modification time of the
+    directory containing it. Thus, the cost of a scan grows with the number of directories and
+    changes, not with the number of files.
+
+    Files modified in place do not change the modification time of their directory. They are only
+    reported when their directory is listed for some other reason.
+
+    Modification times are set by the clock of the server, which may be skewed from the local
+    clock. They are only compared with each other: the newest modification time in the snapshot
+    tells the time of the server's clock when it was taken, at least.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._directories: Dict[str, _Directory] = {}
+        self._newest_ns = 0
+
+        # The first snapshot is taken right away, so that nothing created after the watch was
+        # scheduled is missed
+        self._snapshot_tree(self.watch.path)
+
+    def queue_events(self, timeout: float):
+        if self.stopped_event.wait(timeout):
+            return
+
+        self.scan()
+
+    def scan(self):
+        """ Compares the watched directory with the snapshot, emitting an event per change """
+        created: List[Tuple[str, Entry]] = []
+        deleted: List[Tuple[str, Entry]] = []
+
+        for path in sorted(self._directories):
+            directory = self._directories.get(path)
+            if directory is None:
+                # Removed while handling its parent
+                continue
+
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except (FileNotFoundError, NotADirectoryError):
+                # Reported as deleted when its parent is listed
+                continue
+            except OSError as error:
+                logger.warning(f"failed to stat '{path}': {error}")
+                continue
+
+            if mtime_ns == directory.mtime_ns and (directory.recheck_ns is None or
+                                                   time.monotonic_ns() < directory.recheck_ns):
+                continue
+
+            self._diff(path, created, deleted)
+
+        self._emit(created, deleted)
+
+    def _diff(self, path: str, created: List[Tuple[str, Entry]],
+              deleted: List[Tuple[str, Entry]]):
+        """ Lists the directory in *path* again, collecting the entries created and deleted """
+        previous_directory = self._directories[path]
+        previous = previous_directory.entries
+        try:
+            current = self._list(path, previous_directory)
+        except OSError as error:
+            logger.warning(f"failed to list '{path}': {error}")
+            return
+
+        for name, entry in previous.items():
+            new_entry = current.entries.get(name)
+            if new_entry is None or new_entry.inode != entry.inode:
+                deleted.append((os.path.join(path, name), entry))
+
+        for name, entry in current.entries.items():
+            old_entry = previous.get(name)
+            entry_path = os.path.join(path, name)
+            if old_entry is None or old_entry.inode != entry.inode:
+                created.append((entry_path, entry))
+            elif not entry.is_dir and (entry.size, entry.mtime_ns) != (old_entry.size,
+                                                                       old_entry.mtime_ns):
+                self.queue_event(FileModifiedEvent(entry_path))
+
+        self._directories[path] = current
+        if path != self.watch.path and current.entries != previous:
+            self.queue_event(DirModifiedEvent(path))
+
+    def _emit(self, created: List[Tuple[str, Entry]], deleted: List[Tuple[str, Entry]]):
+        """
+        Emits the events for the entries *created* and *deleted* in a scan. An entry deleted and
+        created with the same inode was moved.
+        """
+        deleted_by_inode = {entry.inode: (path, entry) for path, entry in deleted}
+
+        for path, entry in created:
+            moved_from = deleted_by_inode.pop(entry.inode, None)
+            if moved_from is not None:
+                self._forget_tree(moved_from[0])
+                event_class = DirMovedEvent if entry.is_dir else FileMovedEvent
+                self.queue_event(event_class(moved_from[0], path))
+            else:
+                event_class = DirCreatedEvent if entry.is_dir else FileCreatedEvent
+                self.queue_event(event_class(path))
+
+            if entry.is_dir and self.watch.is_recursive:
+                self._snapshot_tree(path)
+
+        for path, entry in deleted_by_inode.values():
+            self._forget_tree(path)
+            event_class = DirDeletedEvent if entry.is_dir else FileDeletedEvent
+            self.queue_event(event_class(path))
+
+    def _snapshot_tree(self, path: str):
+        """ Adds the directory in *path* to the snapshot, including sub-directories if recursive """
+        directories = [path]
+        while directories:
+            directory_path = directories.pop()
+            try:
+                directory = self._list(directory_path)
+            except OSError as error:
+                logger.warning(f"failed to list '{directory_path}': {error}")
+                continue
+
+            self._directories[directory_path] = directory
+            if self.watch.is_recursive:
+                directories.extend(os.path.join(directory_path, name)
+                                   for name, entry in directory.entries.items() if entry.is_dir)
+
+    def _forget_tree(self, path: str):
+        """ Removes the directory in *path*, and everything inside of it, from the snapshot """
+        self._directories.pop(path, None)
+        prefix = path + os.sep
+        for directory_path in [key for key in self._directories if key.startswith(prefix)]:
+            del self._directories[directory_path]
+
+    def _list(self, path: str, previous: _Directory = None) -> _Directory:
+        """
+        Lists the directory in *path*. It is racy, and listed again once its clock's tick is over
+        for sure, unless it was modified long before the newest modification time in the
+        snapshot, or it was already listed again with the same modification time.
+        """
+        # The modification time is read before listing: a change made while listing is caught by
+        # the next scan
+        mtime_ns = os.stat(path).st_mtime_ns
+        listed_ns = time.monotonic_ns()
+
+        entries = {}
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+
+                entries[entry.name] = Entry(stat.st_ino, stat.st_size, stat.st_mtime_ns,
+                                            entry.is_dir(follow_symlinks=False))
+
+        self._newest_ns = max(self._newest_ns, mtime_ns,
+                              *(entry.mtime_ns for entry in entries.values()))
+
+        if mtime_ns < self._newest_ns - RACY_WINDOW_NS:
+            recheck_ns = None
+        elif previous is not None and previous.mtime_ns == mtime_ns:
+            # Listed again only once the tick of the previous listing was over
+            recheck_ns = None
+        else:
+            recheck_ns = listed_ns + RACY_WINDOW_NS
+
+        return _Directory(mtime_ns, recheck_ns, entries)
+
+
+class SnapshotObserver(BaseObserver):
+    """ Observer scanning the watched directories every *interval* seconds """
+
+    def __init__(self, interval: float = 1.0):
+        super().__init__(SnapshotEmitter, timeout=interval)
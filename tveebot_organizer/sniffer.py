@@ -0,0 +1,149 @@
+"""
+Detection of video files by their content.
+
+Some clients download files without an extension, or with the wrong one. Instead of trusting the
+extension, the container of a video file can be told from the first bytes of the file:
+
+- Matroska (and WebM) files start with the EBML magic number 1A 45 DF A3, followed by an EBML
+  header whose document type is 'matroska' or 'webm';
+- MP4 and other ISO base media files start with a box whose type, at offset 4, is 'ftyp',
+  followed by the major brand, which tells video files apart from audio files and images;
+- AVI files start with 'RIFF', followed by the size, and the form type 'AVI '.
+
+Audio-only Matroska files share the document type of video files, so *.mka* files, like other
+audio files, are told apart by their extension, see *Filter.other_extensions*.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+logger = logging.getLogger('sniffer')
+
+# Number of bytes read from the start of each file, enough for every signature and the EBML
+# header of Matroska files
+HEADER_SIZE = 64
+
+# Document types of Matroska video files
+MATROSKA_DOC_TYPES = {b'matroska', b'webm'}
+
+# Major brands of MP4 video files. Other brands include M4A and M4B audio files, 3GP files, which
+# are often audio only, and HEIF images.
+MP4_VIDEO_BRANDS = {b'isom', b'iso2', b'iso4', b'iso5', b'iso6', b'mp41', b'mp42', b'avc1',
+                    b'M4V ', b'M4VH', b'M4VP', b'qt  ', b'f4v ', b'dash', b'mmp4', b'XAVC'}
+
+# ID of the element holding the document type in an EBML header
+_EBML_DOC_TYPE = 0x4282
+
+
+def sniff(path: Path) -> Optional[str]:
+    """
+    Tells the container of the video file in *path* from its first bytes.
+
+    :return: 'matroska', 'mp4', or 'avi', or None if the file is none of them
+    :raise OSError: if the file can not be read
+    """
+    with open(path, 'rb', buffering=0) as file:
+        header = file.read(HEADER_SIZE)
+
+    if header[:4] == b'\x1a\x45\xdf\xa3':
+        return 'matroska' if _ebml_doc_type(header) in MATROSKA_DOC_TYPES else None
+    if header[4:8] == b'ftyp':
+        return 'mp4' if header[8:12] in MP4_VIDEO_BRANDS else None
+    if header[:4] == b'RIFF' and header[8:12] == b'AVI ':
+        return 'avi'
+    return None
+
+
+def _read_vint(data: bytes, offset: int, keep_marker: bool) -> Tuple[int, int]:
+    """
+    Reads the EBML variable size integer at *offset* of *data*. The marker bit is kept for
+    element IDs and removed for sizes.
+
+    :return: the integer and the offset following it
+    :raise ValueError: if the integer is not valid or *data* ends before it
+    """
+    if offset >= len(data) or data[offset] == 0:
+        raise ValueError("invalid variable size integer")
+
+    length = 8 - data[offset].bit_length() + 1
+    if offset + length > len(data):
+        raise ValueError("truncated variable size integer")
+
+    value = int.from_bytes(data[offset:offset + length], 'big')
+    if not keep_marker:
+        value &= (1 << (7 * length)) - 1
+    return value, offset + length
+
+
+def _ebml_doc_type(header: bytes) -> Optional[bytes]:
+    """ Returns the document type in the EBML *header*, or None if it is not found in it """
+    try:
+        _, offset = _read_vint(header, 4, keep_marker=False)
+        while offset < len(header):
+            element, offset = _read_vint(header, offset, keep_marker=True)
+            size, offset = _read_vint(header, offset, keep_marker=False)
+            if element == _EBML_DOC_TYPE:
+                return header[offset:offset + size].rstrip(b'\x00') \
+                    if offset + size <= len(header) else None
+            offset += size
+    except ValueError:
+        return None
+    return None
+
+
+class Sniffer:
+    """
+    Cache of the containers of files, as told by *sniff()*. Each result is cached by the inode,
+    the size, and the modification time of the file, so the same file is never read twice, while
+    a file which changed is read again.
+    """
+
+    def __init__(self, cache_size: int = 4096):
+        """
+        :param cache_size: maximum number of results kept in the cache
+        """
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[Tuple[int, int, int, int], Optional[str]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._cache)
+
+    def container(self, path: Path, stat: os.stat_result = None) -> Optional[str]:
+        """
+        Tells the container of the video file in *path*, from the cache if the file did not
+        change since it was sniffed. Files which can not be read are not video files.
+
+        :param path: path to the file
+        :param stat: the status of the file, if it is already known
+        :return: the container, or None if the file is not a video file
+        """
+        try:
+            stat = stat or os.stat(path)
+        except OSError:
+            return None
+
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        try:
+            container = sniff(path)
+        except OSError as error:
+            logger.debug(f"failed to sniff '{path.name}': {error}")
+            return None
+
+        logger.debug(f"sniffed '{path.name}': {container or 'not a video file'}")
+
+        with self._lock:
+            self._cache[key] = container
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return container
@@ -1,8 +1,17 @@
 import logging
-import shutil
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
 
+from tveebot_organizer import transfer
 from tveebot_organizer.dataclasses import Episode
+from tveebot_organizer.fingerprint import Fingerprints
+from tveebot_organizer.io_scheduler import IOScheduler
+from tveebot_organizer.layout import Layout
+from tveebot_organizer.library_index import LibraryIndex
+from tveebot_organizer.transfer import ProgressCallback
 
 
 class EpisodeExists(Exception):
@@ -11,17 +20,70 @@ class EpisodeExists(Exception):
 
 logger = logging.getLogger('storageManager')
 
+# Policies for episode files with the same content as a file already in the episode directory:
+# 'keep' stores both, 'skip' rejects the new file, and 'replace' removes the file in the library
+DUPLICATE_POLICIES = ('keep', 'skip', 'replace')
+
 
 class StorageManager:
     """
     The storage manager is one of the sub-components of the *Organizer*. An organizer is associated
     with a single storage manager. The storage manager is responsible for storing the episode files
     in the library according to some pre-defined organization structure.
+
+    The storage manager may be associated with a library index. In that case, episodes already
+    included in the library are rejected before touching the filesystem.
+
+    The same episode may arrive under a different release name, which would be stored next to the
+    file already in the library. Unless told to keep both, the storage manager compares the
+    fingerprint of the new episode file with the files of the same size in the episode directory.
+    A file with the same content is either kept, rejecting the new one, or replaced by it.
+
+    Transfers copying the data of episode files may be limited per device by an I/O scheduler,
+    shared with the storage managers of other libraries. Renames and hard links within the same
+    device only touch metadata, and are never held back.
     """
 
-    def __init__(self, library_dir: Path):
-        """ Initializes the storage manager, specifying the library directory. """
+    def __init__(self, library_dir: Path, index: LibraryIndex = None, mode: str = 'move',
+                 layout: Layout = None, duplicates: str = 'keep',
+                 fingerprints: Fingerprints = None, scheduler: IOScheduler = None):
+        """
+        Initializes the storage manager, specifying the library directory.
+
+        :param library_dir: the library directory
+        :param index:       optional index of the episodes included in the library. It must
+                            index the same library directory.
+        :param mode:        how episode files are stored in the library, one of
+                            *transfer.MODES*. Every mode except 'move' keeps the episode file in
+                            its current location.
+        :param layout:      layout of the episode directories, by default the season directory
+                            inside the tv show directory
+        :param duplicates:  what to do with episode files with the same content as a file in the
+                            episode directory, one of *DUPLICATE_POLICIES*
+        :param fingerprints: cache of the fingerprints of episode files
+        :param scheduler:   optional I/O scheduler limiting the concurrent transfers per device
+        :raise ValueError:  if *mode* or *duplicates* is not valid
+        """
+        if mode not in transfer.MODES:
+            raise ValueError(f"invalid store mode '{mode}': "
+                             f"must be one of {', '.join(transfer.MODES)}")
+
+        if duplicates not in DUPLICATE_POLICIES:
+            raise ValueError(f"invalid duplicates policy '{duplicates}': "
+                             f"must be one of {', '.join(DUPLICATE_POLICIES)}")
+
         self._library_dir: Path = library_dir
+        self.index = index
+        self.mode = mode
+        self.layout = layout or Layout()
+        self.duplicates = duplicates
+        self.fingerprints = fingerprints or Fingerprints()
+        self.scheduler = scheduler
+
+    @property
+    def keeps_source(self) -> bool:
+        """ Indicates whether episode files are kept in their location after being stored """
+        return self.mode != 'move'
 
     @property
     def library_dir(self) -> Path:
@@ -32,47 +94,277 @@ class StorageManager:
         if not directory.is_dir():
             raise FileNotFoundError(f"library directory was not found: {directory}")
 
+        # The new library is indexed before switching to it, which may take a while
+        if self.index is not None:
+            self.index.move(directory)
+
         self._library_dir = directory
 
-    def store(self, episode: Episode, path: Path):
+    def tvshow_names(self) -> Set[str]:
+        """
+        Returns the names of the tv shows already in the library: the tv shows in the index and,
+        with layouts starting with the tv show directory, the tv show directories of the library,
+        including the ones without any episodes yet.
+        """
+        names = set()
+        if self.index is not None:
+            names.update(tvshow.name for tvshow in self.index.tvshows())
+
+        if self.layout.pattern.split('/')[0] == '{show}':
+            try:
+                with os.scandir(self.library_dir) as entries:
+                    names.update(entry.name for entry in entries
+                                 if entry.is_dir() and not entry.name.startswith('.'))
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+
+        return names
+
+    def store(self, episode: Episode, path: Path, progress: ProgressCallback = None):
         """
         Stores an *episode* in the library.
 
-        The episode file in *path* is **moved** to the library, which means it will be removed from
-        its current location.
+        By default, the episode file in *path* is **moved** to the library, which means it will be
+        removed from its current location. When the library is in a different device, the file is
+        copied to a temporary file first, which means the library never includes a partial episode
+        file. Other modes keep the episode file in its location, storing a hard link, a clone, or
+        a copy of it instead.
 
         :param episode:           the episode to be stored
         :param path:              the path to the episode file corresponding to *episode*
-        :raise EpisodeExists:     if the library already includes this episode
+        :param progress:          optional callback reporting the number of bytes stored so far
+        :raise EpisodeExists:     if the library already includes this episode, or a file with
+                                  the same content when duplicates are skipped
         :raise FileNotFoundError: if the library directory does not exist
         :raise OSError:           if some error occurs while trying to store the episode
         """
-        episode_dir = self.episode_dir(episode)
+        self._store_episode(episode, path, progress)
+
+    def store_batch(self, episodes: List[Tuple[Episode, Path]],
+                    workers: int = 4) -> List[Optional[Exception]]:
+        """
+        Stores several episodes in the library at once, such as the episodes of a season pack.
+        Each episode directory is created once, up front, and then the episode files are stored
+        concurrently. Each episode is stored as by *store()*, and failing to store one does not
+        keep the others from being stored.
+
+        :param episodes: each episode to store, with the path to its episode file
+        :param workers:  maximum number of episode files stored concurrently
+        :return: for each episode, in the same order, None if it was stored, or the
+                 *EpisodeExists* or *OSError* exception which kept it from being stored
+        """
+        if not episodes:
+            return []
+
+        # Directories are not created for episodes the index already rejects
+        dir_errors: Dict[Path, Optional[OSError]] = {}
+        if self.library_dir.is_dir():
+            for episode, path in episodes:
+                destination = self.destination(episode, path)
+                episode_dir = destination.parent
+                if episode_dir in dir_errors or (self.index is not None
+                                                 and self.index.get(episode) == destination):
+                    continue
+
+                try:
+                    episode_dir.mkdir(parents=True, exist_ok=True)
+                    dir_errors[episode_dir] = None
+                except OSError as error:
+                    dir_errors[episode_dir] = error
+
+        def store(item: Tuple[Episode, Path]) -> Optional[Exception]:
+            episode, path = item
+            try:
+                dir_error = dir_errors.get(self.episode_dir(episode))
+                if dir_error is not None:
+                    raise dir_error
+                self._store_episode(episode, path, make_dirs=False)
+            except (EpisodeExists, OSError) as error:
+                return error
+            return None
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(episodes)),
+                                thread_name_prefix="store-worker") as executor:
+            return list(executor.map(store, episodes))
+
+    def _store_episode(self, episode: Episode, path: Path, progress: ProgressCallback = None,
+                       make_dirs: bool = True):
+        destination = self.destination(episode, path)
+        episode_dir = destination.parent
         logger.debug(f"episode will be stored in: {episode_dir.relative_to(self.library_dir)}")
 
         if not self.library_dir.is_dir():
             raise FileNotFoundError(f"library directory was removed: {self.library_dir}")
 
+        # Claim the episode, so that it is not stored concurrently by someone else. An episode
+        # the index already includes in another file is stored next to it, as without an index,
+        # and the indexed file keeps the claim unless the episode file replaces it.
+        claimed = False
+        if self.index is not None:
+            claimed = self.index.add(episode, destination)
+            if not claimed and self.index.get(episode) == destination:
+                raise EpisodeExists(f"library already includes episode")
+
+        try:
+            duplicate = self.find_duplicate(episode, path)
+            if duplicate is None and self.index is not None and not claimed:
+                duplicate = self._indexed_duplicate(episode, path)
+            if duplicate is not None and self.duplicates == 'skip':
+                raise EpisodeExists(f"library already includes episode as '{duplicate.name}'")
+
+            self._store(episode_dir, destination, path, progress, make_dirs)
+        except EpisodeExists:
+            # An episode file already in the destination stays in the index
+            if claimed and not os.path.lexists(destination):
+                self.index.remove(episode)
+            raise
+        except BaseException:
+            if claimed:
+                self.index.remove(episode)
+            raise
+
+        if duplicate is not None:
+            if self.index is not None and not claimed and self.index.get(episode) == duplicate:
+                self.index.remove(episode)
+                self.index.add(episode, destination)
+            self._remove_duplicate(episode, duplicate)
+
+    def _indexed_duplicate(self, episode: Episode, path: Path) -> Optional[Path]:
+        """
+        Returns the file of *episode* in the index if it has the same content as the episode file
+        in *path*, under another name, and None otherwise. Nothing is looked for if duplicates
+        are kept.
+
+        :raise OSError: if the episode file can not be read
+        """
+        indexed = self.index.get(episode)
+        if self.duplicates == 'keep' or indexed is None \
+                or indexed == self.destination(episode, path):
+            return None
+
+        size = os.stat(path).st_size
+        try:
+            if os.stat(indexed).st_size != size:
+                return None
+            value = self.fingerprints.get(indexed)
+        except FileNotFoundError:
+            return None
+
+        return indexed if self.fingerprints.get(path) == value else None
+
+    def _store(self, episode_dir: Path, destination: Path, path: Path,
+               progress: ProgressCallback, make_dirs: bool = True):
+        if destination.exists():
+            raise EpisodeExists(f"library already includes episode")
+
         # Create the directory to store the episode
-        episode_dir.mkdir(parents=True, exist_ok=True)
+        if make_dirs:
+            episode_dir.mkdir(parents=True, exist_ok=True)
 
         try:
-            logger.debug(f"moving episode to '{episode_dir.relative_to(self.library_dir)}'")
-            shutil.move(src=str(path), dst=str(episode_dir))
-        except shutil.Error:
-            # Destination path already exists
+            logger.debug(f"storing episode to '{episode_dir.relative_to(self.library_dir)}'")
+            with self._transfer(path, episode_dir):
+                used_mode = transfer.store(path, destination, self.mode, progress)
+            if used_mode != self.mode:
+                logger.debug(f"stored episode with {used_mode}: {self.mode} is not supported")
+        except FileExistsError:
+            # Destination path was created meanwhile
             raise EpisodeExists(f"library already includes episode")
 
+    def _transfer(self, path: Path, episode_dir: Path):
+        """ Returns the context holding the devices while the episode file is stored """
+        if self.scheduler is None:
+            return nullcontext()
+
+        if self.mode in ('move', 'hardlink') and transfer.same_device(path, episode_dir):
+            return nullcontext()
+
+        return self.scheduler.transfer(path, episode_dir)
+
+    def _remove_duplicate(self, episode: Episode, duplicate: Path):
+        """ Removes the *duplicate* replaced by the file of *episode* from the library """
+        try:
+            os.remove(duplicate)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            logger.error(f"failed to remove duplicate '{duplicate.name}': {error}")
+            return
+
+        logger.info(f"replaced duplicate '{duplicate.name}'")
+
+        if self.index is not None:
+            for indexed_episode, indexed_path in self.index.items():
+                if indexed_path == duplicate and indexed_episode != episode:
+                    self.index.remove(indexed_episode)
+
+    def find_duplicate(self, episode: Episode, path: Path) -> Optional[Path]:
+        """
+        Looks for a file with the same content as the episode file in *path* in the directory of
+        *episode*. Only files with the same size are fingerprinted. Nothing is looked for if
+        duplicates are kept.
+
+        :return: the path to the duplicate or None if there is none
+        :raise OSError: if the episode file can not be read
+        """
+        if self.duplicates == 'keep':
+            return None
+
+        size = os.stat(path).st_size
+        try:
+            with os.scandir(self.episode_dir(episode)) as entries:
+                # Hidden files include the temporary files of episodes being stored
+                candidates = [Path(entry.path) for entry in entries
+                              if not entry.name.startswith('.') and entry.name != path.name
+                              and entry.is_file() and entry.stat().st_size == size]
+        except FileNotFoundError:
+            return None
+
+        if not candidates:
+            return None
+
+        value = self.fingerprints.get(path)
+        for candidate in candidates:
+            try:
+                if self.fingerprints.get(candidate) == value:
+                    return candidate
+            except FileNotFoundError:
+                continue
+
+        return None
+
+    def includes(self, episode: Episode, path: Path) -> bool:
+        """
+        Determines whether the library already includes *episode*, either in the index, with
+        the same file name as the episode file in *path*, or, when duplicates are skipped, with
+        the same content. Nothing is changed.
+        """
+        destination = self.destination(episode, path)
+        if self.index is not None and self.index.get(episode) == destination:
+            return True
+        if destination.exists():
+            return True
+        if self.duplicates != 'skip':
+            return False
+        if self.find_duplicate(episode, path) is not None:
+            return True
+        return self.index is not None and self._indexed_duplicate(episode, path) is not None
+
+    def destination(self, episode: Episode, path: Path) -> Path:
+        """ Determines the path the episode file in *path* is stored to """
+        return self.episode_dir(episode) / path.name
+
     def episode_dir(self, episode: Episode) -> Path:
         """
         Determines the episode directory based on its information.
 
-        In its current form, the directory of an episode is composed of a season folder of the
-        form 'Season XX', where XX indicates the season number to which the episode belongs. This
-        directory is included inside a tv show directory with its name. For example, an episode
-        from season 1 of a tv show called 'Example' is stored in 'Example/Season 01'.
+        The directory follows the layout of the library. By default, the directory of an episode
+        is composed of a season folder of the form 'Season XX', where XX indicates the season
+        number to which the episode belongs. This directory is included inside a tv show directory
+        with its name. For example, an episode from season 1 of a tv show called 'Example' is
+        stored in 'Example/Season 01'.
 
         :param episode: the episode information.
         :return: the path to the directory where the episode should be stored.
         """
-        return self.library_dir / episode.tvshow.name / f"Season {episode.season:02d}"
+        return self.library_dir / self.layout.episode_dir(episode)
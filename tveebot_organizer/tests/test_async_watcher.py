@@ -0,0 +1,124 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Thread
+from time import sleep
+from typing import cast
+from unittest.mock import MagicMock
+
+from pytest import raises
+
+from tveebot_organizer.async_watcher import AsyncWatcher
+from tveebot_organizer.organizer import Organizer
+
+
+@contextmanager
+def watching(watch_dir: Path, organizer_mock: MagicMock = None, **kwargs):
+    organizer_mock = organizer_mock or MagicMock()
+    watcher = AsyncWatcher(watch_dir, organizer=cast(Organizer, organizer_mock), **kwargs)
+    watcher_thread = Thread(target=asyncio.run, args=(watcher.run(),))
+    watcher_thread.start()
+
+    sleep(0.5)
+    yield watcher, organizer_mock
+    sleep(1)
+
+    watcher.shutdown()
+    watcher_thread.join()
+
+
+class TestAsyncWatcher:
+
+    def test_OrganizerIsCalledWhenAFileIsCreated(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+
+        with watching(Path(watch_dir)) as (_, organizer_mock):
+            watch_dir.join("file.txt").write("")
+
+        organizer_mock.organize.assert_called_once_with(Path(watch_dir) / "file.txt")
+
+    def test_OrganizerIsCalledWhenWatcherIsStartedAndWatchDirectoryContainsAFile(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+        watch_dir.join("file.txt").write("")
+
+        with watching(Path(watch_dir)) as (_, organizer_mock):
+            pass
+
+        organizer_mock.organize.assert_called_once_with(Path(watch_dir) / "file.txt")
+
+    def test_PathsAreOrganizedConcurrently(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+        watch_dir.join("file1.txt").write("")
+        watch_dir.join("file2.txt").write("")
+
+        # Each organize call blocks until two calls are running at the same time
+        barrier = threading.Barrier(2, timeout=5)
+        organizer_mock = MagicMock()
+        organizer_mock.organize.side_effect = lambda path: barrier.wait()
+
+        with watching(Path(watch_dir), organizer_mock, concurrency=2):
+            pass
+
+        assert organizer_mock.organize.call_count == 2
+        assert not barrier.broken
+
+    def test_ShutdownWaitsForPathsBeingOrganized(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+        watch_dir.join("file.txt").write("")
+
+        finished = threading.Event()
+        organizer_mock = MagicMock()
+        organizer_mock.organize.side_effect = lambda path: (sleep(2), finished.set())
+
+        with watching(Path(watch_dir), organizer_mock):
+            pass
+
+        assert finished.is_set()
+
+    def test_OrganizingAfterTheWatcherStopped_IsNotSubmitted(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+
+        with watching(Path(watch_dir)) as (watcher, organizer_mock):
+            assert watcher.organize(Path(watch_dir) / "file.txt")
+
+        assert not watcher.organize(Path(watch_dir) / "file.txt")
+
+    def test_OrganizerIsCalledOnceWithTopLevelDirectoryAfterItsContentSettles(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+
+        with watching(Path(watch_dir), settle_time=0.5) as (_, organizer_mock):
+            release_dir = watch_dir.mkdir("release")
+            episode_file = release_dir.mkdir("video").join("episode.mkv")
+            for index in range(5):
+                episode_file.write("x" * index)
+                sleep(0.1)
+
+            organizer_mock.organize.assert_not_called()
+
+        organizer_mock.organize.assert_called_once_with(Path(watch_dir) / "release")
+
+    def test_LessThanOneConcurrentPathRaisesValueError(self, tmpdir):
+        with raises(ValueError):
+            AsyncWatcher(Path(tmpdir), cast(Organizer, MagicMock()), concurrency=0)
+
+    def test_PathsCreatedInEachWatchDirAreOrganizedByTheOrganizerOfItsRoute(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+        other_watch_dir = tmpdir.mkdir("other")
+        other_watch_dir.join("file2.txt").write("")
+        organizer_mock = MagicMock()
+        route_organizer_mock = MagicMock()
+
+        watcher = AsyncWatcher(Path(watch_dir), cast(Organizer, organizer_mock))
+        watcher.add_route(Path(other_watch_dir), cast(Organizer, route_organizer_mock))
+        watcher_thread = Thread(target=asyncio.run, args=(watcher.run(),))
+        watcher_thread.start()
+
+        sleep(0.5)
+        watch_dir.join("file1.txt").write("")
+        sleep(1)
+        watcher.shutdown()
+        watcher_thread.join()
+
+        organizer_mock.organize.assert_called_once_with(Path(watch_dir) / "file1.txt")
+        route_organizer_mock.organize.assert_called_once_with(Path(other_watch_dir) / "file2.txt")
@@ -0,0 +1,119 @@
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from pytest import raises
+
+from tveebot_organizer.cleaner import Cleaner
+
+
+def release_dir(tmpdir, files: int = 10) -> Path:
+    directory = tmpdir.mkdir("release")
+    directory.mkdir("subs").join("episode.srt").write("")
+    for index in range(files):
+        directory.join(f"episode.r{index:02d}").write("x")
+    return Path(directory)
+
+
+class TestCleaner:
+
+    def test_DirectoryIsRemovedWithEverythingInside(self, tmpdir):
+        path = release_dir(tmpdir)
+        cleaner = Cleaner()
+        cleaner.start()
+
+        cleaner.remove(path)
+        cleaner.shutdown()
+
+        assert cleaner.join(timeout=5)
+        assert not path.exists()
+
+    def test_FileIsRemoved(self, tmpdir):
+        path = Path(tmpdir.join("episode.mkv"))
+        path.write_text("x")
+        cleaner = Cleaner()
+        cleaner.start()
+
+        cleaner.remove(path)
+        cleaner.shutdown()
+
+        assert cleaner.join(timeout=5)
+        assert not path.exists()
+
+    def test_CallbackIsCalledOncePathIsRemoved(self, tmpdir):
+        path = release_dir(tmpdir)
+        removed = MagicMock(side_effect=lambda: assert_not_exists(path))
+        cleaner = Cleaner()
+        cleaner.start()
+
+        cleaner.remove(path, removed)
+        cleaner.shutdown()
+
+        assert cleaner.join(timeout=5)
+        removed.assert_called_once_with()
+
+    def test_PathIsIncludedUntilItIsRemoved(self, tmpdir):
+        path = release_dir(tmpdir)
+        cleaner = Cleaner()
+
+        cleaner.remove(path)
+        assert path in cleaner
+        assert cleaner.pending == 1
+
+        cleaner.start()
+        cleaner.shutdown()
+
+        assert cleaner.join(timeout=5)
+        assert path not in cleaner
+        assert cleaner.pending == 0
+
+    def test_RateLimitsTheNumberOfFilesRemovedPerSecond(self, tmpdir):
+        path = release_dir(tmpdir, files=20)
+        cleaner = Cleaner(rate=50)
+        cleaner.start()
+
+        start = time.monotonic()
+        cleaner.remove(path)
+        cleaner.shutdown()
+
+        assert cleaner.join(timeout=5)
+        assert not path.exists()
+        assert time.monotonic() - start >= 0.35
+
+    def test_RemoveDoesNotWaitForThePathToBeRemoved(self, tmpdir):
+        path = release_dir(tmpdir, files=20)
+        cleaner = Cleaner(rate=10)
+        cleaner.start()
+
+        start = time.monotonic()
+        cleaner.remove(path)
+        assert time.monotonic() - start < 0.1
+
+        cleaner.shutdown()
+        assert cleaner.join(timeout=5)
+
+    def test_CallbackIsNotCalledWhenRemovalFails(self, tmpdir, monkeypatch):
+        path = release_dir(tmpdir)
+        removed = MagicMock()
+        cleaner = Cleaner()
+
+        def failing_remove(path):
+            raise PermissionError("permission denied")
+
+        monkeypatch.setattr(cleaner, '_remove', failing_remove)
+        cleaner.start()
+
+        cleaner.remove(path, removed)
+        cleaner.shutdown()
+
+        assert cleaner.join(timeout=5)
+        removed.assert_not_called()
+        assert path not in cleaner
+
+    def test_NegativeRateRaisesValueError(self):
+        with raises(ValueError):
+            Cleaner(rate=-1)
+
+
+def assert_not_exists(path: Path):
+    assert not path.exists()
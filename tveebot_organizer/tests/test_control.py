@@ -0,0 +1,190 @@
+import json
+import os
+import socket
+import stat
+import tempfile
+import time
+from pathlib import Path
+from threading import Event, Thread
+from typing import Callable, cast
+from unittest.mock import MagicMock
+
+import pytest
+
+from tveebot_organizer.control import ControlServer
+from tveebot_organizer.library_index import LibraryIndex
+from tveebot_organizer.matcher import Matcher
+from tveebot_organizer.organizer import Organizer
+from tveebot_organizer.storage_manager import StorageManager
+from tveebot_organizer.watcher import Watcher
+
+
+@pytest.fixture
+def socket_path():
+    # Paths of Unix sockets are limited to about 100 characters: keep it short
+    with tempfile.TemporaryDirectory() as directory:
+        yield Path(directory) / "control.sock"
+
+
+@pytest.fixture
+def library_dir(tmpdir):
+    return tmpdir.mkdir("library")
+
+
+@pytest.fixture
+def organizer_mock(library_dir):
+    organizer_mock = MagicMock()
+    organizer_mock.storage_manager = StorageManager(Path(library_dir))
+    organizer_mock.cleaner = None
+    return organizer_mock
+
+
+@pytest.fixture
+def watcher(tmpdir, organizer_mock):
+    watcher = Watcher(Path(tmpdir.mkdir("watch")), cast(Organizer, organizer_mock),
+                      settle_time=60)
+    watcher_thread = Thread(target=watcher.run_forever)
+    watcher_thread.start()
+    time.sleep(0.5)
+
+    yield watcher
+
+    watcher.shutdown()
+    watcher_thread.join()
+
+
+@pytest.fixture
+def client(socket_path, watcher):
+    server = ControlServer(socket_path, watcher)
+    server.start()
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(str(socket_path))
+        file = connection.makefile('rwb')
+
+        def request(command: str, **arguments) -> dict:
+            file.write(json.dumps({'command': command, **arguments}).encode() + b"\n")
+            file.flush()
+            return json.loads(file.readline())
+
+        yield request
+
+    server.shutdown()
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = 5) -> bool:
+    """ Waits until *condition* holds, and tells whether it does before *timeout* expires """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestControlServer:
+
+    def test_SocketIsOnlyAccessibleByTheOwner(self, client, socket_path):
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+        assert os.listdir(socket_path.parent) == [socket_path.name]
+
+    def test_StatusReportsTheQueuesAndRoutes(self, client, watcher, library_dir):
+        response = client('status')
+
+        assert response['ok']
+        assert not response['paused']
+        assert response['queue_depth'] == 0
+        assert response['in_flight'] == []
+        assert response['routes'] == [
+            {'watch': str(watcher.watch_dir), 'library': str(library_dir), 'episodes': None}]
+
+    def test_OrganizeSubmitsPathWithoutWaitingForItToSettle(self, client, watcher,
+                                                          organizer_mock):
+        path = watcher.watch_dir / "Castle.S08E22.mkv"
+        path.write_text("")
+
+        assert client('organize', path=str(path)) == {'ok': True, 'submitted': True}
+
+        time.sleep(0.5)
+        organizer_mock.organize.assert_called_once_with(path)
+
+    def test_PathsAreOnlyOrganizedOnceResumed(self, client, watcher, organizer_mock):
+        path = watcher.watch_dir / "Castle.S08E22.mkv"
+        path.write_text("")
+
+        assert client('pause')['ok']
+        client('organize', path=str(path))
+        time.sleep(0.5)
+        assert client('status')['paused']
+        organizer_mock.organize.assert_not_called()
+
+        assert client('resume')['ok']
+        time.sleep(0.5)
+        organizer_mock.organize.assert_called_once_with(path)
+
+    def test_SetWatchChangesTheWatchDirectory(self, client, watcher, tmpdir):
+        new_watch_dir = Path(tmpdir.mkdir("watch2"))
+
+        assert client('set_watch', directory=str(new_watch_dir)) == \
+            {'ok': True, 'watch': str(new_watch_dir)}
+        assert watcher.watch_dir == new_watch_dir
+
+    def test_SetLibraryChangesTheLibraryDirectory(self, client, organizer_mock, tmpdir):
+        new_library_dir = Path(tmpdir.mkdir("library2"))
+
+        assert client('set_library', directory=str(new_library_dir))['ok']
+        assert wait_until(lambda: organizer_mock.storage_manager.library_dir == new_library_dir)
+
+    def test_SetLibraryRepliesBeforeTheNewLibraryIsIndexed(self, client, organizer_mock, tmpdir,
+                                                           monkeypatch):
+        old_library_dir = organizer_mock.storage_manager.library_dir
+        organizer_mock.storage_manager.index = LibraryIndex(old_library_dir)
+        organizer_mock.matcher = Matcher()
+        new_library_dir = Path(tmpdir.mkdir("library2"))
+        new_library_dir.joinpath("The Office (US)").mkdir()
+        indexing = Event()
+        move = LibraryIndex.move
+        monkeypatch.setattr(LibraryIndex, 'move',
+                            lambda index, directory: indexing.wait(5) and move(index, directory))
+
+        assert client('set_library', directory=str(new_library_dir))['ok']
+        assert organizer_mock.storage_manager.library_dir == old_library_dir
+
+        indexing.set()
+        assert wait_until(lambda: organizer_mock.storage_manager.library_dir == new_library_dir)
+        assert organizer_mock.matcher.match("The.Office.US.S01E01").tvshow.name == \
+            "The Office (US)"
+
+    def test_MissingDirectoryIsAnErrorAndKeepsTheWatchDirectory(self, client, watcher, tmpdir):
+        old_watch_dir = watcher.watch_dir
+
+        response = client('set_watch', directory=str(tmpdir.join("missing")))
+
+        assert not response['ok']
+        assert watcher.watch_dir == old_watch_dir
+
+    @pytest.mark.parametrize("arguments", [
+        {'command': 'reboot'},
+        {'command': 'organize'},
+        {'command': 'organize', 'path': "relative/path"},
+    ])
+    def test_InvalidRequestIsAnError(self, client, arguments):
+        assert not client(**arguments)['ok']
+
+    def test_MalformedRequestIsAnError(self, socket_path, watcher):
+        server = ControlServer(socket_path, watcher)
+
+        assert not server.handle(b"not json")['ok']
+        assert not server.handle(b"[1, 2]")['ok']
+
+        server.shutdown()
+
+    def test_SocketInUseIsNotReplaced(self, socket_path, watcher):
+        server = ControlServer(socket_path, watcher)
+        server.start()
+
+        with pytest.raises(FileExistsError):
+            ControlServer(socket_path, watcher)
+
+        server.shutdown()
+        assert not socket_path.exists()
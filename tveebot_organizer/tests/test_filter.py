@@ -91,3 +91,96 @@ class TestFilterFindEpisodeFile:
         tmpdir.mkdir("directory.mp4")
 
         assert Filter().find_episode_file(Path(tmpdir)) is None
+
+    def test_GivenADirectoryWithTheVideoFileInASubDirectoryReturnsThatFile(self, tmpdir):
+        tmpdir.join("release.nfo").write("info")
+        video_file = tmpdir.mkdir("Video").join("episode.mkv")
+        video_file.write("")
+
+        assert Filter().find_episode_file(Path(tmpdir)) == Path(video_file)
+
+    def test_GivenADirectoryWithABiggerVideoFileInASampleDirectoryReturnsTheOtherFile(self, tmpdir):
+        tmpdir.mkdir("Sample").join("sample.mkv").write("VERY BIG SAMPLE FILE")
+        video_file = tmpdir.join("episode.mkv")
+        video_file.write("small")
+
+        assert Filter().find_episode_file(Path(tmpdir)) == Path(video_file)
+
+    def test_GivenADirectoryWithTheVideoFileDeeperThanTheMaxDepthReturnsNone(self, tmpdir):
+        tmpdir.mkdir("level1").mkdir("level2").join("episode.mkv").write("")
+
+        assert Filter(max_depth=2).find_episode_file(Path(tmpdir)) is None
+        assert Filter(max_depth=3).find_episode_file(Path(tmpdir)) is not None
+
+    def test_MaxDepthSmallerThanOneRaisesValueError(self):
+        with pytest.raises(ValueError):
+            Filter(max_depth=0)
+
+
+class TestFilterFindEpisodeFiles:
+
+    def test_GivenADirectoryReturnsEveryVideoFileLargestFirst(self, tmpdir):
+        tmpdir.join("Show.S02E01.mkv").write("small")
+        tmpdir.join("Show.S02E02.mkv").write("VERY BIG FILE")
+        tmpdir.mkdir("Season 2").join("Show.S02E03.mkv").write("medium")
+        tmpdir.join("Show.S02.nfo").write("info")
+
+        assert [path.name for path in Filter().find_episode_files(Path(tmpdir))] == \
+            ["Show.S02E02.mkv", "Show.S02E03.mkv", "Show.S02E01.mkv"]
+
+    def test_GivenAVideoFileReturnsOnlyThatFile(self, tmpdir):
+        video_file = tmpdir.join("video.mkv")
+        video_file.write("")
+
+        assert Filter().find_episode_files(Path(video_file)) == [Path(video_file)]
+
+    def test_GivenADirectoryWithNoVideoFilesReturnsEmptyList(self, tmpdir):
+        tmpdir.join("other.txt").write("this is a text file")
+
+        assert Filter().find_episode_files(Path(tmpdir)) == []
+
+
+# EBML header of a Matroska file, with its document type
+MATROSKA_HEADER = b'\x1a\x45\xdf\xa3\x9b\x42\x86\x81\x01\x42\xf7\x81\x01\x42\x82\x88matroska' \
+    b'\x42\x87\x81\x04\x42\x85\x81\x02'
+
+
+class TestFilterSniffing:
+
+    def test_NeverSniffing_ExtensionlessVideoFileIsIgnored(self, tmpdir):
+        video_file = tmpdir.join("Prison.Break.S05E09.720p")
+        video_file.write_binary(MATROSKA_HEADER)
+
+        assert Filter().find_episode_file(Path(video_file)) is None
+
+    def test_SniffingAmbiguous_ExtensionlessVideoFileIsFound(self, tmpdir):
+        video_file = tmpdir.join("Prison.Break.S05E09.720p")
+        video_file.write_binary(MATROSKA_HEADER)
+
+        assert Filter(sniff='ambiguous').find_episode_file(Path(video_file)) == Path(video_file)
+
+    def test_SniffingAmbiguous_FilesWithKnownExtensionsAreNotSniffed(self, tmpdir):
+        tmpdir.join("episode.mkv").write("")
+        tmpdir.join("episode.nfo").write_binary(MATROSKA_HEADER * 10)
+
+        assert Filter(sniff='ambiguous').find_episode_file(Path(tmpdir)) == \
+            Path(tmpdir.join("episode.mkv"))
+
+    def test_SniffingAlways_MislabeledVideoFileIsIgnored(self, tmpdir):
+        tmpdir.join("episode.mkv").write("not a video")
+        tmpdir.join("episode.mp4").write_binary(b'\x00\x00\x00\x18ftypmp42')
+
+        assert Filter(sniff='always').find_episode_file(Path(tmpdir)) == \
+            Path(tmpdir.join("episode.mp4"))
+
+    def test_SniffingAmbiguous_AudioFilesAreIgnored(self, tmpdir):
+        tmpdir.join("Prison.Break.S05E09.720p").write_binary(MATROSKA_HEADER)
+        tmpdir.join("soundtrack.mka").write_binary(MATROSKA_HEADER * 10)
+        tmpdir.join("audiobook.m4b").write_binary(b'\x00\x00\x00\x20ftypisom' * 10)
+
+        assert Filter(sniff='ambiguous').find_episode_files(Path(tmpdir)) == \
+            [Path(tmpdir.join("Prison.Break.S05E09.720p"))]
+
+    def test_InvalidSniffMode_RaisesValueError(self):
+        with pytest.raises(ValueError):
+            Filter(sniff='sometimes')
@@ -0,0 +1,84 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from tveebot_organizer import fingerprint as fingerprint_module
+from tveebot_organizer.fingerprint import Fingerprints, fingerprint
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(fingerprint_module, 'CHUNK_SIZE', 4)
+
+
+class TestFingerprint:
+
+    def test_FilesWithSameContentHaveTheSameFingerprint(self, tmpdir):
+        tmpdir.join("a.mkv").write("content")
+        tmpdir.join("b.mkv").write("content")
+
+        assert fingerprint(Path(tmpdir.join("a.mkv"))) == fingerprint(Path(tmpdir.join("b.mkv")))
+
+    def test_EmptyFileHasAFingerprint(self, tmpdir):
+        tmpdir.join("empty.mkv").write("")
+
+        assert fingerprint(Path(tmpdir.join("empty.mkv")))
+
+    @pytest.mark.parametrize('other', [
+        "HEAD-----------------tail",
+        "head--------M--------tail",
+        "head-----------------TAIL",
+        "head-----------------tail-",
+    ])
+    def test_FilesDifferingInSampledChunksOrSizeHaveOtherFingerprints(self, tmpdir, other,
+                                                                       small_chunks):
+        tmpdir.join("a.mkv").write("head-----------------tail")
+        tmpdir.join("b.mkv").write(other)
+
+        assert fingerprint(Path(tmpdir.join("a.mkv"))) != fingerprint(Path(tmpdir.join("b.mkv")))
+
+    def test_OnlyTheSampledChunksAreHashed(self, tmpdir, small_chunks):
+        tmpdir.join("a.mkv").write("head--x--------------tail")
+        tmpdir.join("b.mkv").write("head--y--------------tail")
+
+        assert fingerprint(Path(tmpdir.join("a.mkv"))) == fingerprint(Path(tmpdir.join("b.mkv")))
+
+
+class TestFingerprints:
+
+    @pytest.fixture
+    def computed(self, monkeypatch):
+        computed = []
+        original = fingerprint_module.fingerprint
+        monkeypatch.setattr(fingerprint_module, 'fingerprint',
+                            lambda path: computed.append(path) or original(path))
+        return computed
+
+    def test_FingerprintOfUnchangedFileIsComputedOnce(self, tmpdir, computed):
+        path = Path(tmpdir.join("a.mkv"))
+        path.write_text("content")
+        fingerprints = Fingerprints()
+
+        assert fingerprints.get(path) == fingerprints.get(path)
+        assert computed == [path]
+
+    def test_FingerprintOfModifiedFileIsComputedAgain(self, tmpdir, computed):
+        path = Path(tmpdir.join("a.mkv"))
+        path.write_text("content")
+        fingerprints = Fingerprints()
+        first = fingerprints.get(path)
+
+        path.write_text("other content")
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+
+        assert fingerprints.get(path) != first
+        assert len(computed) == 2
+
+    def test_CacheKeepsAtMostCacheSizeFingerprints(self, tmpdir):
+        fingerprints = Fingerprints(cache_size=2)
+        for name in ("a", "b", "c"):
+            tmpdir.join(name).write(name)
+            fingerprints.get(Path(tmpdir.join(name)))
+
+        assert len(fingerprints) == 2
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from tveebot_organizer.io_scheduler import IOScheduler, device_name
+from tveebot_organizer.metrics import Metrics
+
+
+@pytest.fixture
+def source(tmpdir) -> Path:
+    source = Path(tmpdir.join("Castle.S08E22.mkv"))
+    source.write_bytes(b"x" * 1000)
+    return source
+
+
+def max_concurrent_transfers(scheduler: IOScheduler, source: Path, transfers: int) -> int:
+    """ Runs *transfers* concurrently and returns the maximum number holding a slot at once """
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def run():
+        with scheduler.transfer(source, source.parent):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=run) for _ in range(transfers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return peak[0]
+
+
+class TestIOScheduler:
+
+    def test_LimitOfOne_TransfersInTheSameDeviceRunOneAtATime(self, source):
+        scheduler = IOScheduler(transfers_per_device=1)
+
+        assert max_concurrent_transfers(scheduler, source, transfers=4) == 1
+
+    def test_LimitOfTwo_TwoTransfersInTheSameDeviceRunAtOnce(self, source):
+        scheduler = IOScheduler(transfers_per_device=2)
+
+        assert max_concurrent_transfers(scheduler, source, transfers=4) == 2
+
+    def test_DeviceLimit_OverridesTheDefaultLimit(self, source):
+        scheduler = IOScheduler(transfers_per_device=1, device_limits={source.parent: 3})
+
+        assert scheduler.limit(os.stat(source).st_dev) == 3
+        assert max_concurrent_transfers(scheduler, source, transfers=4) == 3
+
+    def test_TransferCompletes_BytesAreRecordedForTheDevice(self, source):
+        metrics = Metrics()
+        scheduler = IOScheduler(metrics=metrics)
+        device = device_name(os.stat(source).st_dev)
+
+        with scheduler.transfer(source, source.parent):
+            pass
+
+        assert metrics.counter_value('io_bytes_total', device=device, direction='read') == 1000
+        assert metrics.counter_value('io_bytes_total', device=device, direction='write') == 1000
+
+    def test_TransferFails_SlotIsReleasedAndNothingIsRecorded(self, source):
+        metrics = Metrics()
+        scheduler = IOScheduler(metrics=metrics)
+        device = device_name(os.stat(source).st_dev)
+
+        with pytest.raises(OSError):
+            with scheduler.transfer(source, source.parent):
+                raise OSError("disk is full")
+
+        with scheduler.transfer(source, source.parent):
+            pass
+
+        assert metrics.counter_value('io_bytes_total', device=device, direction='read') == 1000
+
+    @pytest.mark.parametrize('limits', [
+        {'transfers_per_device': 0},
+        {'device_limits': {Path('/'): 0}},
+    ])
+    def test_LimitSmallerThanOne_RaisesValueError(self, limits):
+        with pytest.raises(ValueError):
+            IOScheduler(**limits)
@@ -0,0 +1,278 @@
+import os
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from tveebot_organizer import journal as journal_module
+from tveebot_organizer.filter import Filter
+from tveebot_organizer.journal import Journal
+from tveebot_organizer.matcher import Matcher
+from tveebot_organizer.organizer import Organizer, recover_routes
+from tveebot_organizer.storage_manager import StorageManager
+
+
+def reopen(journal: Journal):
+    journal.close()
+    return Journal(journal.path).open()
+
+
+class TestJournal:
+
+    def test_NewJournalHasNoUnfinishedOperations(self, tmpdir):
+        journal = Journal(Path(tmpdir) / "journal")
+
+        assert journal.open() == []
+        assert journal.path.exists()
+
+    def test_OperationNotFinishedIsReturnedWhenReopened(self, tmpdir):
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+
+        operation_id = journal.begin(Path("/watch/release"), Path("/watch/release/ep.mkv"),
+                                     Path("/library/Show/Season 01/ep.mkv"))
+
+        operations = reopen(journal)
+        assert len(operations) == 1
+        assert operations[0].id == operation_id
+        assert operations[0].source == Path("/watch/release")
+        assert operations[0].file == Path("/watch/release/ep.mkv")
+        assert operations[0].destination == Path("/library/Show/Season 01/ep.mkv")
+        assert not operations[0].stored
+
+    def test_StoredOperationIsReturnedAsStoredWhenReopened(self, tmpdir):
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+
+        journal.stored(journal.begin(Path("src"), Path("src/ep.mkv"), Path("dst/ep.mkv")))
+
+        operations = reopen(journal)
+        assert len(operations) == 1
+        assert operations[0].stored
+
+    def test_RouteAndModeOfOperationAreReturnedWhenReopened(self, tmpdir):
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+
+        journal.begin(Path("src"), Path("src/ep.mkv"), Path("dst/ep.mkv"), 'seeding', 'hardlink')
+
+        operations = reopen(journal)
+        assert operations[0].route == 'seeding'
+        assert operations[0].mode == 'hardlink'
+
+    def test_FinishedOperationIsNotReturnedWhenReopened(self, tmpdir):
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+
+        journal.finish(journal.begin(Path("src1"), Path("src1/ep.mkv"), Path("dst/ep1.mkv")))
+        journal.begin(Path("src2"), Path("src2/ep.mkv"), Path("dst/ep2.mkv"))
+
+        assert [operation.source for operation in reopen(journal)] == [Path("src2")]
+
+    def test_ReopeningRewritesJournalWithUnfinishedOperationsOnly(self, tmpdir):
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+        for index in range(10):
+            journal.finish(journal.begin(Path(f"src{index}"), Path("ep.mkv"), Path("dst.mkv")))
+        journal.begin(Path("src"), Path("src/ep.mkv"), Path("dst/ep.mkv"))
+
+        reopen(journal)
+
+        assert len(journal.path.read_text().splitlines()) == 1
+
+    def test_PartiallyWrittenRecordIsIgnored(self, tmpdir):
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+        journal.begin(Path("src"), Path("src/ep.mkv"), Path("dst/ep.mkv"))
+        journal.close()
+
+        with open(journal.path, 'a') as file:
+            file.write('{"op":"done","id":')
+
+        assert len(Journal(journal.path).open()) == 1
+
+    def test_ConcurrentRecordsAreCommittedWithFewerFsyncsThanRecords(self, tmpdir):
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+        barrier = threading.Barrier(8)
+
+        def organize(index: int):
+            barrier.wait()
+            for _ in range(20):
+                journal.finish(journal.begin(Path(f"src{index}"), Path("ep"), Path("dst")))
+
+        real_fsync = journal_module.os.fsync
+        with patch.object(journal_module.os, 'fsync', side_effect=real_fsync) as fsync_mock:
+            threads = [threading.Thread(target=organize, args=(index,)) for index in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert fsync_mock.call_count < 8 * 20 * 2
+        assert reopen(journal) == []
+
+    def test_IntentFailsToBeWritten_OperationIsNotUnfinished(self, tmpdir):
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+
+        with patch.object(journal_module.os, 'fsync', side_effect=OSError("disk failed")):
+            with pytest.raises(OSError):
+                journal.begin(Path("src"), Path("src/ep.mkv"), Path("dst/ep.mkv"))
+
+        assert journal.unfinished == 0
+
+    def test_JournalIsTruncatedOnceNoOperationIsUnfinished(self, tmpdir):
+        journal = Journal(Path(tmpdir) / "journal", compact_threshold=4)
+        journal.open()
+
+        first = journal.begin(Path("src1"), Path("ep.mkv"), Path("dst1.mkv"))
+        second = journal.begin(Path("src2"), Path("ep.mkv"), Path("dst2.mkv"))
+        journal.finish(first)
+        journal.finish(second)
+
+        assert journal.path.read_text() == ""
+
+
+class TestOrganizerRecover:
+
+    @staticmethod
+    def organizer(library_dir: Path, journal: Journal) -> Organizer:
+        return Organizer(Filter(), Matcher(), StorageManager(library_dir), journal=journal)
+
+    def test_PartialCopyIsRemovedAndSourceIsKept(self, tmpdir):
+        source = tmpdir.mkdir("watch").mkdir("release")
+        source.join("ep.mkv").write("x")
+        season_dir = tmpdir.mkdir("library").mkdir("Show").mkdir("Season 01")
+        season_dir.join(".ep.mkv.part").write("partial")
+
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+        journal.begin(Path(source), Path(source) / "ep.mkv", Path(season_dir) / "ep.mkv")
+
+        journal.close()
+
+        journal = Journal(journal.path)
+        self.organizer(Path(tmpdir) / "library", journal).recover(journal.open())
+
+        assert not season_dir.join(".ep.mkv.part").exists()
+        assert source.join("ep.mkv").exists()
+        assert reopen(journal) == []
+
+    def test_SourceIsClearedWhenEpisodeFileIsInTheLibrary(self, tmpdir):
+        source = tmpdir.mkdir("watch").mkdir("release")
+        source.join("sample.txt").write("x")
+        season_dir = tmpdir.mkdir("library").mkdir("Show").mkdir("Season 01")
+        season_dir.join("ep.mkv").write("x")
+
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+        journal.begin(Path(source), Path(source) / "ep.mkv", Path(season_dir) / "ep.mkv")
+
+        journal.close()
+
+        journal = Journal(journal.path)
+        self.organizer(Path(tmpdir) / "library", journal).recover(journal.open())
+
+        assert not source.exists()
+        assert season_dir.join("ep.mkv").exists()
+
+    def test_SourceIsKeptWhenTheDestinationExistedBefore(self, tmpdir):
+        source = tmpdir.mkdir("watch").join("ep.mkv")
+        source.write("new")
+        season_dir = tmpdir.mkdir("library").mkdir("Show").mkdir("Season 01")
+        season_dir.join("ep.mkv").write("old")
+
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+        journal.begin(Path(source), Path(source), Path(season_dir) / "ep.mkv")
+
+        journal.close()
+
+        journal = Journal(journal.path)
+        self.organizer(Path(tmpdir) / "library", journal).recover(journal.open())
+
+        assert source.read() == "new"
+        assert reopen(journal) == []
+
+    def test_OperationsAreRecoveredByTheOrganizerOfTheirRoute(self, tmpdir):
+        watch_dir, library_dir = tmpdir.mkdir("watch"), tmpdir.mkdir("library")
+        season_dir = library_dir.mkdir("Show").mkdir("Season 01")
+        moved = watch_dir.mkdir("moved")
+        seeding = watch_dir.join("seeding.mkv")
+        seeding.write("x")
+        os.link(seeding, season_dir.join("seeding.mkv"))
+        season_dir.join("moved.mkv").write("x")
+
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+        journal.begin(Path(moved), Path(moved) / "moved.mkv", Path(season_dir) / "moved.mkv",
+                      route='tv', mode='move')
+        journal.begin(Path(seeding), Path(seeding), Path(season_dir) / "seeding.mkv",
+                      route='seeding', mode='hardlink')
+        journal.close()
+
+        journal = Journal(journal.path)
+        organizers = [
+            Organizer(Filter(), Matcher(), StorageManager(Path(library_dir), mode='move'),
+                      journal=journal, route='tv'),
+            Organizer(Filter(), Matcher(), StorageManager(Path(library_dir), mode='hardlink'),
+                      journal=journal, route='seeding'),
+        ]
+        recover_routes(organizers, journal.open())
+
+        assert not moved.exists()
+        assert seeding.exists()
+        assert reopen(journal) == []
+
+    def test_MoveStoppedBeforeUnlinkingTheSource_SourceIsCleared(self, tmpdir):
+        source = tmpdir.mkdir("watch").join("ep.mkv")
+        source.write("x")
+        season_dir = tmpdir.mkdir("library").mkdir("Show").mkdir("Season 01")
+        os.link(source, season_dir.join("ep.mkv"))
+
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+        journal.begin(Path(source), Path(source), Path(season_dir) / "ep.mkv", mode='move')
+        journal.close()
+
+        journal = Journal(journal.path)
+        self.organizer(Path(tmpdir) / "library", journal).recover(journal.open())
+
+        assert not source.exists()
+        assert season_dir.join("ep.mkv").read() == "x"
+
+    def test_OperationOfAKeepSourceMode_SourceIsNeverCleared(self, tmpdir):
+        source = tmpdir.mkdir("watch").join("ep.mkv")
+        source.write("x")
+        season_dir = tmpdir.mkdir("library").mkdir("Show").mkdir("Season 01")
+        os.link(source, season_dir.join("ep.mkv"))
+
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+        operation = journal.begin(Path(source), Path(source), Path(season_dir) / "ep.mkv",
+                                  route='gone', mode='hardlink')
+        journal.stored(operation)
+        journal.close()
+
+        journal = Journal(journal.path)
+        recover_routes([self.organizer(Path(tmpdir) / "library", journal)], journal.open())
+
+        assert source.exists()
+
+    def test_OrganizedEpisodeLeavesNoUnfinishedOperation(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+        watch_dir.join("Prison.Break.S05E01.mkv").write("x")
+        tmpdir.mkdir("library")
+
+        journal = Journal(Path(tmpdir) / "journal")
+        journal.open()
+        organizer = self.organizer(Path(tmpdir) / "library", journal)
+
+        organizer.organize(Path(watch_dir) / "Prison.Break.S05E01.mkv")
+
+        assert tmpdir.join("library", "Prison Break", "Season 05",
+                           "Prison.Break.S05E01.mkv").exists()
+        assert journal.unfinished == 0
+        assert reopen(journal) == []
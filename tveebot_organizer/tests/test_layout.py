@@ -0,0 +1,40 @@
+import pytest
+
+from tveebot_organizer.dataclasses import Episode, TVShow
+from tveebot_organizer.layout import Layout
+
+
+class TestLayout:
+
+    def test_DefaultLayoutStoresEpisodesInSeasonDirectoryInsideTVShowDirectory(self):
+        episode = Episode(TVShow("Prison Break"), season=5, number=9)
+
+        assert Layout().episode_dir(episode) == "Prison Break/Season 05"
+
+    def test_EpisodeDirectoryFollowsThePattern(self):
+        layout = Layout('{show}/{show} S{season}')
+        episode = Episode(TVShow("Castle"), season=8, number=22)
+
+        assert layout.episode_dir(episode) == "Castle/Castle S8"
+        assert layout.depth == 2
+
+    def test_ParsingAnEpisodeDirectoryReturnsItsTVShowAndSeason(self):
+        assert Layout().parse("Prison Break/Season 05") == (TVShow("Prison Break"), 5)
+        assert Layout('{show} - {season}').parse("Castle - 8") == (TVShow("Castle"), 8)
+
+    def test_ParsingADirectoryNotFollowingTheLayoutReturnsNone(self):
+        assert Layout().parse("Prison Break/Specials") is None
+        assert Layout().parse("Prison Break") is None
+        assert Layout('{show}/{show} S{season}').parse("Castle/Other S8") is None
+
+    @pytest.mark.parametrize('pattern', [
+        '{show}',
+        'Season {season}',
+        '{show}/{episode}',
+        '/{show}/Season {season}',
+        '{show}/../Season {season}',
+        '{show}/Season {season:q}',
+    ])
+    def test_InvalidPatternRaisesValueError(self, pattern):
+        with pytest.raises(ValueError):
+            Layout(pattern)
@@ -0,0 +1,107 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from tveebot_organizer.dataclasses import Episode, TVShow
+from tveebot_organizer.filter import Filter
+from tveebot_organizer.layout import Layout
+from tveebot_organizer.library_index import LibraryIndex
+
+
+@pytest.fixture
+def library_dir(tmpdir):
+    library_dir = tmpdir.mkdir("library")
+    season_dir = library_dir.mkdir("Prison Break").mkdir("Season 05")
+    season_dir.join("Prison.Break.S05E09.720p.mkv").write("")
+    season_dir.join("Prison.Break.S05E10.720p.mkv").write("")
+    season_dir.join("Prison.Break.S05E10.720p.nfo").write("")
+    library_dir.mkdir("Castle 2009").mkdir("Season 08").join("Castle.S08E22.mp4").write("")
+    return library_dir
+
+
+class TestLibraryIndex:
+
+    def test_ScanIndexesEveryEpisodeInTheLibrary(self, library_dir):
+        index = LibraryIndex(Path(library_dir))
+
+        index.scan()
+
+        assert len(index) == 3
+        assert Episode(TVShow("Prison Break"), season=5, number=9) in index
+        assert Episode(TVShow("Prison Break"), season=5, number=10) in index
+        assert index.get(Episode(TVShow("Castle 2009"), season=8, number=22)) == \
+            Path(library_dir) / "Castle 2009" / "Season 08" / "Castle.S08E22.mp4"
+
+    def test_AddingAnEpisodeAlreadyInTheIndexReturnsFalse(self, library_dir):
+        index = LibraryIndex(Path(library_dir))
+        index.scan()
+
+        assert not index.add(Episode(TVShow("Prison Break"), season=5, number=9), Path("other"))
+        assert index.add(Episode(TVShow("Prison Break"), season=5, number=11), Path("other"))
+
+    def test_LoadingASavedSnapshotRestoresTheIndex(self, library_dir, tmpdir):
+        snapshot = Path(tmpdir.join("index.json"))
+        index = LibraryIndex(Path(library_dir))
+        index.scan()
+        index.save(snapshot)
+
+        loaded_index = LibraryIndex(Path(library_dir))
+        loaded_index.load(snapshot)
+
+        assert len(loaded_index) == 3
+        assert Episode(TVShow("Castle 2009"), season=8, number=22) in loaded_index
+
+    def test_LoadingASnapshotDoesNotScanUnchangedSeasonDirectories(self, library_dir, tmpdir,
+                                                                   monkeypatch):
+        snapshot = Path(tmpdir.join("index.json"))
+        index = LibraryIndex(Path(library_dir))
+        index.scan()
+        index.save(snapshot)
+
+        # Add an episode to one of the season directories
+        season_dir = library_dir.join("Castle 2009").join("Season 08")
+        season_dir.join("Castle.S08E21.mp4").write("")
+        os.utime(str(season_dir), ns=(0, os.stat(str(season_dir)).st_mtime_ns + 10 ** 9))
+
+        scanned = []
+        loaded_index = LibraryIndex(Path(library_dir))
+        original_scan = loaded_index._scan_season_dir
+        monkeypatch.setattr(loaded_index, '_scan_season_dir',
+                            lambda *args: scanned.append(args[0]) or original_scan(*args))
+        loaded_index.load(snapshot)
+
+        assert scanned == [os.path.join("Castle 2009", "Season 08")]
+        assert len(loaded_index) == 4
+
+    def test_LoadingAMissingSnapshotScansTheLibrary(self, library_dir, tmpdir):
+        index = LibraryIndex(Path(library_dir))
+
+        index.load(Path(tmpdir.join("missing.json")))
+
+        assert len(index) == 3
+
+    def test_ScanIndexesSniffedEpisodeFilesAsTheFilterDoes(self, library_dir):
+        season_dir = library_dir.join("Prison Break", "Season 05")
+        season_dir.join("Prison.Break.S05E11.720p").write_binary(
+            b'\x1a\x45\xdf\xa3\x8b\x42\x82\x88matroska')
+        season_dir.join("Prison.Break.S05E12.720p").write("not a video")
+        index = LibraryIndex(Path(library_dir), filter=Filter(sniff='ambiguous'))
+
+        index.scan()
+
+        assert index.get(Episode(TVShow("Prison Break"), season=5, number=11)) == \
+            Path(season_dir) / "Prison.Break.S05E11.720p"
+        assert Episode(TVShow("Prison Break"), season=5, number=12) not in index
+
+    def test_ScanFollowsTheLayoutOfTheLibrary(self, tmpdir):
+        library_dir = tmpdir.mkdir("library")
+        tvshow_dir = library_dir.mkdir("Castle")
+        tvshow_dir.mkdir("S8").join("Castle.S08E22.mp4").write("")
+        tvshow_dir.mkdir("Season 08").join("Castle.S08E21.mp4").write("")
+        index = LibraryIndex(Path(library_dir), layout=Layout('{show}/S{season}'))
+
+        index.scan()
+
+        assert index.items() == [(Episode(TVShow("Castle"), season=8, number=22),
+                                  Path(library_dir) / "Castle" / "S8" / "Castle.S08E22.mp4")]
@@ -12,6 +12,14 @@ class TestMatcher:
         ("Prison.Break.S1E1", Episode(TVShow("Prison Break"), season=1, number=1)),
         ("prison.break.S01E01", Episode(TVShow("Prison Break"), season=1, number=1)),
         ("PRison.BrEAk.S01E01", Episode(TVShow("Prison Break"), season=1, number=1)),
+        ("Prison Break S05E09 720p", Episode(TVShow("Prison Break"), season=5, number=9)),
+        ("Prison_Break_S05E09_720p", Episode(TVShow("Prison Break"), season=5, number=9)),
+        ("Prison-Break-s05e09-720p", Episode(TVShow("Prison Break"), season=5, number=9)),
+        ("Prison.Break.5x09.720p", Episode(TVShow("Prison Break"), season=5, number=9)),
+        ("Prison.Break.S05E09E10.720p", Episode(TVShow("Prison Break"), season=5, number=9)),
+        ("The.Daily.Show.2017.03.21.720p",
+         Episode(TVShow("The Daily Show"), season=2017, number=321)),
+        ("The Daily Show 2017 03 21", Episode(TVShow("The Daily Show"), season=2017, number=321)),
     ])
     def test_valid_names(self, name, expected_episode):
         assert Matcher().match(name) == expected_episode
@@ -23,7 +31,27 @@ class TestMatcher:
         "Prison.Break.SE1.720p.HDTV.x264-KILLERS[rarbg]",
         "Prison.Break.SaEa.1720p.HDTV.x264-KILLERS[rarbg]",
         "Prison.Break.S1E720p.HDTV.x264-KILLERS[rarbg]",
+        "Prison.Break.720x480.HDTV.x264-KILLERS[rarbg]",
+        "The.Daily.Show.2017.13.21.720p",
+        "The.Daily.Show.2017.03-21.720p",
     ])
     def test_invalid_names(self, name):
         with pytest.raises(ValueError):
             Matcher().match(name)
+
+    @pytest.mark.parametrize("name, expected_episodes", [
+        ("Prison.Break.S05E09", [Episode(TVShow("Prison Break"), season=5, number=9)]),
+        ("Prison.Break.S05E09E10", [Episode(TVShow("Prison Break"), season=5, number=9),
+                                    Episode(TVShow("Prison Break"), season=5, number=10)]),
+        ("Prison.Break.S05E09-E11", [Episode(TVShow("Prison Break"), season=5, number=9),
+                                     Episode(TVShow("Prison Break"), season=5, number=10),
+                                     Episode(TVShow("Prison Break"), season=5, number=11)]),
+    ])
+    def test_match_all(self, name, expected_episodes):
+        assert Matcher().match_all(name) == expected_episodes
+
+    def test_NonASCIINamesOfDifferentTVShowsAreNotMerged(self):
+        matcher = Matcher()
+        matcher.match("Дом.S01E01.720p")
+
+        assert matcher.match("Кухня.S02E03.720p") == Episode(TVShow("Кухня"), season=2, number=3)
@@ -0,0 +1,82 @@
+import json
+from pathlib import Path
+from urllib.request import urlopen
+
+from tveebot_organizer.metrics import Metrics, MetricsServer, StatsFileWriter
+
+
+class TestMetrics:
+
+    def test_CountersAreRenderedWithTheirLabels(self):
+        metrics = Metrics(namespace='test')
+        metrics.describe('organized_total', "Paths organized.")
+        metrics.inc('organized_total', result='stored')
+        metrics.inc('organized_total', result='stored')
+        metrics.inc('organized_total', result='ignored')
+
+        rendered = metrics.render()
+
+        assert "# HELP test_organized_total Paths organized." in rendered
+        assert "# TYPE test_organized_total counter" in rendered
+        assert 'test_organized_total{result="stored"} 2' in rendered
+        assert 'test_organized_total{result="ignored"} 1' in rendered
+
+    def test_HistogramBucketsAreCumulative(self):
+        metrics = Metrics(namespace='test', buckets=(0.1, 1.0))
+        metrics.observe('stage_seconds', 0.05, stage='store')
+        metrics.observe('stage_seconds', 0.5, stage='store')
+        metrics.observe('stage_seconds', 5, stage='store')
+
+        rendered = metrics.render()
+
+        assert 'test_stage_seconds_bucket{stage="store",le="0.1"} 1' in rendered
+        assert 'test_stage_seconds_bucket{stage="store",le="1"} 2' in rendered
+        assert 'test_stage_seconds_bucket{stage="store",le="+Inf"} 3' in rendered
+        assert 'test_stage_seconds_count{stage="store"} 3' in rendered
+
+    def test_GaugesAreReadWhenRendering(self):
+        metrics = Metrics(namespace='test')
+        queue = [1, 2, 3]
+        metrics.gauge('queue_depth', lambda: len(queue))
+
+        queue.append(4)
+
+        assert "test_queue_depth 4" in metrics.render()
+
+    def test_TimeRecordsTheDurationOfTheBlock(self):
+        metrics = Metrics()
+
+        with metrics.time('stage_seconds', stage='filter'):
+            pass
+
+        histogram = metrics.snapshot()['histograms']['stage_seconds']['{stage="filter"}']
+        assert histogram['count'] == 1
+
+
+class TestMetricsExporters:
+
+    def test_ServerServesMetricsInThePrometheusFormat(self):
+        metrics = Metrics(namespace='test')
+        metrics.inc('organized_total', result='stored')
+        server = MetricsServer(metrics, port=0)
+        server.start()
+
+        try:
+            with urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+
+        assert 'test_organized_total{result="stored"} 1' in body
+
+    def test_StatsFileIsWrittenOnShutdown(self, tmpdir):
+        metrics = Metrics()
+        metrics.inc('stored_bytes_total', 1024)
+        stats_file = Path(tmpdir.join("stats.json"))
+        writer = StatsFileWriter(metrics, stats_file, interval=60)
+        writer.start()
+
+        writer.shutdown()
+
+        with open(stats_file) as file:
+            assert json.load(file)['counters']['stored_bytes_total'] == {'total': 1024}
@@ -0,0 +1,97 @@
+import pytest
+
+from tveebot_organizer.dataclasses import TVShow
+from tveebot_organizer.normalizer import Normalizer
+
+
+class TestNormalizer:
+
+    @pytest.mark.parametrize("raw_name, expected_tvshow", [
+        ("Prison.Break.", TVShow("Prison Break")),
+        ("PRison BrEAk ", TVShow("Prison Break")),
+        ("Castle_2009_", TVShow("Castle 2009")),
+        ("Marvels.Agents.of.S.H.I.E.L.D.", TVShow("Marvels Agents Of S.H.I.E.L.D.")),
+        ("The.X.Files.", TVShow("The X Files")),
+    ])
+    def test_NamesWithoutAliasesAreCapitalized(self, raw_name, expected_tvshow):
+        assert Normalizer().normalize(raw_name) == expected_tvshow
+
+    @pytest.mark.parametrize("name, other_name", [
+        ("Its Always Sunny", "It's.Always.Sunny"),
+        ("Marvel's Agents of S.H.I.E.L.D.", "marvels.agents.of.shield"),
+        ("Prison Break", "PRISON_BREAK"),
+        ("Élite", "Elite"),
+        ("Pokémon", "POKEMON"),
+        ("Дом", "ДОМ"),
+    ])
+    def test_DifferentSpellingsOfTheSameTVShowHaveTheSameKey(self, name, other_name):
+        assert Normalizer.key(name) == Normalizer.key(other_name)
+
+    def test_NonASCIINamesKeepTheirWords(self):
+        assert Normalizer.key("Pokémon") == "pokemon"
+        assert Normalizer.key("Кухня") == "кухня"
+
+    def test_DifferentNonASCIINamesAreNotMerged(self):
+        normalizer = Normalizer()
+
+        assert normalizer.normalize("Дом.") == TVShow("Дом")
+        assert normalizer.normalize("Кухня.") == TVShow("Кухня")
+
+    def test_NamesWithAnEmptyKeyAreNeverMerged(self):
+        normalizer = Normalizer()
+        normalizer.add_known_names(["!!!"])
+
+        assert normalizer.normalize("???.") == TVShow("???")
+        assert normalizer.normalize("!!!.") == TVShow("!!!")
+
+    def test_AliasesAreMappedToTheirCanonicalName(self):
+        normalizer = Normalizer({"Its Always Sunny": "It's Always Sunny in Philadelphia"})
+
+        assert normalizer.normalize("Its.Always.Sunny.") == \
+            TVShow("It's Always Sunny in Philadelphia")
+        assert normalizer.normalize("It's.Always.Sunny.") == \
+            TVShow("It's Always Sunny in Philadelphia")
+
+    def test_DifferentSpellingsAreMappedToTheFirstSpellingSeen(self):
+        normalizer = Normalizer()
+
+        assert normalizer.normalize("Marvels.Agents.of.S.H.I.E.L.D.") == \
+            normalizer.normalize("Marvels.Agents.of.SHIELD.")
+
+    def test_NamesAreMappedToKnownNames(self):
+        normalizer = Normalizer()
+        normalizer.add_known_names(["Marvel's Agents of S.H.I.E.L.D."])
+
+        assert normalizer.normalize("Marvels.Agents.of.S.H.I.E.L.D.") == \
+            TVShow("Marvel's Agents of S.H.I.E.L.D.")
+
+    def test_SettingKnownNamesForgetsThePreviousOnes(self):
+        normalizer = Normalizer()
+        normalizer.add_known_names(["The Office (US)"])
+        normalizer.set_known_names(["Castle (2009)"])
+
+        assert normalizer.normalize("The.Office.US.") == TVShow("The Office Us")
+        assert normalizer.normalize("Castle.2009.") == TVShow("Castle (2009)")
+
+    def test_AliasesTakePrecedenceOverKnownNames(self):
+        normalizer = Normalizer({"Castle": "Castle 2009"})
+        normalizer.add_known_names(["Castle"])
+
+        assert normalizer.normalize("Castle.") == TVShow("Castle 2009")
+
+    def test_LoadsAliasTableFromFile(self, tmpdir):
+        aliases_file = tmpdir.join("aliases.ini")
+        aliases_file.write("[aliases]\n"
+                           "Marvels Agents of SHIELD = Marvel's Agents of S.H.I.E.L.D.\n")
+
+        normalizer = Normalizer.from_file(aliases_file)
+
+        assert normalizer.normalize("marvels.agents.of.s.h.i.e.l.d.") == \
+            TVShow("Marvel's Agents of S.H.I.E.L.D.")
+
+    def test_InvalidAliasTableRaisesValueError(self, tmpdir):
+        aliases_file = tmpdir.join("aliases.ini")
+        aliases_file.write("not an ini file")
+
+        with pytest.raises(ValueError):
+            Normalizer.from_file(aliases_file)
@@ -0,0 +1,182 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from tveebot_organizer.dataclasses import Episode, TVShow
+from tveebot_organizer.filter import Filter
+from tveebot_organizer.library_index import LibraryIndex
+from tveebot_organizer.matcher import Matcher
+from tveebot_organizer.organizer import Organizer
+from tveebot_organizer.retry_queue import RetryQueue
+from tveebot_organizer.storage_manager import StorageManager
+
+
+class TestOrganizerPlan:
+
+    @pytest.fixture
+    def watch_dir(self, tmpdir):
+        return tmpdir.mkdir("watch")
+
+    @pytest.fixture
+    def library_dir(self, tmpdir):
+        return tmpdir.mkdir("library")
+
+    @staticmethod
+    def organizer(library_dir, duplicates: str = 'keep') -> Organizer:
+        index = LibraryIndex(Path(library_dir))
+        index.scan()
+        return Organizer(Filter(), Matcher(), StorageManager(Path(library_dir), index,
+                                                             duplicates=duplicates))
+
+    def test_EpisodeFileIsPlannedToBeStoredInItsEpisodeDir(self, watch_dir, library_dir):
+        watch_dir.join("Prison.Break.S05E09.mkv").write("")
+
+        entries = self.organizer(library_dir).plan([Path(watch_dir) / "Prison.Break.S05E09.mkv"])
+
+        assert len(entries) == 1
+        assert entries[0].status == 'store'
+        assert entries[0].episode == Episode(TVShow("Prison Break"), season=5, number=9)
+        assert entries[0].destination == \
+            Path(library_dir) / "Prison Break" / "Season 05" / "Prison.Break.S05E09.mkv"
+
+    def test_PathsAreClassifiedInTheSameOrder(self, watch_dir, library_dir):
+        library_dir.mkdir("Prison Break").mkdir("Season 05").join("Prison.Break.S05E01.mkv") \
+            .write("E01")
+        names = ["readme.txt", "Some.Movie.mkv", "Prison.Break.S05E01.HDTV.mkv",
+                 "Prison.Break.S05E02.mkv", "Prison.Break.S05E02.720p.mkv"]
+        for name in names:
+            watch_dir.join(name).write("E02" if "E02" in name else "E01")
+
+        entries = self.organizer(library_dir, 'skip').plan(
+            [Path(watch_dir) / name for name in names], workers=4)
+
+        assert [entry.source.name for entry in entries] == names
+        assert [entry.status for entry in entries] == \
+            ['ignored', 'unmatched', 'duplicate', 'store', 'duplicate']
+
+    def test_BrokenSymlinkIsIgnoredAndOtherPathsArePlanned(self, watch_dir, library_dir):
+        watch_dir.join("Prison.Break.S05E09.mkv").write("")
+        os.symlink(watch_dir.join("missing.mkv"), watch_dir.join("Prison.Break.S05E10.mkv"))
+        names = ["Prison.Break.S05E10.mkv", "Prison.Break.S05E09.mkv"]
+
+        entries = self.organizer(library_dir).plan([Path(watch_dir) / name for name in names])
+
+        assert [entry.status for entry in entries] == ['ignored', 'store']
+
+    def test_PlanningDoesNotChangeAnything(self, watch_dir, library_dir):
+        watch_dir.join("Prison.Break.S05E09.mkv").write("")
+
+        self.organizer(library_dir).plan([Path(watch_dir) / "Prison.Break.S05E09.mkv"])
+
+        assert watch_dir.join("Prison.Break.S05E09.mkv").exists()
+        assert library_dir.listdir() == []
+
+
+class TestOrganizerSeasonPacks:
+
+    @pytest.fixture
+    def watch_dir(self, tmpdir):
+        return tmpdir.mkdir("watch")
+
+    @pytest.fixture
+    def library_dir(self, tmpdir):
+        return tmpdir.mkdir("library")
+
+    @pytest.fixture
+    def pack_dir(self, watch_dir):
+        pack_dir = watch_dir.mkdir("Prison.Break.S05.1080p")
+        for number in range(1, 4):
+            pack_dir.join(f"Prison.Break.S05E0{number}.1080p.mkv").write("episode")
+        pack_dir.join("Prison.Break.S05.nfo").write("info")
+        return pack_dir
+
+    @staticmethod
+    def organizer(library_dir) -> Organizer:
+        index = LibraryIndex(Path(library_dir))
+        index.scan()
+        return Organizer(Filter(), Matcher(), StorageManager(Path(library_dir), index))
+
+    def test_EveryEpisodeIsStoredAndThePackIsCleared(self, library_dir, pack_dir):
+        self.organizer(library_dir).organize(Path(pack_dir))
+
+        assert sorted(path.basename for path in
+                      library_dir.join("Prison Break", "Season 05").listdir()) == \
+            [f"Prison.Break.S05E0{number}.1080p.mkv" for number in range(1, 4)]
+        assert not pack_dir.exists()
+
+    def test_SomeEpisodeFailsToBeStored_PackIsKept(self, library_dir, pack_dir, monkeypatch):
+        organizer = self.organizer(library_dir)
+        store_episode = organizer.storage_manager._store_episode
+
+        def fail_second_episode(episode, path, progress=None, make_dirs=True):
+            if episode.number == 2:
+                raise OSError("disk is full")
+            store_episode(episode, path, progress, make_dirs)
+
+        monkeypatch.setattr(organizer.storage_manager, '_store_episode', fail_second_episode)
+
+        organizer.organize(Path(pack_dir))
+
+        assert [path.basename for path in pack_dir.listdir() if path.ext == '.mkv'] == \
+            ["Prison.Break.S05E02.1080p.mkv"]
+
+    def test_EveryEpisodeIsAlreadyInTheLibrary_PackIsKept(self, library_dir, pack_dir):
+        season_dir = library_dir.mkdir("Prison Break").mkdir("Season 05")
+        for number in range(1, 4):
+            season_dir.join(f"Prison.Break.S05E0{number}.1080p.mkv").write("other")
+
+        self.organizer(library_dir).organize(Path(pack_dir))
+
+        assert sorted(path.basename for path in pack_dir.listdir() if path.ext == '.mkv') == \
+            [f"Prison.Break.S05E0{number}.1080p.mkv" for number in range(1, 4)]
+        assert season_dir.join("Prison.Break.S05E01.1080p.mkv").read() == "other"
+
+    def test_PackIsPlannedEpisodeByEpisode(self, library_dir, pack_dir):
+        entries = self.organizer(library_dir).plan([Path(pack_dir)])
+
+        assert sorted(entry.episode.number for entry in entries) == [1, 2, 3]
+        assert all(entry.status == 'store' for entry in entries)
+
+    def test_DirectoryWithASampleOfTheSameEpisode_IsNotAPack(self, watch_dir, library_dir):
+        release_dir = watch_dir.mkdir("Prison.Break.S05E09.720p")
+        release_dir.join("Prison.Break.S05E09.720p.mkv").write("episode")
+        release_dir.join("Prison.Break.S05E09.720p.sample.mkv").write("")
+
+        self.organizer(library_dir).organize(Path(release_dir))
+
+        assert [path.basename for path in library_dir.join("Prison Break", "Season 05").listdir()] \
+            == ["Prison.Break.S05E09.720p.mkv"]
+
+
+class TestOrganizerRetries:
+
+    @pytest.fixture
+    def watch_dir(self, tmpdir):
+        return tmpdir.mkdir("watch")
+
+    @pytest.fixture
+    def library_dir(self, tmpdir):
+        return tmpdir.mkdir("library")
+
+    @staticmethod
+    def organizer(library_dir, retry_queue: RetryQueue) -> Organizer:
+        return Organizer(Filter(), Matcher(), StorageManager(Path(library_dir)),
+                         retry_queue=retry_queue)
+
+    def test_LibraryIsGone_PathIsRetriedOnceItIsBack(self, watch_dir, library_dir):
+        source = Path(watch_dir.join("Prison.Break.S05E09.mkv"))
+        source.write_text("")
+        retry_queue = RetryQueue()
+        organizer = self.organizer(library_dir, retry_queue)
+        library_dir.remove()
+
+        organizer.organize(source)
+
+        assert retry_queue.get(source).kind == 'unavailable'
+
+        library_dir.mkdir()
+        organizer.organize(source)
+
+        assert source not in retry_queue
+        assert library_dir.join("Prison Break", "Season 05", source.name).check()
@@ -0,0 +1,102 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from tveebot_organizer.layout import Layout
+from tveebot_organizer.normalizer import Normalizer
+from tveebot_organizer.relayout import Move, Relayout
+
+
+@pytest.fixture
+def library_dir(tmpdir):
+    library_dir = tmpdir.mkdir("library")
+    season_dir = library_dir.mkdir("Prison Break").mkdir("Season 05")
+    season_dir.join("Prison.Break.S05E09.720p.mkv").write("")
+    season_dir.join("Prison.Break.S05E09.720p.srt").write("")
+    season_dir.join("Prison.Break.S05E10.720p.mkv").write("")
+    library_dir.mkdir("Castle").mkdir("Season 08").join("Castle.S08E22.mp4").write("")
+    return Path(library_dir)
+
+
+NEW_LAYOUT = Layout('{show}/S{season}')
+
+
+class TestRelayout:
+
+    def test_EpisodesAreMovedToTheNewLayout(self, library_dir):
+        relayout = Relayout(library_dir, Layout(), NEW_LAYOUT)
+
+        results = relayout.run()
+
+        assert results['moved'] == 4
+        assert (library_dir / "Prison Break" / "S5" / "Prison.Break.S05E09.720p.mkv").is_file()
+        assert (library_dir / "Prison Break" / "S5" / "Prison.Break.S05E09.720p.srt").is_file()
+        assert (library_dir / "Prison Break" / "S5" / "Prison.Break.S05E10.720p.mkv").is_file()
+        assert (library_dir / "Castle" / "S8" / "Castle.S08E22.mp4").is_file()
+
+    def test_EmptiedDirectoriesAndProgressFileAreRemoved(self, library_dir):
+        relayout = Relayout(library_dir, Layout(), Layout('{show} - {season}'))
+
+        relayout.run()
+
+        assert sorted(path.name for path in library_dir.iterdir()) == \
+            ["Castle - 8", "Prison Break - 5"]
+
+    def test_EpisodesAlreadyInPlaceAreNotMoved(self, library_dir):
+        (library_dir / "Castle" / "S8").mkdir()
+        (library_dir / "Castle" / "Season 08" / "Castle.S08E22.mp4").rename(
+            library_dir / "Castle" / "S8" / "Castle.S08E22.mp4")
+        relayout = Relayout(library_dir, NEW_LAYOUT, NEW_LAYOUT)
+
+        assert relayout.plan() == []
+
+    def test_TVShowNamesAreNormalizedAgain(self, library_dir):
+        normalizer = Normalizer(aliases={"Castle": "Castle 2009"})
+        relayout = Relayout(library_dir, Layout(), Layout(), normalizer)
+
+        assert relayout.plan() == [Move(
+            library_dir / "Castle" / "Season 08" / "Castle.S08E22.mp4",
+            library_dir / "Castle 2009" / "Season 08" / "Castle.S08E22.mp4")]
+
+    def test_ExistingDestinationIsAConflictAndKeepsTheProgressFile(self, library_dir):
+        (library_dir / "Castle" / "S8").mkdir()
+        (library_dir / "Castle" / "S8" / "Castle.S08E22.mp4").write_text("other")
+        relayout = Relayout(library_dir, Layout(), NEW_LAYOUT)
+
+        results = relayout.run()
+
+        assert results['conflict'] == 1
+        assert (library_dir / "Castle" / "Season 08" / "Castle.S08E22.mp4").is_file()
+        assert relayout.progress_file.is_file()
+
+    def test_InterruptedRelayoutResumesFromTheProgressFile(self, library_dir, monkeypatch):
+        relayout = Relayout(library_dir, Layout(), NEW_LAYOUT)
+        moves = relayout.plan()
+        relayout._start_progress(moves)
+
+        # The first move completed before the relayout was interrupted
+        moves[0].destination.parent.mkdir(parents=True)
+        moves[0].source.rename(moves[0].destination)
+        with open(relayout.progress_file, 'a') as file:
+            file.write(json.dumps({'done': 0}) + "\n")
+
+        moved = []
+        original_move = relayout._move
+        monkeypatch.setattr(relayout, 'plan', lambda: pytest.fail("library was scanned again"))
+        monkeypatch.setattr(relayout, '_move', lambda move: moved.append(move) or
+                            original_move(move))
+
+        results = relayout.run()
+
+        assert results['moved'] == len(moves)
+        assert sorted(moved) == sorted(moves[1:])
+        assert not relayout.progress_file.exists()
+
+    def test_ProgressFileForAnotherLayoutIsIgnored(self, library_dir):
+        Relayout(library_dir, Layout(), NEW_LAYOUT)._start_progress([])
+        relayout = Relayout(library_dir, Layout(), Layout('{show} - {season}'))
+
+        results = relayout.run()
+
+        assert results['moved'] == 4
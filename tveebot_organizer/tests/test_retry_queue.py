@@ -0,0 +1,202 @@
+import errno
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from tveebot_organizer.retry_queue import RetryPolicy, RetryQueue, classify
+
+POLICIES = {
+    'unavailable': RetryPolicy(0, 60, 3600),
+    'transient': RetryPolicy(2, 0.01, 0.01),
+    'other': RetryPolicy(1, 60, 600),
+}
+
+
+@pytest.fixture
+def source(tmpdir) -> Path:
+    source = Path(tmpdir.mkdir("watch").join("Castle.S08E22.mkv"))
+    source.write_text("")
+    return source
+
+
+@pytest.fixture
+def library_dir(tmpdir) -> Path:
+    return Path(tmpdir.mkdir("library"))
+
+
+class Submitted:
+    """ Records the paths submitted by the retry queue """
+
+    def __init__(self):
+        self.paths = []
+        self.event = threading.Event()
+
+    def __call__(self, path: Path):
+        self.paths.append(path)
+        self.event.set()
+
+
+class TestClassify:
+
+    @pytest.mark.parametrize('error_number, kind', [
+        (errno.ENOSPC, 'no_space'),
+        (errno.ESTALE, 'transient'),
+        (errno.ENOTCONN, 'unavailable'),
+        (errno.EACCES, 'permanent'),
+        (errno.EEXIST, 'other'),
+    ])
+    def test_ErrorIsClassifiedByItsNumber(self, library_dir, error_number, kind):
+        assert classify(OSError(error_number, "error"), library_dir) == kind
+
+    def test_FileNotFoundAndLibraryIsGone_LibraryIsUnavailable(self, tmpdir):
+        assert classify(FileNotFoundError(errno.ENOENT, "error"), Path(tmpdir) / "gone") == \
+            'unavailable'
+
+    def test_FileNotFoundAndLibraryExists_IsOtherError(self, library_dir):
+        assert classify(FileNotFoundError(errno.ENOENT, "error"), library_dir) == 'other'
+
+
+class TestRetryQueue:
+
+    def test_TransientError_PathIsSubmittedAfterItsDelay(self, source, library_dir):
+        retry_queue = RetryQueue(policies=POLICIES, probe_interval=0.01)
+        submitted = Submitted()
+        retry_queue.start(submitted)
+        try:
+            assert retry_queue.add(source, library_dir, OSError(errno.ESTALE, "stale"))
+            assert submitted.event.wait(timeout=5)
+        finally:
+            retry_queue.shutdown()
+
+        assert submitted.paths == [source]
+        assert retry_queue.get(source).attempts == 1
+
+    def test_ErrorWithoutPolicy_PathIsGivenUp(self, source, library_dir):
+        retry_queue = RetryQueue(policies=POLICIES)
+
+        assert not retry_queue.add(source, library_dir, OSError(errno.EACCES, "denied"))
+        assert source not in retry_queue
+
+    def test_PathRetriedAsManyTimesAsThePolicyAllows_IsGivenUp(self, source, library_dir):
+        retry_queue = RetryQueue(policies=POLICIES, probe_interval=0.01)
+        error = OSError(errno.ESTALE, "stale")
+        results = []
+        given_up = threading.Event()
+
+        def fail_again(path: Path):
+            results.append(retry_queue.add(path, library_dir, error))
+            if not results[-1]:
+                given_up.set()
+
+        retry_queue.add(source, library_dir, error)
+        retry_queue.start(fail_again)
+        try:
+            assert given_up.wait(timeout=5)
+        finally:
+            retry_queue.shutdown()
+
+        assert results == [True, False]
+        assert source not in retry_queue
+
+    def test_LibraryComesBack_PathsAreSubmittedRightAway(self, tmpdir, source):
+        library_dir = Path(tmpdir) / "library"
+        other_source = source.with_name("Castle.S08E23.mkv")
+        other_source.write_text("")
+        retry_queue = RetryQueue(policies=POLICIES, probe_interval=0.01)
+        for path in (source, other_source):
+            retry_queue.add(path, library_dir, FileNotFoundError(errno.ENOENT, "gone"))
+
+        submitted = Submitted()
+        retry_queue.start(submitted)
+        try:
+            assert not submitted.event.wait(timeout=0.1)
+            library_dir.mkdir()
+            assert submitted.event.wait(timeout=5)
+        finally:
+            retry_queue.shutdown()
+
+        assert sorted(submitted.paths) == [source, other_source]
+
+    def test_ProbingAHungLibrary_DoesNotBlockAddingPaths(self, tmpdir, source, library_dir):
+        probing, release = threading.Event(), threading.Event()
+        is_dir = Path.is_dir
+
+        def hung_is_dir(path: Path) -> bool:
+            if threading.current_thread().name == "retry-queue":
+                probing.set()
+                release.wait(timeout=5)
+            return is_dir(path)
+
+        retry_queue = RetryQueue(policies=POLICIES, probe_interval=0.01)
+        retry_queue.add(source, Path(tmpdir) / "mount", OSError(errno.ENODEV, "gone"))
+
+        with patch.object(Path, 'is_dir', hung_is_dir):
+            retry_queue.start(Submitted())
+            try:
+                assert probing.wait(timeout=5)
+                adding = threading.Thread(target=retry_queue.add, args=(
+                    source.with_name("Castle.S08E23.mkv"), library_dir,
+                    OSError(errno.ESTALE, "stale")))
+                adding.start()
+                adding.join(timeout=1)
+                assert not adding.is_alive()
+            finally:
+                release.set()
+                retry_queue.shutdown()
+
+    def test_PathIsGone_PathIsDroppedInsteadOfSubmitted(self, source, library_dir):
+        retry_queue = RetryQueue(policies=POLICIES, probe_interval=0.01)
+        retry_queue.add(source, library_dir, OSError(errno.ESTALE, "stale"))
+        source.unlink()
+
+        submitted = Submitted()
+        retry_queue.start(submitted)
+        try:
+            assert not submitted.event.wait(timeout=0.2)
+        finally:
+            retry_queue.shutdown()
+
+        assert source not in retry_queue
+
+    def test_QueueIsSavedAndLoaded(self, tmpdir, source, library_dir):
+        queue_file = Path(tmpdir) / "retry-queue.json"
+        retry_queue = RetryQueue(queue_file, policies=POLICIES)
+        retry_queue.add(source, library_dir, OSError(errno.EEXIST, "error"))
+
+        loaded = RetryQueue(queue_file, policies=POLICIES)
+        loaded.load()
+
+        assert loaded.get(source) == retry_queue.get(source)
+
+    def test_DiscardedPathIsRemovedFromTheQueueFile(self, tmpdir, source, library_dir):
+        queue_file = Path(tmpdir) / "retry-queue.json"
+        retry_queue = RetryQueue(queue_file, policies=POLICIES)
+        retry_queue.add(source, library_dir, OSError(errno.EEXIST, "error"))
+
+        retry_queue.discard(source)
+        loaded = RetryQueue(queue_file, policies=POLICIES)
+        loaded.load()
+
+        assert len(loaded) == 0
+
+    def test_CorruptedQueueFile_IsDiscarded(self, tmpdir):
+        queue_file = Path(tmpdir) / "retry-queue.json"
+        queue_file.write_text("{not json")
+        retry_queue = RetryQueue(queue_file, policies=POLICIES)
+
+        retry_queue.load()
+
+        assert len(retry_queue) == 0
+
+    @pytest.mark.parametrize('attempts', range(6))
+    def test_DelayIsExponentialWithJitterUpToTheMaximum(self, attempts):
+        policy = RetryPolicy(0, 10, 100)
+        delay = min(100, 10 * 2 ** attempts)
+
+        assert delay / 2 <= RetryQueue.delay(policy, attempts) <= delay
+
+    def test_InvalidPolicy_RaisesValueError(self):
+        with pytest.raises(ValueError):
+            RetryQueue(policies={'other': RetryPolicy(1, 60, 10)})
@@ -0,0 +1,88 @@
+from pathlib import Path
+from time import sleep
+from unittest.mock import MagicMock
+
+from tveebot_organizer.settler import Settler, signature
+
+
+class TestSignature:
+
+    def test_NonExistingPathHasNoSignature(self, tmpdir):
+        assert signature(Path(tmpdir.join("missing"))) is None
+
+    def test_SignatureChangesWhenAFileInsideADirectoryGrows(self, tmpdir):
+        release_dir = tmpdir.mkdir("release").mkdir("nested")
+        episode_file = release_dir.join("episode.mkv")
+        episode_file.write("a")
+        before = signature(Path(tmpdir.join("release")))
+
+        episode_file.write("more data")
+
+        assert signature(Path(tmpdir.join("release"))) != before
+
+    def test_SignatureIsTheSameWhenNothingChanges(self, tmpdir):
+        tmpdir.join("episode.mkv").write("data")
+
+        assert signature(Path(tmpdir)) == signature(Path(tmpdir))
+
+
+class TestSettler:
+
+    def test_PathIsDispatchedOnceItStopsChanging(self, tmpdir):
+        path = tmpdir.join("episode.mkv")
+        path.write("")
+        dispatch = MagicMock()
+        settler = Settler(dispatch, quiet_period=0.2, poll_interval=0.05)
+        settler.start()
+
+        settler.touch(Path(path))
+        sleep(0.6)
+        settler.stop()
+
+        dispatch.assert_called_once_with(Path(path))
+
+    def test_PathIsNotDispatchedWhileItKeepsChanging(self, tmpdir):
+        path = tmpdir.join("episode.mkv")
+        dispatch = MagicMock()
+        settler = Settler(dispatch, quiet_period=0.5, poll_interval=0.05)
+        settler.start()
+
+        settler.touch(Path(path))
+        for index in range(8):
+            path.write("x" * index)
+            sleep(0.1)
+        dispatch.assert_not_called()
+
+        sleep(1)
+        settler.stop()
+
+        dispatch.assert_called_once_with(Path(path))
+
+    def test_TouchingAPathMultipleTimesDispatchesItOnce(self, tmpdir):
+        path = tmpdir.join("episode.mkv")
+        path.write("")
+        dispatch = MagicMock()
+        settler = Settler(dispatch, quiet_period=0.2, poll_interval=0.05)
+        settler.start()
+
+        for _ in range(5):
+            settler.touch(Path(path))
+        sleep(0.6)
+        settler.stop()
+
+        dispatch.assert_called_once_with(Path(path))
+
+    def test_PathRemovedBeforeSettlingIsNotDispatched(self, tmpdir):
+        path = tmpdir.join("episode.mkv")
+        path.write("")
+        dispatch = MagicMock()
+        settler = Settler(dispatch, quiet_period=0.3, poll_interval=0.05)
+        settler.start()
+
+        settler.touch(Path(path))
+        path.remove()
+        sleep(0.6)
+        settler.stop()
+
+        dispatch.assert_not_called()
+        assert settler.pending == 0
@@ -0,0 +1,135 @@
+import os
+import time
+from pathlib import Path
+from queue import Empty
+from typing import List
+from unittest.mock import patch
+
+from watchdog.events import (DirCreatedEvent, FileCreatedEvent, FileDeletedEvent,
+                             FileMovedEvent)
+from watchdog.observers.api import EventQueue, ObservedWatch
+
+from tveebot_organizer import snapshot_observer
+from tveebot_organizer.snapshot_observer import SnapshotEmitter
+from tveebot_organizer.tests.test_watcher import watching
+
+
+class Watch:
+    """ Watches *path* with a snapshot emitter, collecting its events on each scan """
+
+    def __init__(self, path, recursive: bool = False):
+        self.queue = EventQueue()
+        self.emitter = SnapshotEmitter(self.queue, ObservedWatch(str(path), recursive=recursive))
+
+    def events(self) -> List:
+        self.emitter.scan()
+        queued = []
+        while True:
+            try:
+                event, _ = self.queue.get_nowait()
+            except Empty:
+                return queued
+            queued.append(event)
+
+
+class TestSnapshotEmitter:
+
+    def test_FileCreatedInWatchDirEmitsCreatedEvent(self, tmpdir):
+        watch = Watch(tmpdir)
+        tmpdir.join("file.mkv").write("")
+
+        assert FileCreatedEvent(str(tmpdir.join("file.mkv"))) in watch.events()
+
+    def test_DirectoryCreatedInWatchDirEmitsCreatedEvent(self, tmpdir):
+        watch = Watch(tmpdir)
+        tmpdir.mkdir("dir")
+
+        assert DirCreatedEvent(str(tmpdir.join("dir"))) in watch.events()
+
+    def test_ExistingFilesDoNotEmitEvents(self, tmpdir):
+        tmpdir.join("file.mkv").write("")
+        watch = Watch(tmpdir)
+
+        assert watch.events() == []
+
+    def test_FileRenamedEmitsMovedEvent(self, tmpdir):
+        tmpdir.join(".file.mkv.part").write("")
+        watch = Watch(tmpdir)
+        tmpdir.join(".file.mkv.part").rename(tmpdir.join("file.mkv"))
+
+        assert FileMovedEvent(str(tmpdir.join(".file.mkv.part")),
+                              str(tmpdir.join("file.mkv"))) in watch.events()
+
+    def test_FileRemovedEmitsDeletedEvent(self, tmpdir):
+        tmpdir.join("file.mkv").write("")
+        watch = Watch(tmpdir)
+        tmpdir.join("file.mkv").remove()
+
+        assert FileDeletedEvent(str(tmpdir.join("file.mkv"))) in watch.events()
+
+    def test_FileCreatedInNewSubDirectoryIsEmittedWhenRecursive(self, tmpdir):
+        watch = Watch(tmpdir, recursive=True)
+        release_dir = tmpdir.mkdir("release")
+        watch.events()
+
+        release_dir.join("episode.mkv").write("")
+
+        assert FileCreatedEvent(str(release_dir.join("episode.mkv"))) in watch.events()
+
+    def test_UnchangedDirectoriesAreNotListedAgain(self, tmpdir):
+        for index in range(10):
+            tmpdir.mkdir(f"dir{index}").join("file.mkv").write("")
+
+        # Make every directory old enough not to be considered racy
+        old = os.stat(str(tmpdir)).st_mtime - 60
+        for path in [tmpdir] + tmpdir.listdir():
+            os.utime(str(path), (old, old))
+        watch = Watch(tmpdir, recursive=True)
+
+        with patch.object(snapshot_observer.os, 'scandir', wraps=os.scandir) as scandir_mock:
+            tmpdir.join("dir3").join("new.mkv").write("")
+            assert FileCreatedEvent(str(tmpdir.join("dir3", "new.mkv"))) in watch.events()
+
+        scandir_mock.assert_called_once_with(str(tmpdir.join("dir3")))
+
+    def test_RacyDirectoryIsListedAgainOnlyOnceItsTickIsOver(self, tmpdir):
+        # The clock of the server is an hour behind the local clock
+        behind = os.stat(str(tmpdir)).st_mtime - 3600
+        tmpdir.join("old.mkv").write("")
+        os.utime(str(tmpdir.join("old.mkv")), (behind, behind))
+        os.utime(str(tmpdir), (behind, behind))
+        watch = Watch(tmpdir)
+
+        # Created in the tick of the listing, which leaves the modification time unchanged
+        tmpdir.join("new.mkv").write("")
+        os.utime(str(tmpdir.join("new.mkv")), (behind, behind))
+        os.utime(str(tmpdir), (behind, behind))
+        assert watch.events() == []
+
+        tick_over = time.monotonic_ns() + snapshot_observer.RACY_WINDOW_NS
+        with patch.object(snapshot_observer.time, 'monotonic_ns', return_value=tick_over):
+            assert FileCreatedEvent(str(tmpdir.join("new.mkv"))) in watch.events()
+
+            with patch.object(snapshot_observer.os, 'scandir') as scandir_mock:
+                assert watch.events() == []
+            scandir_mock.assert_not_called()
+
+
+class TestWatcherScanning:
+
+    def test_OrganizerIsCalledWhenAFileIsCreated(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+
+        with watching(Path(watch_dir), scan_interval=0.1) as (_, organizer_mock):
+            watch_dir.join("file.txt").write("")
+
+        organizer_mock.organize.assert_called_once_with(Path(watch_dir) / "file.txt")
+
+    def test_OrganizerIsCalledOnceWithTopLevelDirectoryAfterItsContentSettles(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+
+        with watching(Path(watch_dir), settle_time=0.3, scan_interval=0.1) as (_, organizer_mock):
+            release_dir = watch_dir.mkdir("release")
+            release_dir.mkdir("video").join("episode.mkv").write("x")
+
+        organizer_mock.organize.assert_called_once_with(Path(watch_dir) / "release")
@@ -0,0 +1,77 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from tveebot_organizer import sniffer as sniffer_module
+from tveebot_organizer.sniffer import Sniffer, sniff
+
+
+def ebml_header(doc_type: bytes) -> bytes:
+    """ Returns the EBML header of a Matroska file with the document type *doc_type* """
+    elements = b'\x42\x86\x81\x01\x42\xf7\x81\x01\x42\x82' + bytes([0x80 | len(doc_type)]) + \
+        doc_type + b'\x42\x87\x81\x04\x42\x85\x81\x02'
+    return b'\x1a\x45\xdf\xa3' + bytes([0x80 | len(elements)]) + elements
+
+
+MATROSKA_HEADER = ebml_header(b'matroska')
+
+
+class TestSniff:
+
+    @pytest.mark.parametrize("header, container", [
+        (MATROSKA_HEADER, 'matroska'),
+        (ebml_header(b'webm'), 'matroska'),
+        (ebml_header(b'other'), None),
+        (b'\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\xf7\x81', None),
+        (b'\x00\x00\x00\x18ftypmp42\x00\x00', 'mp4'),
+        (b'\x00\x00\x00\x20ftypisom\x00\x00', 'mp4'),
+        (b'\x00\x00\x00\x20ftypM4A \x00\x00', None),
+        (b'\x00\x00\x00\x20ftypM4B \x00\x00', None),
+        (b'\x00\x00\x00\x18ftypheic\x00\x00', None),
+        (b'\x00\x00\x00\x14ftyp3gp4\x00\x00', None),
+        (b'RIFF\x24\x10\x00\x00AVI LIST', 'avi'),
+        (b'RIFF\x24\x10\x00\x00WAVEfmt ', None),
+        (b'Rar!\x1a\x07\x01\x00', None),
+        (b'', None),
+    ])
+    def test_ContainerIsToldFromTheFirstBytes(self, tmpdir, header, container):
+        path = tmpdir.join("file")
+        path.write_binary(header)
+
+        assert sniff(Path(path)) == container
+
+
+class TestSniffer:
+
+    @pytest.fixture
+    def sniffed(self, monkeypatch):
+        sniffed = []
+        original = sniffer_module.sniff
+        monkeypatch.setattr(sniffer_module, 'sniff',
+                            lambda path: sniffed.append(path) or original(path))
+        return sniffed
+
+    def test_UnchangedFileIsSniffedOnce(self, tmpdir, sniffed):
+        path = Path(tmpdir.join("episode"))
+        path.write_bytes(MATROSKA_HEADER)
+        sniffer = Sniffer()
+
+        assert sniffer.container(path) == 'matroska'
+        assert sniffer.container(path) == 'matroska'
+        assert sniffed == [path]
+
+    def test_ModifiedFileIsSniffedAgain(self, tmpdir, sniffed):
+        path = Path(tmpdir.join("episode"))
+        path.write_bytes(b'')
+        sniffer = Sniffer()
+        assert sniffer.container(path) is None
+
+        path.write_bytes(MATROSKA_HEADER)
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+
+        assert sniffer.container(path) == 'matroska'
+        assert len(sniffed) == 2
+
+    def test_MissingFileIsNotAVideoFile(self, tmpdir):
+        assert Sniffer().container(Path(tmpdir.join("missing"))) is None
@@ -1,8 +1,12 @@
+import os
 from pathlib import Path
 
 import pytest
 
 from tveebot_organizer.dataclasses import TVShow, Episode
+from tveebot_organizer.io_scheduler import IOScheduler, device_name
+from tveebot_organizer.library_index import LibraryIndex
+from tveebot_organizer.metrics import Metrics
 from tveebot_organizer.storage_manager import StorageManager, EpisodeExists
 
 
@@ -105,3 +109,274 @@ class TestStorageManagerStore:
             storage_manager.store(self.EPISODE, episode_file)
 
         assert episode_file.exists()
+
+
+    def test_HardlinkMode_FileIsLinkedAndKeptInWatchDir(self, storage_dir, episode_file):
+        storage_manager = StorageManager(Path(storage_dir), mode='hardlink')
+
+        storage_manager.store(self.EPISODE, episode_file)
+
+        stored_file = Path(storage_dir) / "Prison Break" / "Season 05" / episode_file.name
+        assert episode_file.exists()
+        assert os.path.samefile(episode_file, stored_file)
+        assert storage_manager.keeps_source
+
+    def test_InvalidMode_RaisesValueError(self, storage_dir):
+        with pytest.raises(ValueError):
+            StorageManager(Path(storage_dir), mode='symlink')
+
+
+class TestStorageManagerStoreWithIndex:
+
+    @pytest.fixture
+    def storage_dir(self, tmpdir):
+        return tmpdir.mkdir("STORAGE_DIR")
+
+    @pytest.fixture
+    def episode_file(self, tmpdir) -> Path:
+        episode_file = tmpdir.mkdir("WATCH_DIR").join("Prison.Break.S05E09.PROPER.mkv")
+        episode_file.write("")
+        return Path(episode_file)
+
+    EPISODE = Episode(TVShow("Prison Break"), season=5, number=9)
+
+    def test_EpisodeIsAddedToTheIndexOnceStored(self, storage_dir, episode_file):
+        index = LibraryIndex(Path(storage_dir))
+        storage_manager = StorageManager(Path(storage_dir), index)
+
+        storage_manager.store(self.EPISODE, episode_file)
+
+        assert index.get(self.EPISODE) == \
+            Path(storage_dir) / "Prison Break" / "Season 05" / "Prison.Break.S05E09.PROPER.mkv"
+
+    def test_IndexIncludesEpisodeWithTheSameName_RaisesEpisodeExistsWithoutCreatingDirectories(
+            self, storage_dir, episode_file):
+        index = LibraryIndex(Path(storage_dir))
+        index.add(self.EPISODE, Path(storage_dir) / "Prison Break" / "Season 05" /
+                  episode_file.name)
+        storage_manager = StorageManager(Path(storage_dir), index)
+
+        with pytest.raises(EpisodeExists):
+            storage_manager.store(self.EPISODE, episode_file)
+
+        assert episode_file.exists()
+        assert not (storage_dir / "Prison Break").exists()
+
+    def test_IndexIncludesEpisodeWithOtherName_KeepPolicyStoresBothFiles(self, storage_dir,
+                                                                        episode_file):
+        season_dir = storage_dir.mkdir("Prison Break").mkdir("Season 05")
+        season_dir.join("Prison.Break.S05E09.mkv").write("other release")
+        index = LibraryIndex(Path(storage_dir))
+        index.scan()
+        storage_manager = StorageManager(Path(storage_dir), index, duplicates='keep')
+
+        storage_manager.store(self.EPISODE, episode_file)
+
+        assert sorted(path.basename for path in season_dir.listdir()) == \
+            ["Prison.Break.S05E09.PROPER.mkv", "Prison.Break.S05E09.mkv"]
+        assert index.get(self.EPISODE) == Path(season_dir) / "Prison.Break.S05E09.mkv"
+
+    def test_DestinationExistsButIsNotIndexed_EpisodeIsIndexedAtTheDestination(
+            self, storage_dir, episode_file):
+        destination = storage_dir.mkdir("Prison Break").mkdir("Season 05") \
+            .join(episode_file.name)
+        destination.write("")
+        index = LibraryIndex(Path(storage_dir))
+        storage_manager = StorageManager(Path(storage_dir), index)
+
+        with pytest.raises(EpisodeExists):
+            storage_manager.store(self.EPISODE, episode_file)
+
+        assert index.get(self.EPISODE) == Path(destination)
+
+    def test_StoreFails_EpisodeIsRemovedFromTheIndex(self, tmpdir, episode_file):
+        storage_dir = tmpdir.join("STORAGE")
+        index = LibraryIndex(Path(storage_dir))
+        storage_manager = StorageManager(Path(storage_dir), index)
+
+        with pytest.raises(FileNotFoundError):
+            storage_manager.store(self.EPISODE, episode_file)
+
+        assert self.EPISODE not in index
+
+
+class TestStorageManagerStoreBatch:
+
+    @pytest.fixture
+    def storage_dir(self, tmpdir):
+        return tmpdir.mkdir("STORAGE_DIR")
+
+    @pytest.fixture
+    def pack_dir(self, tmpdir):
+        pack_dir = tmpdir.mkdir("WATCH_DIR").mkdir("Prison.Break.S05.720p")
+        for number in range(1, 5):
+            pack_dir.join(f"Prison.Break.S05E0{number}.mkv").write("")
+        return pack_dir
+
+    @staticmethod
+    def batch(pack_dir):
+        return [(Episode(TVShow("Prison Break"), season=5, number=number),
+                 Path(pack_dir.join(f"Prison.Break.S05E0{number}.mkv")))
+                for number in range(1, 5)]
+
+    def test_EveryEpisodeIsStoredInItsSeasonDirectory(self, storage_dir, pack_dir):
+        storage_manager = StorageManager(Path(storage_dir))
+
+        errors = storage_manager.store_batch(self.batch(pack_dir))
+
+        assert errors == [None] * 4
+        assert len(storage_dir.join("Prison Break", "Season 05").listdir()) == 4
+        assert pack_dir.listdir() == []
+
+    def test_OneEpisodeAlreadyInTheLibrary_OnlyThatEpisodeFails(self, storage_dir, pack_dir):
+        index = LibraryIndex(Path(storage_dir))
+        index.add(Episode(TVShow("Prison Break"), season=5, number=2),
+                  Path(storage_dir) / "Prison Break" / "Season 05" / "Prison.Break.S05E02.mkv")
+        storage_manager = StorageManager(Path(storage_dir), index)
+
+        errors = storage_manager.store_batch(self.batch(pack_dir))
+
+        assert errors[0] is None and errors[2] is None and errors[3] is None
+        assert isinstance(errors[1], EpisodeExists)
+        assert [path.basename for path in pack_dir.listdir()] == ["Prison.Break.S05E02.mkv"]
+
+    def test_LibraryDirectoryDoesNotExist_EveryEpisodeFailsWithoutCreatingIt(self, tmpdir,
+                                                                            pack_dir):
+        storage_manager = StorageManager(Path(tmpdir.join("STORAGE")))
+
+        errors = storage_manager.store_batch(self.batch(pack_dir))
+
+        assert all(isinstance(error, FileNotFoundError) for error in errors)
+        assert not tmpdir.join("STORAGE").exists()
+
+
+class TestStorageManagerDuplicates:
+
+    @pytest.fixture
+    def season_dir(self, tmpdir):
+        season_dir = tmpdir.mkdir("STORAGE_DIR").mkdir("Prison Break").mkdir("Season 05")
+        season_dir.join("Prison.Break.S05E09.720p.GRP.mkv").write("content")
+        return season_dir
+
+    @pytest.fixture
+    def episode_file(self, tmpdir) -> Path:
+        episode_file = tmpdir.mkdir("WATCH_DIR").join("Prison.Break.S05E09.720p.OTHER.mkv")
+        episode_file.write("content")
+        return Path(episode_file)
+
+    EPISODE = Episode(TVShow("Prison Break"), season=5, number=9)
+
+    def storage_manager(self, season_dir, duplicates: str) -> StorageManager:
+        return StorageManager(Path(season_dir.dirpath().dirpath()), duplicates=duplicates)
+
+    def test_SkipPolicy_FileWithSameContentRaisesEpisodeExistsAndKeepsFile(
+            self, season_dir, episode_file):
+        storage_manager = self.storage_manager(season_dir, 'skip')
+
+        with pytest.raises(EpisodeExists):
+            storage_manager.store(self.EPISODE, episode_file)
+
+        assert episode_file.exists()
+        assert storage_manager.includes(self.EPISODE, episode_file)
+        assert len(season_dir.listdir()) == 1
+
+    def test_ReplacePolicy_FileWithSameContentIsReplaced(self, season_dir, episode_file):
+        storage_manager = self.storage_manager(season_dir, 'replace')
+
+        storage_manager.store(self.EPISODE, episode_file)
+
+        assert [path.basename for path in season_dir.listdir()] == [episode_file.name]
+
+    def test_KeepPolicy_BothFilesAreStored(self, season_dir, episode_file):
+        storage_manager = self.storage_manager(season_dir, 'keep')
+
+        storage_manager.store(self.EPISODE, episode_file)
+
+        assert len(season_dir.listdir()) == 2
+
+    def test_FileWithSameSizeButOtherContentIsNotADuplicate(self, season_dir, episode_file):
+        episode_file.write_text("CONTENT")
+        storage_manager = self.storage_manager(season_dir, 'skip')
+
+        storage_manager.store(self.EPISODE, episode_file)
+
+        assert len(season_dir.listdir()) == 2
+
+    def test_IndexedFileWithSameContent_SkipPolicyRaisesEpisodeExists(self, season_dir,
+                                                                      episode_file):
+        index = LibraryIndex(Path(season_dir.dirpath().dirpath()))
+        index.scan()
+        storage_manager = StorageManager(index.library_dir, index, duplicates='skip')
+
+        with pytest.raises(EpisodeExists):
+            storage_manager.store(self.EPISODE, episode_file)
+
+        assert episode_file.exists()
+        assert len(season_dir.listdir()) == 1
+
+    def test_IndexedFileWithSameContent_ReplacePolicyReplacesIt(self, season_dir, episode_file):
+        index = LibraryIndex(Path(season_dir.dirpath().dirpath()))
+        index.scan()
+        storage_manager = StorageManager(index.library_dir, index, duplicates='replace')
+
+        assert not storage_manager.includes(self.EPISODE, episode_file)
+        storage_manager.store(self.EPISODE, episode_file)
+
+        assert [path.basename for path in season_dir.listdir()] == [episode_file.name]
+        assert index.get(self.EPISODE) == Path(season_dir) / episode_file.name
+
+    def test_IndexedFileWithOtherContent_ReplacePolicyStoresBothFiles(self, season_dir,
+                                                                      episode_file):
+        episode_file.write_text("CONTENT")
+        index = LibraryIndex(Path(season_dir.dirpath().dirpath()))
+        index.scan()
+        storage_manager = StorageManager(index.library_dir, index, duplicates='replace')
+
+        storage_manager.store(self.EPISODE, episode_file)
+
+        assert len(season_dir.listdir()) == 2
+
+    def test_InvalidPolicy_RaisesValueError(self, season_dir):
+        with pytest.raises(ValueError):
+            self.storage_manager(season_dir, 'rename')
+
+
+class TestStorageManagerScheduling:
+
+    @pytest.fixture
+    def storage_dir(self, tmpdir):
+        return tmpdir.mkdir("STORAGE_DIR")
+
+    @pytest.fixture
+    def episode_file(self, tmpdir) -> Path:
+        episode_file = tmpdir.mkdir("WATCH_DIR").join("Prison.Break.S05E09.mkv")
+        episode_file.write("content")
+        return Path(episode_file)
+
+    @pytest.fixture
+    def metrics(self) -> Metrics:
+        return Metrics()
+
+    EPISODE = Episode(TVShow("Prison Break"), season=5, number=9)
+
+    def stored_bytes(self, metrics: Metrics, storage_dir) -> float:
+        device = device_name(os.stat(storage_dir).st_dev)
+        return metrics.counter_value('io_bytes_total', device=device, direction='write')
+
+    def test_CopyMode_TransferIsScheduled(self, storage_dir, episode_file, metrics):
+        storage_manager = StorageManager(Path(storage_dir), mode='copy',
+                                         scheduler=IOScheduler(metrics=metrics))
+
+        storage_manager.store(self.EPISODE, episode_file)
+
+        assert self.stored_bytes(metrics, storage_dir) == len("content")
+
+    def test_MoveModeInTheSameDevice_RenameIsNotScheduled(self, storage_dir, episode_file,
+                                                          metrics):
+        storage_manager = StorageManager(Path(storage_dir), mode='move',
+                                         scheduler=IOScheduler(metrics=metrics))
+
+        storage_manager.store(self.EPISODE, episode_file)
+
+        assert storage_dir.join("Prison Break", "Season 05", episode_file.name).check()
+        assert self.stored_bytes(metrics, storage_dir) == 0
@@ -0,0 +1,166 @@
+import errno
+import os
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from tveebot_organizer import transfer
+
+
+@pytest.fixture
+def source(tmpdir) -> Path:
+    source = tmpdir.mkdir("watch").join("episode.mkv")
+    source.write("episode data" * 1000)
+    return Path(source)
+
+
+@pytest.fixture
+def destination(tmpdir) -> Path:
+    return Path(tmpdir.mkdir("library").join("episode.mkv"))
+
+
+@pytest.fixture
+def cross_device(monkeypatch):
+    monkeypatch.setattr(transfer, 'same_device', lambda source, directory: False)
+
+
+class TestMove:
+
+    def test_SameDevice_FileIsMoved(self, source, destination):
+        transfer.move(source, destination)
+
+        assert destination.read_text() == "episode data" * 1000
+        assert not source.exists()
+
+    def test_CrossDevice_FileIsCopiedAndSourceIsRemoved(self, source, destination, cross_device):
+        transfer.move(source, destination)
+
+        assert destination.read_text() == "episode data" * 1000
+        assert not source.exists()
+        assert not transfer.temporary_path(destination).exists()
+
+    def test_CrossDevice_ProgressIsReportedUpToTheFileSize(self, source, destination,
+                                                           cross_device, monkeypatch):
+        monkeypatch.setattr(transfer, 'CHUNK_SIZE', 1000)
+        progress = MagicMock()
+
+        transfer.move(source, destination, progress)
+
+        assert progress.call_count > 1
+        progress.assert_called_with(12000, 12000)
+
+    def test_DestinationExists_RaisesFileExistsErrorAndKeepsBothFiles(self, source, destination):
+        destination.write_text("other episode")
+
+        with pytest.raises(FileExistsError):
+            transfer.move(source, destination)
+
+        assert source.exists()
+        assert destination.read_text() == "other episode"
+
+    def test_DestinationCreatedAfterTheCheck_IsNotReplaced(self, source, destination,
+                                                           monkeypatch):
+        destination.write_text("other episode")
+        monkeypatch.setattr(transfer.os.path, 'lexists', lambda path: False)
+
+        with pytest.raises(FileExistsError):
+            transfer.move(source, destination)
+
+        assert source.exists()
+        assert destination.read_text() == "other episode"
+
+    def test_CrossDevice_CopyFails_KeepsSourceAndLeavesNoPartialFiles(
+            self, source, destination, cross_device, monkeypatch):
+        def failing_copy(*args):
+            raise OSError(errno.ENOSPC, "no space left on device")
+
+        monkeypatch.setattr(transfer, '_copy_file_range', failing_copy)
+
+        with pytest.raises(OSError):
+            transfer.move(source, destination)
+
+        assert source.exists()
+        assert not destination.exists()
+        assert not transfer.temporary_path(destination).exists()
+
+    def test_CrossDevice_ZeroCopyIsNotSupported_FallsBackToRegularCopy(
+            self, source, destination, cross_device, monkeypatch):
+        def unsupported(*args):
+            raise OSError(errno.EXDEV, "cross-device copy is not supported")
+
+        monkeypatch.setattr(transfer, '_copy_file_range', unsupported)
+        monkeypatch.setattr(transfer, '_sendfile', unsupported)
+
+        transfer.move(source, destination)
+
+        assert destination.read_text() == "episode data" * 1000
+        assert os.stat(destination).st_size == 12000
+
+
+class TestStore:
+
+    @pytest.fixture
+    def unsupported_links(self, monkeypatch):
+        def unsupported(*args):
+            raise OSError(errno.EXDEV, "cross-device link")
+
+        monkeypatch.setattr(transfer.os, 'link', unsupported)
+        monkeypatch.setattr(transfer, '_clone', unsupported)
+
+    def test_MoveMode_SourceIsRemoved(self, source, destination):
+        assert transfer.store(source, destination, 'move') == 'move'
+
+        assert destination.read_text() == "episode data" * 1000
+        assert not source.exists()
+
+    def test_HardlinkMode_DestinationIsTheSameFileAndSourceIsKept(self, source, destination):
+        assert transfer.store(source, destination, 'hardlink') == 'hardlink'
+
+        assert source.exists()
+        assert os.path.samefile(source, destination)
+
+    def test_HardlinkMode_LinksAreNotSupported_FallsBackToCopy(self, source, destination,
+                                                               unsupported_links):
+        assert transfer.store(source, destination, 'hardlink') == 'copy'
+
+        assert source.exists()
+        assert destination.read_text() == "episode data" * 1000
+        assert not os.path.samefile(source, destination)
+
+    def test_ReflinkMode_CloneIsNotSupported_FallsBackToCopyWithoutPartialFiles(
+            self, source, destination, unsupported_links):
+        assert transfer.store(source, destination, 'reflink') == 'copy'
+
+        assert destination.read_text() == "episode data" * 1000
+        assert not transfer.temporary_path(destination).exists()
+
+    def test_CopyMode_DestinationIsACopyAndSourceIsKept(self, source, destination):
+        assert transfer.store(source, destination, 'copy') == 'copy'
+
+        assert source.exists()
+        assert destination.read_text() == "episode data" * 1000
+        assert not os.path.samefile(source, destination)
+
+    def test_DestinationExists_RaisesFileExistsError(self, source, destination):
+        destination.write_text("other episode")
+
+        with pytest.raises(FileExistsError):
+            transfer.store(source, destination, 'hardlink')
+
+        assert destination.read_text() == "other episode"
+
+    def test_CopyMode_DestinationCreatedAfterTheCheck_IsNotReplacedAndLeavesNoPartialFiles(
+            self, source, destination, monkeypatch):
+        destination.write_text("other episode")
+        monkeypatch.setattr(transfer.os.path, 'lexists', lambda path: False)
+
+        with pytest.raises(FileExistsError):
+            transfer.store(source, destination, 'copy')
+
+        assert destination.read_text() == "other episode"
+        assert not transfer.temporary_path(destination).exists()
+
+    def test_InvalidMode_RaisesValueError(self, source, destination):
+        with pytest.raises(ValueError):
+            transfer.store(source, destination, 'symlink')
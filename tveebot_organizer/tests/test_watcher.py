@@ -12,9 +12,9 @@ from tveebot_organizer.watcher import Watcher
 
 
 @contextmanager
-def watching(watch_dir: Path):
+def watching(watch_dir: Path, **kwargs):
     organizer_mock = MagicMock()
-    watcher = Watcher(watch_dir, organizer=cast(Organizer, organizer_mock))
+    watcher = Watcher(watch_dir, organizer=cast(Organizer, organizer_mock), **kwargs)
     watcher_thread = Thread(target=watcher.run_forever)
     watcher_thread.start()
 
@@ -109,3 +109,62 @@ class TestWatcher:
             pass
 
         organizer_mock.organize.assert_called_once_with(Path(watch_dir) / "file.txt")
+
+
+class TestWatcherSettling:
+
+    def test_OrganizerIsCalledOnceWithTopLevelDirectoryAfterItsContentSettles(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+
+        with watching(Path(watch_dir), settle_time=0.5) as (_, organizer_mock):
+            release_dir = watch_dir.mkdir("release")
+            episode_file = release_dir.mkdir("video").join("episode.mkv")
+            for index in range(5):
+                episode_file.write("x" * index)
+                sleep(0.1)
+
+            organizer_mock.organize.assert_not_called()
+
+        organizer_mock.organize.assert_called_once_with(Path(watch_dir) / "release")
+
+    def test_ExistingFileIsOrganizedOnceItSettles(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+        watch_dir.join("file.txt").write("")
+
+        with watching(Path(watch_dir), settle_time=0.2) as (_, organizer_mock):
+            pass
+
+        organizer_mock.organize.assert_called_once_with(Path(watch_dir) / "file.txt")
+
+
+class TestWatcherRoutes:
+
+    def test_PathsCreatedInEachWatchDirAreOrganizedByTheOrganizerOfItsRoute(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+        other_watch_dir = tmpdir.mkdir("other")
+        route_organizer_mock = MagicMock()
+
+        with watching(Path(watch_dir)) as (watcher, organizer_mock):
+            watcher.add_route(Path(other_watch_dir), cast(Organizer, route_organizer_mock))
+            watch_dir.join("file1.txt").write("")
+            other_watch_dir.join("file2.txt").write("")
+
+        organizer_mock.organize.assert_called_once_with(Path(watch_dir) / "file1.txt")
+        route_organizer_mock.organize.assert_called_once_with(Path(other_watch_dir) / "file2.txt")
+
+    def test_ExistingFileIsOrganizedWhenRouteIsAdded(self, tmpdir):
+        watch_dir = tmpdir.mkdir("watch")
+        other_watch_dir = tmpdir.mkdir("other")
+        other_watch_dir.join("file.txt").write("")
+        route_organizer_mock = MagicMock()
+
+        with watching(Path(watch_dir)) as (watcher, _):
+            watcher.add_route(Path(other_watch_dir), cast(Organizer, route_organizer_mock))
+
+        route_organizer_mock.organize.assert_called_once_with(Path(other_watch_dir) / "file.txt")
+
+    def test_AddingRouteForWatchedDirectoryRaisesValueError(self, tmpdir):
+        watcher = Watcher(Path(tmpdir), cast(Organizer, MagicMock()))
+
+        with raises(ValueError):
+            watcher.add_route(Path(tmpdir), cast(Organizer, MagicMock()))
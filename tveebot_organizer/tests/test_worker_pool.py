@@ -0,0 +1,145 @@
+import threading
+from pathlib import Path
+from typing import cast
+from unittest.mock import MagicMock
+
+from pytest import raises
+
+from tveebot_organizer.organizer import Organizer
+from tveebot_organizer.worker_pool import WorkerPool
+
+
+class TestWorkerPool:
+
+    def test_AllSubmittedPathsAreOrganizedBeforeWorkersExit(self):
+        organizer_mock = MagicMock()
+        pool = WorkerPool(cast(Organizer, organizer_mock), workers=3)
+        pool.start()
+
+        for index in range(20):
+            pool.submit(Path(f"file{index}.mkv"))
+        pool.shutdown()
+
+        assert pool.join(timeout=5)
+        assert organizer_mock.organize.call_count == 20
+
+    def test_PathsAreOrganizedConcurrently(self):
+        # Each organize call blocks until two calls are running at the same time
+        barrier = threading.Barrier(2, timeout=5)
+        organizer_mock = MagicMock()
+        organizer_mock.organize.side_effect = lambda path: barrier.wait()
+        pool = WorkerPool(cast(Organizer, organizer_mock), workers=2)
+        pool.start()
+
+        pool.submit(Path("file1.mkv"))
+        pool.submit(Path("file2.mkv"))
+        pool.shutdown()
+
+        assert pool.join(timeout=5)
+        assert not barrier.broken
+
+    def test_WorkerKeepsRunningAfterOrganizeRaisesAnError(self):
+        organizer_mock = MagicMock()
+        organizer_mock.organize.side_effect = [ValueError("bad path"), None]
+        pool = WorkerPool(cast(Organizer, organizer_mock), workers=1)
+        pool.start()
+
+        pool.submit(Path("file1.mkv"))
+        pool.submit(Path("file2.mkv"))
+        pool.shutdown()
+
+        assert pool.join(timeout=5)
+        assert organizer_mock.organize.call_count == 2
+
+    def test_LessThanOneWorkerRaisesValueError(self):
+        with raises(ValueError):
+            WorkerPool(cast(Organizer, MagicMock()), workers=0)
+
+    def test_PathSubmittedWhileAlreadyPendingIsOrganizedOnce(self):
+        release = threading.Event()
+        organizer_mock = MagicMock()
+        organizer_mock.organize.side_effect = lambda path: release.wait(5)
+        pool = WorkerPool(cast(Organizer, organizer_mock), workers=2)
+        pool.start()
+
+        assert pool.submit(Path("file.mkv"))
+        assert not pool.submit(Path("file.mkv"))
+        release.set()
+        pool.shutdown()
+
+        assert pool.join(timeout=5)
+        organizer_mock.organize.assert_called_once_with(Path("file.mkv"))
+
+    def test_PathCanBeSubmittedAgainOnceOrganized(self):
+        organizer_mock = MagicMock()
+        pool = WorkerPool(cast(Organizer, organizer_mock), workers=1)
+        pool.start()
+
+        pool.submit(Path("file.mkv"))
+        pool._queue.join()
+        pool.submit(Path("file.mkv"))
+        pool.shutdown()
+
+        assert pool.join(timeout=5)
+        assert organizer_mock.organize.call_count == 2
+
+    def test_PathIsOrganizedByTheOrganizerItWasSubmittedWith(self):
+        default_organizer_mock = MagicMock()
+        route_organizer_mock = MagicMock()
+        pool = WorkerPool(cast(Organizer, default_organizer_mock), workers=1)
+        pool.start()
+
+        pool.submit(Path("file1.mkv"))
+        pool.submit(Path("file2.mkv"), cast(Organizer, route_organizer_mock))
+        pool.shutdown()
+
+        assert pool.join(timeout=5)
+        default_organizer_mock.organize.assert_called_once_with(Path("file1.mkv"))
+        route_organizer_mock.organize.assert_called_once_with(Path("file2.mkv"))
+
+    def test_PausedPoolOrganizesQueuedPathsOnceResumed(self):
+        organizer_mock = MagicMock()
+        pool = WorkerPool(cast(Organizer, organizer_mock), workers=2)
+        pool.pause()
+        pool.start()
+
+        pool.submit(Path("file1.mkv"))
+        pool.submit(Path("file2.mkv"))
+        threading.Event().wait(0.2)
+        assert organizer_mock.organize.call_count == 0
+        assert pool.queue_depth == 2
+
+        pool.resume()
+        pool.shutdown()
+
+        assert pool.join(timeout=5)
+        assert organizer_mock.organize.call_count == 2
+
+    def test_ShutdownWhilePausedDropsQueuedPaths(self):
+        organizer_mock = MagicMock()
+        pool = WorkerPool(cast(Organizer, organizer_mock), workers=2)
+        pool.pause()
+        pool.start()
+
+        pool.submit(Path("file1.mkv"))
+        pool.shutdown()
+
+        assert pool.join(timeout=5)
+        organizer_mock.organize.assert_not_called()
+
+    def test_InFlightListsThePathsBeingOrganized(self):
+        organizing = threading.Event()
+        release = threading.Event()
+        organizer_mock = MagicMock()
+        organizer_mock.organize.side_effect = lambda path: organizing.set() or release.wait(5)
+        pool = WorkerPool(cast(Organizer, organizer_mock), workers=1)
+        pool.start()
+
+        pool.submit(Path("file1.mkv"))
+        assert organizing.wait(5)
+        assert pool.in_flight == [Path("file1.mkv")]
+
+        release.set()
+        pool.shutdown()
+        assert pool.join(timeout=5)
+        assert pool.in_flight == []
@@ -0,0 +1,269 @@
+"""
+Transfer engine used to move episode files into the library.
+
+Within the same device, files are moved with a single rename. Across devices, the data is copied
+inside the kernel, using *copy_file_range()* or *sendfile()*, to a temporary file next to the
+destination. The temporary file is only renamed to the destination once the copy completes, which
+means the destination never holds a partial file.
+
+Renames never replace an existing destination, even one created by another thread or process
+right before: the file is hard linked to the destination, which fails if it exists, and then
+unlinked from its old path.
+
+Files may also be stored while keeping the source in place, for instance, so that a torrent keeps
+seeding. In that case, the file is hard linked to the library, when both are in the same device,
+or cloned, on filesystems supporting copy-on-write, such as Btrfs and XFS. Both only touch
+metadata. Otherwise, the file is copied.
+"""
+import errno
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger('transfer')
+
+# Called with the number of bytes transferred so far and the total number of bytes
+ProgressCallback = Callable[[int, int], None]
+
+# Number of bytes copied with each system call
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# Errors indicating a zero-copy system call is not supported for a pair of files
+_UNSUPPORTED_ERRORS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+# Errors indicating a file can not be hard linked or cloned to some destination
+_UNSUPPORTED_LINK_ERRORS = _UNSUPPORTED_ERRORS | {errno.EPERM, errno.EMLINK, errno.ENOTTY}
+
+# Request of the *ioctl()* making a file share the data blocks of another (Linux)
+FICLONE = 0x40049409
+
+# Modes of storing a file. Except for 'move', every mode keeps the source file in place and falls
+# back to the following modes when it is not supported for the source and destination.
+MODES = ('move', 'hardlink', 'reflink', 'copy')
+
+
+def temporary_path(destination: Path) -> Path:
+    """ Returns the path of the temporary file used while copying to *destination* """
+    return destination.with_name(f".{destination.name}.part")
+
+
+def same_device(source: Path, directory: Path) -> bool:
+    """ Determines whether *source* and *directory* are in the same device """
+    return os.stat(source).st_dev == os.stat(directory).st_dev
+
+
+def move(source: Path, destination: Path, progress: ProgressCallback = None):
+    """
+    Moves the file in *source* to *destination*.
+
+    The destination directory must already exist. If *source* and *destination* are in the same
+    device, then the file is renamed. Otherwise, the file is copied to a temporary file and then
+    renamed to *destination*. Only then the *source* file is removed.
+
+    :param source:            path to the file to be moved
+    :param destination:       path where the file is moved to
+    :param progress:          optional callback reporting the number of bytes transferred
+    :raise FileExistsError:   if *destination* already exists
+    :raise OSError:           if some error occurs while moving the file
+    """
+    if os.path.lexists(destination):
+        raise FileExistsError(errno.EEXIST, "destination already exists", str(destination))
+
+    size = os.stat(source).st_size
+
+    if same_device(source, destination.parent):
+        _rename_no_replace(source, destination)
+    else:
+        copy(source, destination, progress)
+        os.unlink(source)
+
+    if progress is not None:
+        progress(size, size)
+
+
+def store(source: Path, destination: Path, mode: str = 'move',
+          progress: ProgressCallback = None) -> str:
+    """
+    Stores the file in *source* to *destination*, according to *mode*. See *MODES*.
+
+    :param source:          path to the file to be stored
+    :param destination:     path where the file is stored to
+    :param mode:            how the file is stored
+    :param progress:        optional callback reporting the number of bytes transferred
+    :return: the mode actually used to store the file
+    :raise ValueError:      if *mode* is not valid
+    :raise FileExistsError: if *destination* already exists
+    :raise OSError:         if some error occurs while storing the file
+    """
+    if mode not in MODES:
+        raise ValueError(f"invalid store mode '{mode}': must be one of {', '.join(MODES)}")
+
+    if mode == 'move':
+        move(source, destination, progress)
+        return mode
+
+    if os.path.lexists(destination):
+        raise FileExistsError(errno.EEXIST, "destination already exists", str(destination))
+
+    size = os.stat(source).st_size
+
+    for fallback in MODES[MODES.index(mode):]:
+        try:
+            if fallback == 'hardlink':
+                os.link(source, destination)
+            elif fallback == 'reflink':
+                reflink(source, destination)
+            else:
+                copy(source, destination, progress)
+        except OSError as error:
+            if fallback == 'copy' or error.errno not in _UNSUPPORTED_LINK_ERRORS:
+                raise
+
+            logger.debug(f"{fallback} is not supported: falling back")
+            continue
+
+        if progress is not None:
+            progress(size, size)
+
+        return fallback
+
+
+def reflink(source: Path, destination: Path):
+    """
+    Clones the file in *source* to *destination*. The clone shares the data blocks of *source*
+    until either of them is modified. As with *copy()*, the destination is either the complete
+    clone or it does not exist.
+
+    :raise FileExistsError: if *destination* already exists
+    :raise OSError:         if cloning is not supported for *source* and *destination*, or if
+                            some other error occurs
+    """
+    _write_through_temporary(source, destination, _clone)
+
+
+def copy(source: Path, destination: Path, progress: ProgressCallback = None):
+    """
+    Copies the file in *source* to *destination*, going through a temporary file. The destination
+    is either the complete copy of *source* or it does not exist.
+
+    :raise FileExistsError: if *destination* already exists
+    :raise OSError:         if some error occurs while copying the file
+    """
+    _write_through_temporary(
+        source, destination,
+        lambda source_fd, destination_fd: _copy_data(source_fd, destination_fd, progress))
+
+
+def _write_through_temporary(source: Path, destination: Path,
+                             write: Callable[[int, int], None]):
+    """
+    Calls *write* to fill a temporary file with the data of *source*, and renames it to
+    *destination* once it is complete. The temporary file is removed if anything fails.
+    """
+    temporary = temporary_path(destination)
+
+    with open(source, 'rb') as source_file:
+        # Any temporary file left behind by a previous copy is overwritten
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            with open(fd, 'wb', closefd=True) as destination_file:
+                write(source_file.fileno(), destination_file.fileno())
+                os.fsync(destination_file.fileno())
+
+            shutil.copystat(source, temporary)
+            _rename_no_replace(temporary, destination)
+        except BaseException:
+            try:
+                os.unlink(temporary)
+            except FileNotFoundError:
+                pass
+            raise
+
+
+def _rename_no_replace(source: Path, destination: Path):
+    """
+    Renames *source* to *destination*, unless *destination* exists, without a window in which a
+    destination created meanwhile would be replaced. Filesystems without hard links fall back to
+    checking the destination right before renaming.
+
+    :raise FileExistsError: if *destination* already exists
+    """
+    try:
+        os.link(source, destination)
+    except OSError as error:
+        if error.errno not in _UNSUPPORTED_LINK_ERRORS:
+            raise
+
+        if os.path.lexists(destination):
+            raise FileExistsError(errno.EEXIST, "destination already exists", str(destination))
+        os.rename(source, destination)
+        return
+
+    os.unlink(source)
+
+
+def _copy_data(source_fd: int, destination_fd: int, progress: Optional[ProgressCallback]):
+    size = os.fstat(source_fd).st_size
+    _advise(source_fd, 'POSIX_FADV_SEQUENTIAL')
+
+    copied = 0
+    for copy_chunk in (_copy_file_range, _sendfile, _read_write):
+        try:
+            while copied < size:
+                count = copy_chunk(source_fd, destination_fd, copied,
+                                   min(CHUNK_SIZE, size - copied))
+                if count == 0:
+                    raise OSError(errno.EIO, "source file was truncated while copying")
+
+                copied += count
+
+                # The copied data will not be read again: keep it from filling the page cache
+                _advise(source_fd, 'POSIX_FADV_DONTNEED', copied - count, count)
+
+                if progress is not None:
+                    progress(copied, size)
+            return
+
+        except OSError as error:
+            if error.errno not in _UNSUPPORTED_ERRORS or copied > 0:
+                raise
+
+            logger.debug(f"{copy_chunk.__name__.strip('_')} is not supported: falling back")
+
+
+def _clone(source_fd: int, destination_fd: int):
+    if fcntl is None:
+        raise OSError(errno.ENOSYS, "cloning files is not available")
+    fcntl.ioctl(destination_fd, FICLONE, source_fd)
+
+
+def _copy_file_range(source_fd: int, destination_fd: int, offset: int, count: int) -> int:
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+    return os.copy_file_range(source_fd, destination_fd, count, offset, offset)
+
+
+def _sendfile(source_fd: int, destination_fd: int, offset: int, count: int) -> int:
+    if not hasattr(os, 'sendfile'):
+        raise OSError(errno.ENOSYS, "sendfile is not available")
+    return os.sendfile(destination_fd, source_fd, offset, count)
+
+
+def _read_write(source_fd: int, destination_fd: int, offset: int, count: int) -> int:
+    data = os.pread(source_fd, count, offset)
+    written = 0
+    while written < len(data):
+        written += os.pwrite(destination_fd, data[written:], offset + written)
+    return len(data)
+
+
+def _advise(fd: int, advice: str, offset: int = 0, length: int = 0):
+    if hasattr(os, 'posix_fadvise') and hasattr(os, advice):
+        os.posix_fadvise(fd, offset, length, getattr(os, advice))
@@ -1,12 +1,18 @@
 import logging
+import os
 import threading
+import time
 from pathlib import Path
+from typing import Dict, List, Optional
 
 from watchdog.events import FileSystemEvent, FileSystemEventHandler
 from watchdog.observers import Observer
 from watchdog.observers.api import ObservedWatch
 
 from tveebot_organizer.organizer import Organizer
+from tveebot_organizer.settler import Settler
+from tveebot_organizer.snapshot_observer import SnapshotObserver
+from tveebot_organizer.worker_pool import WorkerPool
 
 logger = logging.getLogger('watching')
 
@@ -15,69 +21,247 @@ class Watcher:
     """
     The Watcher component watches a directory for new files or directories. It is associated with
     an organizer instance. This organizer is called every time a new file or directory is created.
+
+    The organizer is not called from the thread dispatching the filesystem events. Instead, new
+    paths are submitted to a pool of workers, which organize them concurrently.
+
+    Optionally, new paths may be held back until they settle, that is, until their size and
+    modification time stay the same for a quiet period. In that case, the watcher also follows
+    changes inside the watch directory and coalesces all of them per top-level path.
+
+    On filesystems which do not notify changes, such as NFS or SMB, the watch directory is
+    scanned periodically instead.
+
+    Other watch directories may be added as routes, each with its own organizer. All of them
+    share the same observer and workers.
     """
 
     class Handler(FileSystemEventHandler):
-        """ Invokes the organizer every time a new file or directory is created """
+        """ Submits a path to be organized every time a new file or directory is created """
 
-        def __init__(self, watcher: 'Watcher'):
+        def __init__(self, watcher: 'Watcher', watch_dir: Path):
             self.watcher = watcher
+            self.watch_dir = watch_dir
 
         def on_created(self, event: FileSystemEvent):
-            self.watcher.organizer.organize(Path(event.src_path))
+            self._changed(event.src_path)
+
+        def on_modified(self, event: FileSystemEvent):
+            if self.watcher.settling:
+                self._changed(event.src_path)
+
+        def on_moved(self, event: FileSystemEvent):
+            if self.watcher.settling:
+                self._changed(event.dest_path)
+
+        def _changed(self, path: str):
+            top_level_path = self._top_level_path(Path(path))
+            if top_level_path is not None:
+                self.watcher._new_path(top_level_path)
 
-    def __init__(self, watch_dir: Path, organizer: Organizer):
-        """ Initializes the watching, but does not start it! """
+        def _top_level_path(self, path: Path) -> Optional[Path]:
+            """ Finds the entry of the watch directory including *path* """
+            try:
+                parts = path.relative_to(self.watch_dir).parts
+            except ValueError:
+                return None
+
+            return self.watch_dir / parts[0] if parts else None
+
+    def __init__(self, watch_dir: Path, organizer: Organizer, workers: int = 1,
+                 queue_size: int = 0, settle_time: float = 0, scan_interval: float = 0):
+        """
+        Initializes the watching, but does not start it!
+
+        :param watch_dir:     the directory to watch for new files or directories
+        :param organizer:     the organizer called to organize each new file or directory
+        :param workers:       number of paths which may be organized concurrently
+        :param queue_size:    maximum number of paths waiting to be organized, 0 means unbounded
+        :param settle_time:   time, in seconds, a new path must stay unchanged before it is
+                              organized, 0 means new paths are organized right away
+        :param scan_interval: time, in seconds, between scans of the watch directory, for
+                              filesystems which do not notify changes, such as NFS or SMB, 0
+                              means changes are notified by the filesystem
+        """
         self.organizer = organizer
-        self._observer = Observer()
+        self._pool = WorkerPool(organizer, workers, queue_size)
+        self._settler = Settler(self._submit, settle_time) if settle_time > 0 else None
+        self._observer = SnapshotObserver(scan_interval) if scan_interval > 0 else Observer()
         self._watch_dir = watch_dir
 
-        # Stores the watch for the current watch directory
-        # This watch is used when changing the current watch directory
-        self._last_watch: ObservedWatch = None
+        # Maps each watch directory to the organizer of the paths created in it
+        self._routes: Dict[Path, Organizer] = {watch_dir: organizer}
+
+        # Maps each watch directory to its watch, while running
+        # These watches are used to stop watching a directory when it is changed
+        self._watches: Dict[Path, ObservedWatch] = {}
 
         # Event to indicate the main loop exited
         # Initially the event must be set
         self._exited = threading.Event()
         self._exited.set()
 
+    @property
+    def settling(self) -> bool:
+        """ Indicates whether new paths are held back until they settle """
+        return self._settler is not None
+
+    @property
+    def queue_depth(self) -> int:
+        """ Number of paths waiting to be organized by the workers """
+        return self._pool.queue_depth
+
+    @property
+    def settling_paths(self) -> int:
+        """ Number of paths waiting to settle """
+        return self._settler.pending if self._settler is not None else 0
+
+    @property
+    def in_flight(self) -> List[Path]:
+        """ Paths being organized by the workers """
+        return self._pool.in_flight
+
+    @property
+    def paused(self) -> bool:
+        """ Indicates whether organizing is paused. New paths are still queued meanwhile. """
+        return self._pool.paused
+
+    def pause(self):
+        """ Stops organizing paths, other than the ones being organized, until resumed """
+        self._pool.pause()
+        logger.info("paused organizing")
+
+    def resume(self):
+        """ Organizes the paths queued while paused, and any new path, again """
+        self._pool.resume()
+        logger.info("resumed organizing")
+
+    def organize(self, path: Path) -> bool:
+        """
+        Submits *path* to be organized right away, without waiting for it to settle. The path
+        does not need to be in a watch directory. Paths outside of them are organized by the
+        organizer of the watch directory.
+
+        :return: True if *path* was submitted and False if it was already pending.
+        """
+        return self._submit(path)
+
     @property
     def watch_dir(self) -> Path:
         return self._watch_dir
 
     @watch_dir.setter
     def watch_dir(self, directory: Path):
-        if self._last_watch is not None:
+        if directory != self._watch_dir and directory in self._routes:
+            raise ValueError(f"directory is already watched: {directory}")
+
+        if self._watches:
             # Start watching the new directory
-            watch = self._observer.schedule(Watcher.Handler(self), str(directory))
+            watch = self._schedule(directory)
 
             # Stop watching the previous directory
-            self._observer.unschedule(self._last_watch)
+            self._observer.unschedule(self._watches.pop(self._watch_dir))
 
             # Store the watch of the new directory to stop watching it when the watch directory is
             # changed again
-            self._last_watch = watch
+            self._watches[directory] = watch
 
+            del self._routes[self._watch_dir]
+            self._routes[directory] = self.organizer
             self._watch_dir = directory
 
+            self._organize_existing(directory)
+
+    @property
+    def routes(self) -> Dict[Path, Organizer]:
+        """ Maps each watch directory to the organizer of the paths created in it """
+        return dict(self._routes)
+
+    def add_route(self, watch_dir: Path, organizer: Organizer):
+        """
+        Watches another directory, sharing the observer and the workers with the other watch
+        directories. Paths created in *watch_dir* are organized by *organizer*, which usually
+        stores them in a different library.
+
+        :raise ValueError: if *watch_dir* is already watched
+        :raise OSError:    if the watcher is running and *watch_dir* can not be watched
+        """
+        if watch_dir in self._routes:
+            raise ValueError(f"directory is already watched: {watch_dir}")
+
+        self._routes[watch_dir] = organizer
+        if self._watches:
+            try:
+                self._watches[watch_dir] = self._schedule(watch_dir)
+            except BaseException:
+                del self._routes[watch_dir]
+                raise
+
+            self._organize_existing(watch_dir)
+
     def run_forever(self):
-        """ Runs the watching until the *shutdown()* is called """
+        """
+        Runs the watching until the *shutdown()* is called. Before returning, it waits for every
+        path already submitted to the workers to be organized.
+        """
         self._exited.clear()
+        self._pool.start()
         try:
-            # Try to organize each file inside the watch directory
-            for path in self.watch_dir.iterdir():
-                self.organizer.organize(path)
+            if self._settler is not None:
+                self._settler.start()
 
             self._observer.start()
-            self._last_watch = self._observer.schedule(Watcher.Handler(self), str(self.watch_dir))
+            for watch_dir in list(self._routes):
+                self._watches[watch_dir] = self._schedule(watch_dir)
+
+            # Try to organize each file inside the watch directories
+            # Watching starts before, so that nothing created meanwhile is missed. Paths reported
+            # both by the listing and by an event are organized only once.
+            for watch_dir in list(self._watches):
+                self._organize_existing(watch_dir)
+
+            logger.info(f"ready: watching {len(self._watches)} directories")
             self._observer.join()
             self._observer.unschedule_all()
-            self._last_watch = None
+            self._watches.clear()
         finally:
-            self._exited.set()
+            try:
+                # Paths which did not settle yet are organized the next time the watcher runs
+                if self._settler is not None:
+                    self._settler.stop()
+
+                # Drain the work queue before signaling the exit
+                self._pool.shutdown()
+                self._pool.join()
+            finally:
+                self._exited.set()
+
+    def _schedule(self, directory: Path) -> ObservedWatch:
+        # Changes inside sub-directories are only relevant to tell whether a path settled
+        return self._observer.schedule(Watcher.Handler(self, directory), str(directory),
+                                       recursive=self.settling)
+
+    def _organize_existing(self, watch_dir: Path):
+        with os.scandir(watch_dir) as entries:
+            for entry in entries:
+                self._new_path(Path(entry.path))
+
+    def _new_path(self, path: Path):
+        """ Organizes a new *path* in the watch directory, once it settles if settling is on """
+        if self._settler is not None:
+            self._settler.touch(path)
+        else:
+            self._submit(path)
+
+    def _submit(self, path: Path) -> bool:
+        """ Submits *path* to the workers, to be organized by the organizer of its route """
+        return self._pool.submit(path, self._routes.get(path.parent, self.organizer))
 
     def shutdown(self):
-        """ Tells the loop in *run_forever()* to stop """
+        """
+        Tells the loop in *run_forever()* to stop. Paths already submitted to the workers are
+        still organized before the loop exits.
+        """
         self._observer.stop()
 
     def wait(self, timeout: float = None) -> bool:
@@ -91,5 +275,12 @@ class Watcher:
         This method returns true if and only if the internal flag has been set to true,
         either before the wait call or after the wait starts, so it will always return True
         except if a timeout is given and the operation times out.
+
+        The watcher is only considered to have shut down once all of its workers exited.
         """
-        return self._exited.wait(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._exited.wait(timeout):
+            return False
+
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        return self._pool.join(remaining)
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from pathlib import Path
+from queue import Empty, Queue
+from typing import List, Set
+
+from tveebot_organizer.organizer import Organizer
+
+logger = logging.getLogger('workerPool')
+
+
+class WorkerPool:
+    """
+    The worker pool takes organize operations off the thread that dispatches filesystem events.
+    Paths submitted to the pool are put in a bounded work queue and organized by a fixed number of
+    worker threads, which means that a slow move does not stall every other path behind it.
+
+    A path is organized at most once at a time: submitting a path that is already waiting in the
+    queue, or being organized, has no effect.
+
+    Each path may be submitted with its own organizer, so that a single pool serves watch
+    directories routed to different libraries.
+
+    The pool may be paused, in which case the workers finish the paths they are organizing, but
+    do not start organizing any other path until the pool is resumed.
+    """
+
+    # Put in the queue to tell a worker to exit
+    _STOP = None
+
+    def __init__(self, organizer: Organizer, workers: int = 1, queue_size: int = 0):
+        """
+        Initializes the pool, but does not start the workers!
+
+        :param organizer:  the organizer used to organize submitted paths by default
+        :param workers:    number of worker threads organizing paths concurrently
+        :param queue_size: maximum number of paths waiting to be organized, 0 means unbounded
+        :raise ValueError: if *workers* is smaller than 1
+        """
+        if workers < 1:
+            raise ValueError(f"number of workers must be at least 1, got {workers}")
+
+        self.organizer = organizer
+        self._workers_count = workers
+        self._queue = Queue(maxsize=queue_size)
+        self._workers: List[threading.Thread] = []
+
+        # Paths waiting in the queue or being organized
+        self._pending: Set[Path] = set()
+        # Paths being organized
+        self._in_flight: Set[Path] = set()
+        self._pending_lock = threading.Lock()
+
+        # Cleared while the pool is paused
+        self._resumed = threading.Event()
+        self._resumed.set()
+
+        # Set when the pool is shut down while paused, to drop the paths held by the workers
+        self._dropping = False
+
+    @property
+    def workers(self) -> int:
+        return self._workers_count
+
+    @property
+    def queue_depth(self) -> int:
+        """ Number of paths waiting to be organized, including those held while paused """
+        with self._pending_lock:
+            return len(self._pending) - len(self._in_flight)
+
+    @property
+    def in_flight(self) -> List[Path]:
+        """ Paths being organized by the workers """
+        with self._pending_lock:
+            return sorted(self._in_flight)
+
+    @property
+    def paused(self) -> bool:
+        return not self._resumed.is_set()
+
+    def pause(self):
+        """ Keeps the workers from organizing any other path until *resume()* is called """
+        self._resumed.clear()
+
+    def resume(self):
+        """ Lets the workers organize the paths waiting in the queue again """
+        self._resumed.set()
+
+    def start(self):
+        """ Starts the worker threads """
+        for index in range(self._workers_count):
+            worker = threading.Thread(target=self._work, name=f"organize-worker-{index}",
+                                      daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, path: Path, organizer: Organizer = None) -> bool:
+        """
+        Submits *path* to be organized by one of the workers. Blocks while the queue is full.
+
+        :param path:      the path to organize
+        :param organizer: the organizer used to organize *path*, instead of the pool's organizer
+        :return: True if *path* was submitted and False if it was already pending.
+        """
+        with self._pending_lock:
+            if path in self._pending:
+                return False
+            self._pending.add(path)
+
+        self._queue.put((organizer or self.organizer, path))
+        return True
+
+    def shutdown(self):
+        """
+        Tells the workers to exit once every path submitted so far has been organized. Paths
+        submitted after this call are not guaranteed to be organized.
+
+        If the pool is paused, the workers exit as soon as they finish the paths they are
+        organizing. The paths waiting in the queue are dropped instead.
+        """
+        if self.paused:
+            self._dropping = True
+            self._drop_queued()
+            self._resumed.set()
+
+        for _ in self._workers:
+            self._queue.put(self._STOP)
+
+    def join(self, timeout: float = None) -> bool:
+        """
+        Blocks until all workers exit or until the *timeout* occurs.
+
+        :return: True if all workers exited and False if the timeout occurred.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self._workers:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            worker.join(remaining)
+
+        exited = not any(worker.is_alive() for worker in self._workers)
+        if exited:
+            self._workers.clear()
+
+        return exited
+
+    def _drop_queued(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                return
+
+            if item is not self._STOP:
+                with self._pending_lock:
+                    self._pending.discard(item[1])
+            self._queue.task_done()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                self._queue.task_done()
+                return
+
+            # While paused, each worker holds on to the path it took until the pool is resumed
+            organizer, path = item
+            self._resumed.wait()
+
+            with self._pending_lock:
+                if self._dropping:
+                    self._pending.discard(path)
+                    self._queue.task_done()
+                    continue
+                self._in_flight.add(path)
+            try:
+                organizer.organize(path)
+            except Exception:
+                logger.exception(f"failed to organize '{path}'")
+            finally:
+                with self._pending_lock:
+                    self._pending.discard(path)
+                    self._in_flight.discard(path)
+                self._queue.task_done()